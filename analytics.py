@@ -0,0 +1,464 @@
+"""
+Reports statistics of an exercise log: distributions of typing times and error rates per word, per "Learn Plover"
+lesson and per key, and how they developed over time. Run as "python analytics.py output/log.json" to print a report.
+
+The log is split into chunks that are analyzed in parallel by a pool of processes, each reading its own chunk and
+reducing it to fixed-size aggregates, which are merged at the end. Memory use is thus bounded by the size of a chunk
+and the amount of distinct words, regardless of the size of the log. JSON logs (compressed or not, see
+exercise_history.py) and SQLite logs are supported.
+"""
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date
+from exercise_history import SqliteExerciseLog, is_compressed_log, is_exercise_record, is_list_log, open_log_file, \
+    read_exercise_log
+from exercise_log import ExerciseResult, TupleToJsonObjectConverter
+from learn_plover import learn_plover_lessons, learn_plover_lesson_words
+from pathlib import Path
+from steno_keys import StenoKeys, StenoKeySet
+import argparse
+import json
+import math
+import os
+
+
+# periods that trends over time can be reported by, mapping to the function labeling the period of a date.
+trend_periods = {
+    "day": lambda day: day.isoformat(),
+    "week": lambda day: "{}-W{:02}".format(*day.isocalendar()[:2]),
+    "month": lambda day: day.strftime("%Y-%m"),
+}
+
+_sqlite_magic = b"SQLite format 3\0"
+
+
+class TypingTimeDistribution:
+    """
+    Distribution of typing times in a fixed amount of memory, together with how often words were mistyped. Typing
+    times are counted in buckets a quarter of an octave wide, starting at min_time, so that percentiles are known
+    within 19%. The last bucket also counts all longer typing times.
+    """
+    n_buckets = 64
+    buckets_per_octave = 4
+    min_time = 1 / 64
+
+    def __init__(self):
+        # amount of times a word occurred, and how many of those it was mistyped.
+        self.occurrences = 0
+        self.mistyped = 0
+        # statistics of the typing times of occurrences that were typed correctly.
+        self.counts = array("q", bytes(8 * self.n_buckets))
+        self.count = 0
+        self.total = 0.0
+        self.minimum = math.inf
+        self.maximum = 0.0
+
+    def add(self, is_typed_correctly, typing_time=None):
+        """
+        Counts an occurrence of a word.
+
+        :param is_typed_correctly: whether the word was typed correctly.
+        :param typing_time: the time it took to type the word, or None if it is not known (for the first word of an
+        exercise). Only counted if the word was typed correctly.
+        """
+        self._add(is_typed_correctly, typing_time, self.bucket_of(typing_time))
+
+    @classmethod
+    def bucket_of(cls, typing_time):
+        """
+        :param typing_time: a typing time, or None.
+        :return: the bucket counting the typing time, or None if the typing time is None or not positive.
+        """
+        if typing_time is None or typing_time <= 0:
+            return None
+        bucket = int(math.log2(typing_time / cls.min_time) * cls.buckets_per_octave) + 1
+        return 0 if bucket < 0 else cls.n_buckets - 1 if bucket >= cls.n_buckets else bucket
+
+    def _add(self, is_typed_correctly, typing_time, bucket):
+        """ Counts an occurrence of a word like add, given the bucket of its typing time (see bucket_of), so that it
+        only needs to be computed once for all distributions the occurrence is counted in. """
+        self.occurrences += 1
+        if not is_typed_correctly:
+            self.mistyped += 1
+        elif bucket is not None:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total += typing_time
+            if typing_time < self.minimum:
+                self.minimum = typing_time
+            if typing_time > self.maximum:
+                self.maximum = typing_time
+
+    def merge(self, other):
+        """
+        Adds the counts of another distribution to this one.
+
+        :param other: the other distribution.
+        """
+        self.occurrences += other.occurrences
+        self.mistyped += other.mistyped
+        for bucket, count in enumerate(other.counts):
+            self.counts[bucket] += count
+        self.count += other.count
+        self.total += other.total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+    @property
+    def mean(self):
+        """ The mean typing time, or 0 if no typing times were counted. """
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def error_rate(self):
+        """ The fraction of occurrences that were mistyped, or 0 if there were none. """
+        return self.mistyped / self.occurrences if self.occurrences else 0.0
+
+    def percentile(self, fraction):
+        """
+        :param fraction: the fraction of typing times, between 0 and 1.
+        :return: an upper bound of the typing time that the given fraction of typing times does not exceed, or 0 if no
+        typing times were counted. The bound is exact up to the width of a bucket.
+        """
+        if self.count == 0:
+            return 0.0
+        threshold = fraction * self.count
+        cumulative_count = 0
+        for bucket, count in enumerate(self.counts):
+            cumulative_count += count
+            if cumulative_count >= threshold and count:
+                upper_bound = self.min_time * 2 ** (bucket / self.buckets_per_octave)
+                return min(max(upper_bound, self.minimum), self.maximum)
+        return self.maximum
+
+    def to_json_object(self):
+        """ :return: the distribution in a form that can be serialized to JSON. """
+        return {"occurrences": self.occurrences, "mistyped": self.mistyped, "count": self.count, "total": self.total,
+                "minimum": self.minimum if self.count else None, "maximum": self.maximum, "counts": list(self.counts)}
+
+
+class LogStatistics:
+    """ Aggregated statistics of a number of exercises, which can be merged with those of other exercises. The first
+    word of an exercise counts towards error rates, but not towards typing times, as there is no telling when the user
+    began typing it. """
+    def __init__(self):
+        self.n_exercises = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        # mappings of words, names of keys and days (as ISO dates) to the distribution of their typing times. The time
+        # of a word is accounted to every key in its stroke.
+        self.words = {}
+        self.keys = {}
+        self.days = {}
+        # amount of exercises per day.
+        self.day_exercises = {}
+        # names of the keys in every mask of keys that occurred.
+        self._key_names = {}
+
+    def add_exercise(self, exercise_result):
+        """
+        Accounts for a completed exercise.
+
+        :param exercise_result: the exercise result.
+        """
+        timestamp = exercise_result.timestamp
+        self.n_exercises += 1
+        if self.first_timestamp is None or timestamp < self.first_timestamp:
+            self.first_timestamp = timestamp
+        if self.last_timestamp is None or timestamp > self.last_timestamp:
+            self.last_timestamp = timestamp
+        day = timestamp.date().isoformat()
+        self.day_exercises[day] = self.day_exercises.get(day, 0) + 1
+        day_distribution = self.days.get(day) or self.days.setdefault(day, TypingTimeDistribution())
+        words, keys, key_names_of = self.words, self.keys, self._key_names
+        bucket_of = TypingTimeDistribution.bucket_of
+        for i, word in enumerate(exercise_result.words):
+            is_typed_correctly = word.is_typed_correctly
+            typing_time = word.typing_time if i > 0 else None
+            bucket = bucket_of(typing_time)
+            written_word = word.stroke.written_word
+            word_distribution = words.get(written_word) or words.setdefault(written_word, TypingTimeDistribution())
+            word_distribution._add(is_typed_correctly, typing_time, bucket)
+            day_distribution._add(is_typed_correctly, typing_time, bucket)
+            mask = 0
+            for chord in word.stroke.chord_sequence:
+                mask |= int(chord.keys)
+            key_names = key_names_of.get(mask)
+            if key_names is None:
+                key_names = key_names_of[mask] = [key.name for key in StenoKeySet(mask)]
+            for key_name in key_names:
+                key_distribution = keys.get(key_name) or keys.setdefault(key_name, TypingTimeDistribution())
+                key_distribution._add(is_typed_correctly, typing_time, bucket)
+
+    def merge(self, other):
+        """
+        Adds the statistics of other exercises to these statistics.
+
+        :param other: the statistics of the other exercises.
+        """
+        self.n_exercises += other.n_exercises
+        for timestamp in (other.first_timestamp, other.last_timestamp):
+            if timestamp is not None:
+                if self.first_timestamp is None or timestamp < self.first_timestamp:
+                    self.first_timestamp = timestamp
+                if self.last_timestamp is None or timestamp > self.last_timestamp:
+                    self.last_timestamp = timestamp
+        for distributions, other_distributions in ((self.words, other.words), (self.keys, other.keys),
+                                                   (self.days, other.days)):
+            for name, other_distribution in other_distributions.items():
+                distribution = distributions.get(name)
+                if distribution is None:
+                    distributions[name] = other_distribution
+                else:
+                    distribution.merge(other_distribution)
+        for day, n_exercises in other.day_exercises.items():
+            self.day_exercises[day] = self.day_exercises.get(day, 0) + n_exercises
+
+    def total(self):
+        """ :return: the distribution of the typing times of all words. """
+        total = TypingTimeDistribution()
+        for distribution in self.days.values():
+            total.merge(distribution)
+        return total
+
+    def lessons(self):
+        """ :return: a mapping of "Learn Plover" lessons to the distribution of the typing times of their words, in the
+        order of the lessons. Words occurring in several lessons count towards each of them. """
+        lessons = {}
+        for lesson in learn_plover_lessons:
+            lessons[lesson] = TypingTimeDistribution()
+            for word in dict.fromkeys(learn_plover_lesson_words[lesson]):
+                if word in self.words:
+                    lessons[lesson].merge(self.words[word])
+        return lessons
+
+    def trends(self, period):
+        """
+        :param period: the period to group days by, see trend_periods.
+        :return: a mapping of periods to the amount of exercises in them and the distribution of their typing times,
+        in chronological order.
+        """
+        label_of = trend_periods[period]
+        trends = {}
+        for day in sorted(self.days):
+            label = label_of(date.fromisoformat(day))
+            n_exercises, distribution = trends.get(label) or trends.setdefault(label, (0, TypingTimeDistribution()))
+            distribution.merge(self.days[day])
+            trends[label] = (n_exercises + self.day_exercises[day], distribution)
+        return trends
+
+    def to_json_object(self):
+        """ :return: the statistics in a form that can be serialized to JSON. """
+        return {
+            "n_exercises": self.n_exercises,
+            "first_timestamp": None if self.first_timestamp is None else str(self.first_timestamp),
+            "last_timestamp": None if self.last_timestamp is None else str(self.last_timestamp),
+            "bucket_upper_bounds": [TypingTimeDistribution.min_time * 2 ** (bucket /
+                                                                            TypingTimeDistribution.buckets_per_octave)
+                                    for bucket in range(TypingTimeDistribution.n_buckets)],
+            "words": {word: distribution.to_json_object() for word, distribution in self.words.items()},
+            "lessons": {lesson: distribution.to_json_object() for lesson, distribution in self.lessons().items()},
+            "keys": {key: distribution.to_json_object() for key, distribution in self.keys.items()},
+            "days": {day: dict(distribution.to_json_object(), exercises=self.day_exercises[day])
+                     for day, distribution in sorted(self.days.items())},
+        }
+
+
+# converter of records in workers, which compiles its conversion functions once per process.
+_json_converter = TupleToJsonObjectConverter()
+
+
+def _analyze_lines(lines):
+    """ Analyzes the records of a JSON Lines log, skipping blank and corrupt records like JsonLinesExerciseLog. """
+    statistics = LogStatistics()
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            continue
+        if is_exercise_record(record):
+            try:
+                exercise_result = _json_converter.from_json_object(record, ExerciseResult)
+            except (TypeError, ValueError, IndexError, RuntimeError):
+                continue
+            statistics.add_exercise(exercise_result)
+    return statistics
+
+
+def _iter_lines_in_range(path, start, end):
+    """ Reads the lines of a file that begin at a byte offset in the given range. """
+    with open(path, "rb") as f:
+        if start > 0:
+            # the line that the range begins in belongs to the previous range, unless the range begins right after it.
+            f.seek(start - 1)
+            f.readline()
+        position = f.tell()
+        while position < end:
+            line = f.readline()
+            if not line:
+                return
+            position += len(line)
+            yield line
+
+
+def _analyze_file_range(path, start, end):
+    """ Analyzes the records of an uncompressed JSON Lines log that begin at a byte offset in the given range. """
+    return _analyze_lines(_iter_lines_in_range(path, start, end))
+
+
+def _analyze_sqlite_range(path, first_id, last_id):
+    """ Analyzes the exercises of an SQLite log with an ID in the given range. """
+    statistics = LogStatistics()
+    exercise_log = SqliteExerciseLog(path, read_only=True)
+    try:
+        for exercise_result in exercise_log.read_exercises(first_id, last_id):
+            statistics.add_exercise(exercise_result)
+    finally:
+        exercise_log.close()
+    return statistics
+
+
+def _iter_line_batches(path, batch_size):
+    """ Reads the lines of a (compressed) log in batches of about the given amount of characters. """
+    batch, batch_length = [], 0
+    with open_log_file(path, "rt") as f:
+        for line in f:
+            batch.append(line)
+            batch_length += len(line)
+            if batch_length >= batch_size:
+                yield batch
+                batch, batch_length = [], 0
+    if batch:
+        yield batch
+
+
+def analyze_exercise_log(path, max_workers=None, chunk_size=16 << 20, sqlite_chunk_size=20000):
+    """
+    Computes the statistics of an exercise log, analyzing chunks of the log in parallel processes.
+
+    :param path: path to the exercise log, either a JSON log (in either format, compressed or not) or an SQLite log.
+    :param max_workers: amount of processes to use, or None for one per processor.
+    :param chunk_size: amount of bytes of a JSON log analyzed by a process at a time.
+    :param sqlite_chunk_size: amount of exercises of an SQLite log analyzed by a process at a time.
+    :return: the statistics of the log (see LogStatistics).
+    """
+    path = Path(path)
+    max_workers = max_workers or os.cpu_count() or 1
+    statistics = LogStatistics()
+    # compressed logs are never SQLite logs, and may not exist yet while all their records are in their pending file.
+    is_sqlite = False
+    if not is_compressed_log(path):
+        with open(path, "rb") as f:
+            is_sqlite = f.read(len(_sqlite_magic)) == _sqlite_magic
+    if not is_sqlite:
+        with open_log_file(path, "rt") as f:
+            if is_list_log(f.readline()):
+                # logs of earlier versions are a single JSON list, which can only be parsed as a whole.
+                for exercise_result in read_exercise_log(path):
+                    statistics.add_exercise(exercise_result)
+                return statistics
+
+    with ProcessPoolExecutor(max_workers) as executor:
+        if is_sqlite:
+            exercise_log = SqliteExerciseLog(path, read_only=True)
+            try:
+                id_range = exercise_log.id_range()
+            finally:
+                exercise_log.close()
+            if id_range is None:
+                return statistics
+            first_id, last_id = id_range
+            starts = range(first_id, last_id + 1, sqlite_chunk_size)
+            results = executor.map(_analyze_sqlite_range, [path] * len(starts), starts,
+                                   [start + sqlite_chunk_size - 1 for start in starts])
+        elif not is_compressed_log(path):
+            starts = range(0, max(os.path.getsize(path), 1), chunk_size)
+            results = executor.map(_analyze_file_range, [path] * len(starts), starts,
+                                   [start + chunk_size for start in starts])
+        else:
+            # compressed logs can only be read from the beginning, so they are read here and handed out in batches.
+            # Only a limited amount of batches is handed out at a time, to bound memory use.
+            results = _bounded_map(executor, _analyze_lines, _iter_line_batches(path, chunk_size), 2 * max_workers)
+        for partial_statistics in results:
+            statistics.merge(partial_statistics)
+    return statistics
+
+
+def _bounded_map(executor, function, arguments, max_pending):
+    """ Like executor.map with a single iterable of arguments, but only taking the next argument from the iterable
+    when fewer than the given amount of calls are pending, and yielding results in the order they complete. """
+    pending = set()
+    for argument in arguments:
+        if len(pending) >= max_pending:
+            done = next(iter(wait(pending, return_when=FIRST_COMPLETED).done))
+            pending.remove(done)
+            yield done.result()
+        pending.add(executor.submit(function, argument))
+    for future in list(pending):
+        yield future.result()
+
+
+def _format_row(name, distribution, name_width, extra=""):
+    """ Formats a row of a table of the report. """
+    return (f"{name:{name_width}} {extra}{distribution.occurrences:11} {distribution.error_rate * 100:6.1f}% "
+            f"{distribution.mean * 1000:8.0f} {distribution.percentile(0.5) * 1000:8.0f} "
+            f"{distribution.percentile(0.9) * 1000:8.0f}")
+
+
+def format_report(statistics, top=20, min_occurrences=5, period="week"):
+    """
+    Formats the statistics of an exercise log as a report.
+
+    :param statistics: the statistics (see LogStatistics).
+    :param top: amount of words to list as slowest and most often mistyped.
+    :param min_occurrences: amount of times a word must have occurred to be listed.
+    :param period: the period to report trends over time by, see trend_periods.
+    :return: the report, as text.
+    """
+    total = statistics.total()
+    lines = [f"{statistics.n_exercises} exercises, {total.occurrences} words, {len(statistics.words)} distinct words",
+             f"from {statistics.first_timestamp} to {statistics.last_timestamp}",
+             f"error rate {total.error_rate * 100:.1f}%, mean typing time {total.mean * 1000:.0f} ms"]
+    header = f"{'occurrences':>11} {'errors':>7} {'mean ms':>8} {'p50 ms':>8} {'p90 ms':>8}"
+
+    frequent_words = [(word, distribution) for word, distribution in statistics.words.items()
+                      if distribution.occurrences >= min_occurrences]
+    for title, key in ((f"Slowest words (at least {min_occurrences} occurrences)",
+                        lambda item: (item[1].percentile(0.5), item[1].mean)),
+                       (f"Most often mistyped words (at least {min_occurrences} occurrences)",
+                        lambda item: (item[1].error_rate, item[1].occurrences))):
+        lines += ["", title, f"{'word':24} {header}"]
+        lines += [_format_row(word, distribution, 24)
+                  for word, distribution in sorted(frequent_words, key=key, reverse=True)[:top]]
+
+    lines += ["", "Lessons", f"{'lesson':40} {header}"]
+    lines += [_format_row(lesson, distribution, 40) for lesson, distribution in statistics.lessons().items()
+              if distribution.occurrences]
+
+    lines += ["", "Keys", f"{'key':6} {header}"]
+    lines += [_format_row(key.name, statistics.keys[key.name], 6) for key in StenoKeys.__members__.values()
+              if key.name in statistics.keys]
+
+    lines += ["", f"Trend by {period}", f"{period:10} {'exercises':>9} {header}"]
+    lines += [_format_row(label, distribution, 10, f"{n_exercises:9} ")
+              for label, (n_exercises, distribution) in statistics.trends(period).items()]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("log_path", help="path to the exercise log, for example output/log.json")
+    parser.add_argument("--workers", type=int, help="amount of processes to use (default: one per processor)")
+    parser.add_argument("--chunk-size", type=int, default=16, help="MiB of the log analyzed by a process at a time")
+    parser.add_argument("--top", type=int, default=20, help="amount of words to list as slowest and most mistyped")
+    parser.add_argument("--min-occurrences", type=int, default=5,
+                        help="amount of times a word must have occurred to be listed")
+    parser.add_argument("--period", choices=list(trend_periods), default="week", help="period to report trends by")
+    parser.add_argument("--json", metavar="PATH", help="also write all statistics to the given file in JSON format")
+    arguments = parser.parse_args()
+
+    log_statistics = analyze_exercise_log(arguments.log_path, arguments.workers, arguments.chunk_size << 20)
+    print(format_report(log_statistics, arguments.top, arguments.min_occurrences, arguments.period))
+    if arguments.json:
+        with open(arguments.json, "w", encoding="utf-8") as json_file:
+            json.dump(log_statistics.to_json_object(), json_file, indent=1)
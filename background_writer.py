@@ -0,0 +1,179 @@
+from pathlib import Path
+import os
+import threading
+
+
+# modes of making writes durable, see BackgroundWriter.
+durability_modes = ["fsync", "batched"]
+
+
+def _open_text(path, mode):
+    """ Opens a file in text mode with UTF-8 encoding. """
+    return open(path, mode, encoding="utf-8")
+
+
+def _fsync_file(path):
+    """ Flushes the contents of a file to disk. """
+    with open(path, "ab") as f:
+        os.fsync(f.fileno())
+
+
+def _fsync_directory(path):
+    """ Flushes the entries of a directory to disk, so that a file renamed into it survives a crash. Directories cannot
+    be opened for this on Windows, where renames are durable once the file is. """
+    if os.name != "nt":
+        descriptor = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+
+class _PendingWrite:
+    """ The writes to a single file that have not been carried out yet: new contents replacing the file (if any)
+    followed by text to append to it. """
+    def __init__(self, opener):
+        self.opener = opener
+        self.contents = None
+        self.appended = []
+
+
+class BackgroundWriter:
+    """
+    Writes files on a worker thread, so that the thread asking for a write does not wait for the disk. Writes to the
+    same file that are pending at the same time are coalesced: replacing the contents of a file discards earlier
+    pending writes to it, and appended text is written in one go. Files are replaced by writing a temporary file that is
+    renamed over the original, so that a crash never leaves a partially written file behind. Files are written in the
+    order they were first written to, except that a replaced file is written after all files written to before it.
+
+    Writes are made durable in one of two ways (see durability_modes):
+
+    - "fsync": every write is carried out right away, and flushed to disk before the next one.
+    - "batched": writes are collected for a short interval and carried out together, flushing every file to disk once
+      per batch. A crash may lose the writes of the last interval, but never corrupts a file.
+
+    An error that occurs while writing is raised by the next call to write, flush or close.
+    """
+    def __init__(self, durability="batched", batch_interval=1.0):
+        """
+        :param durability: how writes are made durable, see durability_modes.
+        :param batch_interval: time in seconds that writes are collected for in "batched" mode.
+        """
+        if durability not in durability_modes:
+            raise ValueError(f"Unknown durability mode {durability!r}")
+        self.durability = durability
+        self.batch_interval = batch_interval
+        self._condition = threading.Condition()
+        # mapping of paths to the writes pending for them, in the order the paths were first written to.
+        self._pending = {}
+        self._n_writing = 0
+        self._flush_requested = False
+        self._closed = False
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="background-writer", daemon=True)
+        self._thread.start()
+
+    def replace(self, path, contents, opener=_open_text):
+        """
+        Replaces the contents of a file.
+
+        :param path: path to the file (its directory is created if needed).
+        :param contents: the new contents of the file, as a string.
+        :param opener: function opening the file given a path and a mode, used for example to compress it.
+        """
+        with self._condition:
+            pending_write = self._pending_write(path, opener)
+            pending_write.opener = opener
+            pending_write.contents = contents
+            pending_write.appended.clear()
+            # the earlier writes to the file are discarded, so it can be moved behind the writes to other files.
+            self._pending[Path(path)] = self._pending.pop(Path(path))
+            self._condition.notify_all()
+
+    def append(self, path, text, opener=_open_text):
+        """
+        Appends text to the end of a file.
+
+        :param path: path to the file (it and its directory are created if needed).
+        :param text: the text to append.
+        :param opener: function opening the file given a path and a mode, used for example to compress it.
+        """
+        with self._condition:
+            self._pending_write(path, opener).appended.append(text)
+            self._condition.notify_all()
+
+    def flush(self):
+        """ Waits until all pending writes have been carried out and flushed to disk. """
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify_all()
+            self._condition.wait_for(lambda: not self._pending and not self._n_writing)
+            self._flush_requested = False
+            self._raise_error()
+
+    def close(self):
+        """ Carries out all pending writes and stops the worker thread. """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        with self._condition:
+            self._raise_error()
+
+    def _pending_write(self, path, opener):
+        """ Returns the pending write to the given file, to be changed by the caller. Must be called holding the
+        condition. """
+        self._raise_error()
+        if self._closed:
+            raise RuntimeError("Cannot write after the background writer is closed")
+        return self._pending.setdefault(Path(path), _PendingWrite(opener))
+
+    def _raise_error(self):
+        """ Raises the error that occurred while writing, if any. Must be called holding the condition. """
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _run(self):
+        """ Carries out pending writes until the writer is closed. """
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                if self.durability == "batched":
+                    # more writes are collected for a while, unless they are needed right away.
+                    self._condition.wait_for(lambda: self._flush_requested or self._closed, self.batch_interval)
+                if not self._pending and self._closed:
+                    return
+                pending, self._pending = self._pending, {}
+                self._n_writing += 1
+            for path, pending_write in pending.items():
+                try:
+                    self._write(path, pending_write)
+                except BaseException as error:
+                    # the other files are still written, only the first error is kept.
+                    with self._condition:
+                        self._error = self._error or error
+            with self._condition:
+                self._n_writing -= 1
+                self._condition.notify_all()
+
+    @staticmethod
+    def _write(path, pending_write):
+        """ Carries out the pending writes to a file and flushes them to disk. """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if pending_write.contents is not None:
+            # the temporary file keeps the suffix of the file, so that the opener treats it the same.
+            temp_path = path.with_name(path.name + ".tmp" + path.suffix)
+            with pending_write.opener(temp_path, "wt") as f:
+                f.write(pending_write.contents)
+                f.writelines(pending_write.appended)
+            _fsync_file(temp_path)
+            os.replace(temp_path, path)
+            _fsync_directory(path.parent)
+        elif pending_write.appended:
+            created = not path.exists()
+            with pending_write.opener(path, "at") as f:
+                f.writelines(pending_write.appended)
+            _fsync_file(path)
+            if created:
+                _fsync_directory(path.parent)
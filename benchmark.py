@@ -0,0 +1,932 @@
+"""
+Benchmarks for the parts of the program. Run as "python benchmark.py [name ...]" to run the given benchmarks, or all of
+them when no names are given. Benchmarks use synthetic data, so no Plover dictionary or exercise log needs to be
+present. Benchmarks of the user interface need a display, and are skipped when there is none unless they are named,
+in which case the run fails. Run them under a virtual display where there is no screen, for example as
+"xvfb-run -a python benchmark.py exercise_switch typing_replay".
+
+Run as "python benchmark.py --suite [--exercises N] [--entries N]" to run the stages of the program that do not need a
+display at the given scale, reporting the time and peak memory of every stage. The results are compared to a baseline
+stored by an earlier run with --save-baseline, and stages that regressed are flagged.
+"""
+from random import Random
+from pathlib import Path
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from datetime import datetime, timedelta
+from steno_keys import StenoKeys, StenoKeySet, Chord, Stroke, format_stroke, parse_stroke
+from exercise_log import ExerciseResult, ExerciseWordResult, TupleToJsonObjectConverter
+from typing import List
+from learn_plover import learn_plover_lesson_words
+
+
+def generate_synthetic_chord(random):
+    """ Generates a random chord, with each key pressed with a low probability. """
+    keys = {key for key in StenoKeys.__members__.values() if random.random() < 0.15}
+    return Chord(keys or {random.choice(list(StenoKeys.__members__.values()))})
+
+
+def generate_synthetic_dictionary(n_entries=150000, seed=0):
+    """
+    Generates a synthetic Plover dictionary, roughly the size of the Plover main dictionary. Every word of the
+    "Learn Plover" lessons is included with a few strokes, the remaining entries are made up words.
+
+    :param n_entries: approximate amount of entries in the dictionary.
+    :param seed: seed for the random generator, so that the same dictionary is generated every time.
+    :return: the dictionary, mapping strokes to words.
+    """
+    random = Random(seed)
+    steno_dict = {}
+    lesson_words = sorted({word for words in learn_plover_lesson_words.values() for word in words})
+    words = lesson_words * 3 + [f"word{i}" for i in range(max(0, n_entries - len(lesson_words) * 3))]
+    for word in words:
+        # strokes are drawn until an unused one is found, so that every lesson word ends up in the dictionary.
+        stroke = None
+        while stroke is None or stroke in steno_dict:
+            stroke = format_stroke([generate_synthetic_chord(random) for _ in range(random.choice((1, 1, 1, 2, 3)))])
+        steno_dict[stroke] = word
+    return steno_dict
+
+
+def write_synthetic_dictionary(directory, n_entries=150000, seed=0):
+    """ Writes a synthetic Plover dictionary to the given directory, returning the path of the written file. """
+    path = Path(directory, "main.json")
+    with open(path, "w") as f:
+        json.dump(generate_synthetic_dictionary(n_entries, seed), f, indent=0)
+    return path
+
+
+def iter_synthetic_exercise_history(n_exercises, exercise_size=20, seed=0):
+    """
+    Generates a synthetic history of completed exercises, with words from the "Learn Plover" lessons typed in random
+    times and occasionally mistyped. Exercises are generated as they are iterated over, so large histories can be
+    generated without holding them in memory.
+
+    :param n_exercises: amount of exercises in the history.
+    :param exercise_size: amount of words in every exercise.
+    :param seed: seed for the random generator, so that the same history is generated every time.
+    :return: an iterator over exercise results.
+    """
+    random = Random(seed)
+    lesson_words = sorted({word for words in learn_plover_lesson_words.values() for word in words})
+    strokes = [Stroke([generate_synthetic_chord(random) for _ in range(random.choice((1, 1, 2)))], word)
+               for word in lesson_words]
+    timestamp = datetime(2020, 1, 1)
+    for _ in range(n_exercises):
+        timestamp += timedelta(minutes=random.randint(1, 600))
+        yield ExerciseResult(timestamp, [
+            ExerciseWordResult(random.choice(strokes), random.random() > 0.1, random.lognormvariate(-0.5, 0.5))
+            for _ in range(exercise_size)])
+
+
+def generate_synthetic_exercise_history(n_exercises, exercise_size=20, seed=0):
+    """ Generates a synthetic history of completed exercises as a list, see iter_synthetic_exercise_history. """
+    return list(iter_synthetic_exercise_history(n_exercises, exercise_size, seed))
+
+
+def _time(function, *args, **kwargs):
+    """ Calls the given function, returning the time it took in seconds. """
+    begin = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - begin
+
+
+def benchmark_startup():
+    """ Compares the time it takes to construct the exercise generator without a compiled dictionary cache (cold
+    startup) and with one (warm startup), and with a dictionary index before and after it is built. """
+    from exercise_generator import StenoExerciseGenerator
+
+    with tempfile.TemporaryDirectory() as directory:
+        steno_dict_path = write_synthetic_dictionary(directory)
+        log_path = Path(directory, "log.json")
+
+        uncached = _time(StenoExerciseGenerator, steno_dict_path, log_path, use_dictionary_cache=False)
+        cold = _time(StenoExerciseGenerator, steno_dict_path, log_path)
+        warm = min(_time(StenoExerciseGenerator, steno_dict_path, log_path) for _ in range(5))
+        os.utime(steno_dict_path)
+        touched = _time(StenoExerciseGenerator, steno_dict_path, log_path)
+        cold_index = _time(StenoExerciseGenerator, steno_dict_path, log_path, use_dictionary_index=True)
+        warm_index = min(_time(StenoExerciseGenerator, steno_dict_path, log_path, use_dictionary_index=True)
+                         for _ in range(5))
+
+    print(f"startup without cache:        {uncached * 1000:8.1f} ms")
+    print(f"cold startup (building cache): {cold * 1000:8.1f} ms")
+    print(f"warm startup (cached):         {warm * 1000:8.1f} ms")
+    print(f"startup after touching dict:   {touched * 1000:8.1f} ms")
+    print(f"cold startup (building index): {cold_index * 1000:8.1f} ms")
+    print(f"warm startup (mapped index):   {warm_index * 1000:8.1f} ms")
+
+
+def benchmark_record():
+    """ Compares the time it takes to record an exercise by rewriting the entire log (as earlier versions did) and by
+    appending to it, for logs of growing size. """
+    from exercise_log import TupleToJsonObjectConverter
+    from exercise_history import JsonLinesExerciseLog
+    from typing import List
+
+    json_converter = TupleToJsonObjectConverter()
+    for n_exercises in (100, 1000, 10000):
+        exercise_history = generate_synthetic_exercise_history(n_exercises + 1)
+        with tempfile.TemporaryDirectory() as directory:
+            def rewrite():
+                with open(Path(directory, "log.json"), "w") as f:
+                    json.dump(json_converter.to_json_object(exercise_history, List[ExerciseResult]), f)
+            exercise_log = JsonLinesExerciseLog(Path(directory, "log.jsonl"), json_converter)
+            for exercise_result in exercise_history[:-1]:
+                exercise_log.append(exercise_result)
+            rewrite_time = _time(rewrite)
+            append_time = _time(exercise_log.append, exercise_history[-1])
+        print(f"{n_exercises:6} exercises: rewrite {rewrite_time * 1000:9.2f} ms, append {append_time * 1000:6.2f} ms")
+
+
+def benchmark_sqlite(sizes=(10000, 100000, 1000000)):
+    """ Measures importing exercises into an SQLite exercise log, and computing per-word statistics of typing times
+    in the database, for histories of growing size. The in-memory JSON log is measured for comparison where the
+    history still fits comfortably in memory. """
+    from exercise_history import JsonLinesExerciseLog, SqliteExerciseLog
+
+    for n_exercises in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            database = SqliteExerciseLog(Path(directory, "log.sqlite"))
+            import_time = _time(database.extend, iter_synthetic_exercise_history(n_exercises))
+            statistics_time = _time(database.typing_time_statistics)
+            word_time = _time(database.typing_times, "the")
+            append_time = _time(database.append, next(iter_synthetic_exercise_history(1, seed=1)))
+            database.close()
+            size = os.path.getsize(Path(directory, "log.sqlite"))
+            print(f"{n_exercises:8} exercises: import {import_time:8.2f} s, {size / 2**20:8.1f} MiB, "
+                  f"statistics {statistics_time * 1000:9.1f} ms, single word {word_time * 1000:7.2f} ms, "
+                  f"append {append_time * 1000:6.2f} ms")
+            if n_exercises <= 100000:
+                json_log = JsonLinesExerciseLog(Path(directory, "log.json"))
+                for exercise_result in iter_synthetic_exercise_history(n_exercises):
+                    json_log._records.append(exercise_result)
+                print(f"{'':8}   in-memory JSON log: statistics {_time(json_log.typing_time_statistics) * 1000:9.1f} "
+                      f"ms, single word {_time(json_log.typing_times, 'the') * 1000:7.2f} ms")
+
+
+def _reference_parse_stroke(stroke):
+    """ The chord parser of earlier versions, which searches all keys for every letter. Kept for comparison. """
+    chords = []
+    for chord in stroke.split("/"):
+        min_order = -1
+        keys = set()
+        for letter in chord:
+            if letter == "-":
+                min_order = StenoKeys.STAR
+            else:
+                matching_key = None
+                for key in StenoKeys.__members__.values():
+                    if key.letter == letter and key.order > min_order and \
+                            (matching_key is None or matching_key.order > key.order):
+                        matching_key = key
+                if matching_key is None:
+                    raise ValueError(f"Cannot parse stroke {stroke!r}")
+                min_order = matching_key.order
+                keys.add(matching_key)
+        chords.append(Chord(keys))
+    return chords
+
+
+def benchmark_parse(steno_dict_path=Path("data", "main.json")):
+    """ Parses every entry of the Plover dictionary in one pass, with the parser of earlier versions, the table-driven
+    parser, and the table-driven parser again. Only the most recent strokes and chords are memoized, so the second pass
+    over the dictionary is hardly faster than the first. A synthetic dictionary is used when the Plover dictionary is
+    not present. """
+    from steno_keys import parse_stroke, parse_chord, _parse_stroke
+
+    if Path(steno_dict_path).exists():
+        with open(steno_dict_path) as f:
+            strokes = [stroke for stroke in json.load(f) if not any(letter in "0123456789#" for letter in stroke)]
+    else:
+        strokes = list(generate_synthetic_dictionary())
+
+    def parse_all(parse):
+        for stroke in strokes:
+            try:
+                parse(stroke)
+            except ValueError:
+                pass
+
+    parse_chord.cache_clear()
+    _parse_stroke.cache_clear()
+    reference = _time(parse_all, _reference_parse_stroke)
+    table_driven = _time(parse_all, parse_stroke)
+    second_pass = _time(parse_all, parse_stroke)
+    print(f"{len(strokes)} entries: reference parser {reference * 1000:8.1f} ms, "
+          f"table-driven {table_driven * 1000:7.1f} ms, second pass {second_pass * 1000:6.1f} ms")
+
+
+def benchmark_chords(n_chords=100000):
+    """ Compares memory usage and the time of set algebra between chords holding a set of keys (as earlier versions
+    did) and chords holding a StenoKeySet. """
+    import tracemalloc
+    from collections import namedtuple
+    from steno_keys import StenoKeySet
+
+    random = Random(0)
+    key_sets = [{key for key in StenoKeys.__members__.values() if random.random() < 0.25} for _ in range(n_chords)]
+    set_chord = namedtuple("Chord", "keys")
+    for name, make_chord in (("set", lambda keys: set_chord(set(keys))), ("StenoKeySet", Chord)):
+        tracemalloc.start()
+        chords = [make_chord(keys) for keys in key_sets]
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        union_time = _time(lambda: [a.keys | b.keys for a, b in zip(chords, chords[1:])])
+        subset_time = _time(lambda: [a.keys <= b.keys for a, b in zip(chords, chords[1:])])
+        membership_time = _time(lambda: [StenoKeys.A in chord.keys for chord in chords])
+        print(f"{name:12} {memory / n_chords:6.1f} bytes per chord, union {union_time * 1000:6.1f} ms, "
+              f"subset {subset_time * 1000:6.1f} ms, membership {membership_time * 1000:6.1f} ms "
+              f"({n_chords} chords)")
+    masks = [chord.mask for chord in chords]
+    union_time = _time(lambda: [a | b for a, b in zip(masks, masks[1:])])
+    subset_time = _time(lambda: [a & ~b == 0 for a, b in zip(masks, masks[1:])])
+    membership_time = _time(lambda: [mask >> StenoKeys.A & 1 for mask in masks])
+    print(f"{'masks':12} {'':22} union {union_time * 1000:6.1f} ms, subset {subset_time * 1000:6.1f} ms, "
+          f"membership {membership_time * 1000:6.1f} ms")
+
+
+def benchmark_log_formats(n_exercises=100000):
+    """ Compares the size of a synthetic exercise log and the time to load it, with strokes written as nested lists of
+    keys or in compact form, and with or without compression. The log is written by appending the exercises one by
+    one, as they are recorded, and its size includes the pending file of a compressed log (see pending_log_path).
+    Loading is measured both for opening the log (records are decoded lazily) and for decoding all exercises. """
+    from exercise_log import TupleToJsonObjectConverter
+    from exercise_history import JsonLinesExerciseLog, pending_log_path
+
+    with tempfile.TemporaryDirectory() as directory:
+        for compact, name in ((False, "log.json"), (True, "log.json"), (True, "log.json.gz"), (True, "log.json.xz")):
+            path = Path(directory, f"{'compact' if compact else 'lists'}-{name}")
+            json_converter = TupleToJsonObjectConverter(compact=compact)
+            exercise_log = JsonLinesExerciseLog(path, json_converter)
+            append_time = _time(lambda: [exercise_log.append(exercise_result)
+                                         for exercise_result in iter_synthetic_exercise_history(n_exercises)])
+            size = os.path.getsize(path)
+            if pending_log_path(path).exists():
+                size += os.path.getsize(pending_log_path(path))
+
+            open_time = _time(JsonLinesExerciseLog, path, json_converter)
+            exercise_log = JsonLinesExerciseLog(path, json_converter)
+            decode_time = _time(lambda: sum(1 for _ in exercise_log))
+            print(f"{'compact' if compact else 'lists':7} {name:12} {size / 2**20:8.2f} MiB, "
+                  f"append all {append_time:6.2f} s, open {open_time:6.2f} s, decode all {decode_time:6.2f} s "
+                  f"({n_exercises} exercises)")
+
+
+def benchmark_sampling(n_draws=2000000, exercise_size=20):
+    """ Compares the throughput of drawing words from all lessons, weighted by synthetic typing times, by rebuilding
+    the pool of words and calling random.choices for every exercise (as earlier versions did) and with an alias sampler
+    that is built once. """
+    from weighted_sampler import AliasSampler
+
+    random = Random(0)
+    lessons = list(learn_plover_lesson_words)
+    word_weights = {word: random.uniform(0.2, 2.0) for lesson in lessons for word in learn_plover_lesson_words[lesson]}
+    n_exercises = n_draws // exercise_size
+
+    def draw_with_choices():
+        for _ in range(n_exercises):
+            words_to_include = []
+            for lesson in lessons:
+                words_to_include += learn_plover_lesson_words[lesson]
+            random.choices(words_to_include, [word_weights.get(word, 0.5) for word in words_to_include],
+                           k=exercise_size)
+
+    def draw_with_sampler():
+        words_to_include = list(dict.fromkeys(word for lesson in lessons for word in learn_plover_lesson_words[lesson]))
+        sampler = AliasSampler(words_to_include, [word_weights.get(word, 0.5) for word in words_to_include])
+        for _ in range(n_exercises):
+            sampler.sample(random, exercise_size)
+
+    for name, draw in (("random.choices per exercise", draw_with_choices), ("alias sampler", draw_with_sampler)):
+        elapsed = _time(draw)
+        print(f"{name:28}: {elapsed:6.2f} s, {n_draws / elapsed / 1e6:6.2f} M words/s "
+              f"({n_draws} words in exercises of {exercise_size})")
+
+
+def benchmark_word_weights(n_words=200000, n_typed_words=100000, window=20):
+    """ Compares the time to compute the weights of a large pool of words, with statistics kept in dictionaries keyed
+    by word (as earlier versions did) and in arrays indexed by word ID. Half of the pool has been typed before. """
+    from word_statistics import WordStatistics
+    from word_table import WordTable
+
+    random = Random(0)
+    words = [f"word{i}" for i in range(n_words)]
+    typed_words = random.sample(words, n_typed_words)
+    typing_times = {word: [random.uniform(0.2, 3.0) for _ in range(random.randint(1, 2 * window))]
+                    for word in typed_words}
+    typing_time_statistics = {word: (len(times), sum(1 / time for time in times))
+                              for word, times in typing_times.items()}
+    now = datetime.now().timestamp()
+    decayed_statistics = {word: (count, reciprocal_sum, now - random.uniform(0, 1e7))
+                          for word, (count, reciprocal_sum) in typing_time_statistics.items()}
+
+    word_statistics = WordStatistics(window, 30.0, typing_time_statistics, typing_times, decayed_statistics,
+                                     word_table=WordTable(words))
+    word_ids = word_statistics.word_table.intern_all(words)
+    recent_typing_times = {word: times[-window:] for word, times in typing_times.items()}
+
+    def dictionary_weights():
+        harmonic_mean_weights = {word: 1 / reciprocal_sum
+                                 for word, (count, reciprocal_sum) in typing_time_statistics.items()}
+        windowed_weights = {word: 1 / sum(1 / time for time in times) for word, times in recent_typing_times.items()}
+        decayed_weights = {word: count / reciprocal_sum
+                           for word, (count, reciprocal_sum, last_update) in decayed_statistics.items()}
+        for weights in (harmonic_mean_weights, windowed_weights, decayed_weights):
+            [weights.get(word, 0.5) for word in words]
+
+    def array_weights():
+        word_statistics.harmonic_mean_weights(word_ids, 0.5)
+        word_statistics.windowed_weights(word_ids, 0.5)
+        word_statistics.decayed_weights(word_ids, 0.5)
+
+    for name, compute_weights in (("dictionaries", dictionary_weights), ("arrays", array_weights)):
+        print(f"{name:12}: {_time(compute_weights) * 1000:8.1f} ms for all three modes ({n_words} words)")
+
+    # with decaying statistics, a word typed slowly many times must outweigh a word typed fast once.
+    slow_stroke, fast_stroke = Stroke(parse_stroke("SHRO*EU"), "slow"), Stroke(parse_stroke("TPAFT"), "fast")
+    word_statistics = WordStatistics(half_life=30.0)
+    timestamp = datetime.now() - timedelta(days=10)
+    for _ in range(100):
+        timestamp += timedelta(minutes=10)
+        word_statistics.add_exercise(ExerciseResult(timestamp, [ExerciseWordResult(slow_stroke, True, 2.0)] * 2))
+    word_statistics.add_exercise(ExerciseResult(timestamp, [ExerciseWordResult(fast_stroke, True, 0.5)] * 2))
+    slow_weight, fast_weight = word_statistics.decayed_weights(
+        word_statistics.word_table.intern_all(["slow", "fast"]), 0.5)
+    assert abs(slow_weight - 2.0) < 1e-9 and abs(fast_weight - 0.5) < 1e-9, \
+        f"decayed weights {slow_weight}, {fast_weight} are not the mean typing times 2.0, 0.5"
+
+
+def benchmark_service(n_users=50, n_exercises=10, exercise_size=20):
+    """ Load test of the exercise service (see exercise_service.py): simulated users each request and record exercises
+    concurrently through a local server, measuring the latency of requests. The logs of all users are checked to hold
+    exactly the exercises they recorded afterwards. """
+    from concurrent.futures import ThreadPoolExecutor
+    from exercise_history import JsonLinesExerciseLog
+    from exercise_log import ExerciseSettings
+    from exercise_service import ExerciseService, ExerciseServer, ExerciseServiceClient
+    from latency import LatencyHistogram
+    import threading
+
+    with tempfile.TemporaryDirectory() as directory:
+        steno_dict_path = write_synthetic_dictionary(directory)
+        load_time = time.perf_counter()
+        service = ExerciseService(steno_dict_path, Path(directory, "users"))
+        load_time = time.perf_counter() - load_time
+        server = ExerciseServer(("127.0.0.1", 0), service)
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+        histograms = {"generate": LatencyHistogram(), "record": LatencyHistogram()}
+        histograms_lock = threading.Lock()
+        exercise_settings = ExerciseSettings(exercise_size, list(learn_plover_lesson_words))
+
+        def simulate_user(user_index):
+            random = Random(user_index)
+            client = ExerciseServiceClient(server.url, f"user{user_index}")
+            for _ in range(n_exercises):
+                begin = time.perf_counter()
+                strokes = client.generate_exercise(exercise_settings)
+                generated = time.perf_counter()
+                client.record_exercise_result(ExerciseResult(
+                    datetime.now(), [ExerciseWordResult(stroke, random.random() > 0.05, random.uniform(0.2, 2.0))
+                                     for stroke in strokes]))
+                recorded = time.perf_counter()
+                with histograms_lock:
+                    histograms["generate"].add(generated - begin)
+                    histograms["record"].add(recorded - generated)
+
+        try:
+            begin = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=n_users) as executor:
+                list(executor.map(simulate_user, range(n_users)))
+            total_time = time.perf_counter() - begin
+        finally:
+            server.shutdown()
+            server.server_close()
+            service.close()
+
+        n_logged = [len(JsonLinesExerciseLog(service.log_path_for(f"user{user_index}"), read_only=True))
+                    for user_index in range(n_users)]
+    print(f"dictionary loaded once in {load_time * 1000:.1f} ms")
+    print(f"{n_users} users x {n_exercises} exercises: {2 * n_users * n_exercises / total_time:8.1f} requests/s")
+    for name, histogram in histograms.items():
+        print(f"{name:8}: mean {histogram.total / histogram.count * 1000:8.2f} ms, "
+              f"p50 {histogram.percentile(0.5) * 1000:8.2f} ms, p95 {histogram.percentile(0.95) * 1000:8.2f} ms, "
+              f"p99 {histogram.percentile(0.99) * 1000:8.2f} ms, max {histogram.maximum * 1000:8.2f} ms")
+    assert n_logged == [n_exercises] * n_users, "exercises were lost or recorded for the wrong user"
+
+
+def benchmark_analytics(n_exercises=20000):
+    """ Measures the time to analyze a synthetic exercise log (see analytics.py) in a single process and in a process
+    per processor, for an uncompressed and a compressed JSON log and an SQLite log. The statistics are checked to be
+    identical. """
+    import analytics
+    from exercise_history import import_exercise_log
+    import gzip
+
+    json_converter = TupleToJsonObjectConverter()
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = Path(directory, "log.json")
+        with open(log_path, "w", encoding="utf-8") as f:
+            for exercise_result in iter_synthetic_exercise_history(n_exercises):
+                f.write(json.dumps(json_converter.to_json_object(exercise_result, ExerciseResult)) + "\n")
+        compressed_log_path = Path(directory, "log.json.gz")
+        with open(log_path, "rb") as f, gzip.open(compressed_log_path, "wb") as compressed_file:
+            compressed_file.write(f.read())
+        database_path = Path(directory, "log.sqlite")
+        import_exercise_log(log_path, database_path)
+        print(f"{n_exercises} exercises, {os.path.getsize(log_path) / 2**20:.1f} MiB log, {os.cpu_count()} processors")
+
+        reports = []
+        for path in (log_path, compressed_log_path, database_path):
+            for max_workers in (1, None):
+                begin = time.perf_counter()
+                statistics = analytics.analyze_exercise_log(path, max_workers, chunk_size=1 << 20,
+                                                            sqlite_chunk_size=2000)
+                analysis_time = time.perf_counter() - begin
+                reports.append(analytics.format_report(statistics))
+                print(f"{path.name:12} {'1' if max_workers else 'all':>3} workers: {analysis_time:6.2f} s")
+        assert all(report == reports[0] for report in reports), "analyses disagree"
+
+
+class _BenchmarkListener:
+    """ Listener of an exercise frame that ignores all events, used to measure the user interface on its own. """
+    def set_chord_preview(self, chord):
+        pass
+
+    def finish_exercise(self, exercise_result):
+        pass
+
+
+def _create_benchmark_window():
+    """ Creates a hidden main window for benchmarks of the user interface, or returns None if there is no display, in
+    which case the benchmark returns False to report that it was skipped. """
+    import tkinter as tk
+    try:
+        root = tk.Tk()
+    except tk.TclError as error:
+        print(f"skipped, no display available ({error})")
+        return None
+    root.withdraw()
+    return root
+
+
+def _recreating_set_exercise(exercise_frame, strokes):
+    """ StenoExerciseFrame.set_exercise of earlier versions, which destroys the widgets of all words of the previous
+    exercise and creates new ones. Kept for comparison. """
+    import tkinter as tk
+    for word in exercise_frame.words:
+        word.destroy()
+    exercise_frame.words.clear()
+    exercise_frame.exercise_begin_time = exercise_frame.clock()
+    exercise_frame.exercise_begin_date = datetime.now()
+    for i, stroke in enumerate(strokes):
+        word = exercise_frame.WordInExercise(exercise_frame, i, stroke)
+        exercise_frame.words_flow_container.window_create(tk.INSERT, window=word)
+        exercise_frame.words.append(word)
+    exercise_frame.words_flow_container.configure(state=tk.DISABLED)
+    exercise_frame.words[0].begin()
+
+
+def benchmark_difficulty_model(n_words=50000, n_typed_words=10000):
+    """ Measures the time to fit the key difficulty model (see difficulty_model.py) to the typing times of typed words,
+    and to score and blend the weights of a pool of words, as done whenever the word sampler is rebuilt. The scores
+    are checked against computing them key by key. """
+    from difficulty_model import KeyDifficultyModel
+
+    random = Random(0)
+    word_chord_masks = [tuple(generate_synthetic_chord(random).mask for _ in range(random.choice((1, 1, 1, 2, 3))))
+                        for _ in range(n_words)]
+    model = KeyDifficultyModel(word_chord_masks)
+    typed_word_ids = random.sample(range(n_words), n_typed_words)
+    mean_typing_times = [random.uniform(0.3, 2.0) for _ in typed_word_ids]
+    word_ids = list(range(n_words))
+    counts = [0] * n_words
+    for word_id in typed_word_ids:
+        counts[word_id] = random.randint(1, 20)
+    weights = [1 / random.uniform(1, 20) for _ in word_ids]
+
+    fit_time = _time(model.fit, typed_word_ids, mean_typing_times)
+    begin = time.perf_counter()
+    estimates = model.score(word_ids, 0.5)
+    score_time = time.perf_counter() - begin
+    blend_time = _time(model.blend, estimates, weights, counts)
+    print(f"{n_typed_words} typed words: fit {fit_time * 1000:7.2f} ms")
+    print(f"{n_words} words: score {score_time * 1000:7.2f} ms, blend {blend_time * 1000:7.2f} ms")
+
+    key_difficulties = model.key_difficulties
+    for word_id in random.sample(word_ids, 1000):
+        expected = sum(sum(key_difficulties[key] for key in StenoKeySet(mask)) / len(StenoKeySet(mask))
+                       for mask in word_chord_masks[word_id])
+        assert abs(estimates[word_id] - expected) < 1e-9, "scores differ from key by key computation"
+
+    # with decaying statistics, words typed equally fast must teach the model the same difficulty for their keys,
+    # however long ago they were typed.
+    from exercise_log import ExerciseSettings
+    from word_statistics import WordStatistics
+
+    old_stroke, recent_stroke = Stroke(parse_stroke("KAT"), "cat"), Stroke(parse_stroke("TKOG"), "dog")
+    now = datetime.now()
+    word_statistics = WordStatistics(half_life=30.0)
+    for timestamp, stroke in ((now - timedelta(days=120), old_stroke), (now, recent_stroke)):
+        word_statistics.add_exercise(ExerciseResult(timestamp, [ExerciseWordResult(stroke, True, 1.0)] * 11))
+    settings = ExerciseSettings(20, [], "decay", statistics_half_life=30.0)
+    word_ids = [word_statistics.word_table.intern(stroke.written_word) for stroke in (old_stroke, recent_stroke)]
+    decay_model = KeyDifficultyModel([tuple(chord.mask for chord in stroke.chord_sequence)
+                                      for stroke in (old_stroke, recent_stroke)])
+    decay_model.fit(word_ids, word_statistics.mean_typing_times(settings, word_ids))
+    assert all(abs(difficulty - 1.0) < 1e-9 for difficulty in decay_model.key_difficulties), \
+        "decayed weights are fitted as typing times"
+
+
+def benchmark_exercise_switch(sizes=(20, 200, 2000), n_switches=5):
+    """ Measures the time to switch to a new exercise in the exercise frame, including laying out the new words, when
+    creating new widgets for every exercise (as earlier versions did), when reusing the widgets of earlier exercises
+    and when drawing the exercise as text. """
+    from ui_elements import StenoExerciseFrame, StenoTextExerciseFrame
+
+    root = _create_benchmark_window()
+    if root is None:
+        return False
+    exercise_history = generate_synthetic_exercise_history(n_switches + 1, max(sizes))
+    try:
+        for size in sizes:
+            exercises = [[word.stroke for word in exercise_result.words[:size]]
+                         for exercise_result in exercise_history]
+            for name, exercise_frame_type, set_exercise in (
+                    ("recreating", StenoExerciseFrame, _recreating_set_exercise),
+                    ("pooled", StenoExerciseFrame, StenoExerciseFrame.set_exercise),
+                    ("text", StenoTextExerciseFrame, StenoTextExerciseFrame.set_exercise)):
+                exercise_frame = exercise_frame_type(root, _BenchmarkListener())
+                exercise_frame.pack()
+                set_exercise(exercise_frame, exercises[0])
+                root.update()
+
+                def switch_exercises():
+                    for strokes in exercises[1:]:
+                        set_exercise(exercise_frame, strokes)
+                        root.update()
+
+                switch_time = _time(switch_exercises) / n_switches
+                print(f"{size:5} words, {name:10}: {switch_time * 1000:9.1f} ms per switch")
+                exercise_frame.destroy()
+    finally:
+        root.destroy()
+
+
+def benchmark_typing_replay(sizes=(20, 200), typo_rate=0.05):
+    """ Replays a simulated typist typing exercises into the exercise frame (see typing_replay.py), measuring the
+    keystrokes handled per second and checking that the recorded typing times match those of the typist. """
+    from typing_replay import run_replay
+    from ui_elements import StenoExerciseFrame, StenoTextExerciseFrame
+
+    root = _create_benchmark_window()
+    if root is None:
+        return False
+    try:
+        for size in sizes:
+            strokes = [word.stroke for word in generate_synthetic_exercise_history(1, size)[0].words]
+            for name, exercise_frame_type in (("widgets", StenoExerciseFrame), ("text", StenoTextExerciseFrame)):
+                keystrokes_per_second, mismatches = run_replay(root, exercise_frame_type, strokes, typo_rate=typo_rate)
+                print(f"{size:5} words, {name:7}: {keystrokes_per_second:9.0f} keystrokes/s")
+                assert not mismatches, "\n".join(mismatches)
+    finally:
+        root.destroy()
+
+
+class _ReferenceConverter(TupleToJsonObjectConverter):
+    """ The JSON converter of earlier versions, which dispatches on the type of every value it converts. Kept for
+    comparison. """
+    def from_json_object(self, object, object_type):
+        if hasattr(object_type, "_name") and object_type._name == "List":
+            return [self.from_json_object(elem, object_type.__dict__["__args__"][0]) for elem in object]
+        elif object_type in [str, int, StenoKeys, bool, float]:
+            return object_type(object)
+        elif object_type is datetime:
+            return datetime.fromisoformat(object)
+        elif object_type is Stroke and isinstance(object[0], str):
+            return Stroke(parse_stroke(object[0]), str(object[1]))
+        elif object_type is Chord and isinstance(object, int):
+            return Chord.from_mask(object)
+        elif object_type in self.tuple_field_types:
+            return object_type(*[self.from_json_object(elem, elem_type)
+                                 for elem, elem_type in zip(object, self.tuple_field_types[object_type])])
+        else:
+            raise RuntimeError(repr(object), repr(object_type))
+
+    def to_json_object(self, object, object_type):
+        if hasattr(object_type, "_name") and object_type._name == "List":
+            return [self.to_json_object(elem, object_type.__dict__["__args__"][0]) for elem in object]
+        elif object_type in [str, int, StenoKeys, bool, float]:
+            return object
+        elif object_type is datetime:
+            return str(object)
+        elif object_type is Stroke and self.compact:
+            return [format_stroke(object.chord_sequence), object.written_word]
+        elif object_type is Chord and self.compact:
+            return Chord(object.keys).mask
+        elif object_type in self.tuple_field_types:
+            return [self.to_json_object(elem, elem_type)
+                    for elem, elem_type in zip(object, self.tuple_field_types[object_type])]
+        else:
+            raise RuntimeError(repr(object), repr(object_type))
+
+
+def benchmark_converter(n_exercises=10000):
+    """ Compares the time to convert a synthetic exercise history to and from JSON-representable form with the
+    converter of earlier versions, which dispatches on the type of every value, and with the converter that compiles a
+    function per type. The converted forms are checked to be identical. """
+    exercise_history = generate_synthetic_exercise_history(n_exercises)
+    for compact in (False, True):
+        results = []
+        for name, converter in (("reference", _ReferenceConverter(compact)),
+                                ("compiled", TupleToJsonObjectConverter(compact))):
+            json_object = converter.to_json_object(exercise_history, List[ExerciseResult])
+            encode_time = _time(converter.to_json_object, exercise_history, List[ExerciseResult])
+            decode_time = _time(converter.from_json_object, json_object, List[ExerciseResult])
+            results.append(json_object)
+            print(f"{'compact' if compact else 'lists':7} {name:9}: encode {encode_time:6.2f} s, "
+                  f"decode {decode_time:6.2f} s ({n_exercises} exercises)")
+        assert results[0] == results[1], "converters disagree"
+
+
+# measures the memory used by the exercise generator in a fresh interpreter, so that measurements are not affected by
+# memory held by the benchmark process. Prints the traced memory retained after startup, the traced peak during startup,
+# and the peak and current resident set size, all in bytes. The resident set sizes are read from /proc, as the maximum
+# resident set size reported by getrusage is inherited from the benchmark process on Linux; they are 0 where /proc is
+# not available.
+_memory_probe = """
+import re, sys, tracemalloc
+tracemalloc.start()
+from exercise_generator import StenoExerciseGenerator
+mode = sys.argv[3]
+if mode == "imports only":
+    generator = None
+elif mode == "full":
+    import json
+    with open(sys.argv[1]) as f:
+        generator = json.load(f)
+elif mode in ("cached", "index"):
+    generator = StenoExerciseGenerator(sys.argv[1], sys.argv[2], use_dictionary_index=mode == "index")
+else:
+    generator = StenoExerciseGenerator(sys.argv[1], sys.argv[2], use_dictionary_cache=False,
+                                       stream_dictionary=mode == "streaming")
+current, peak = tracemalloc.get_traced_memory()
+try:
+    with open("/proc/self/status") as f:
+        status = f.read()
+    peak_rss, rss = (int(re.search(name + r":\\s*(\\d+) kB", status).group(1)) * 1024 for name in ("VmHWM", "VmRSS"))
+except OSError:
+    peak_rss = rss = 0
+print(current, peak, peak_rss, rss)
+"""
+
+
+def benchmark_memory():
+    """ Compares memory usage after startup when holding the full dictionary in memory (as earlier versions did), when
+    loading the dictionary at once, when parsing it incrementally, when loading the compiled cache and when mapping the
+    dictionary index. The memory used by the imported modules alone is included for reference. Checks that the
+    exercise generator retains a small fraction of the memory of the full dictionary, and next to nothing beyond the
+    imported modules when mapping the index, and that only loading the dictionary at once has a high peak RSS. """
+    from steno_dictionary import load_reverse_dictionary, open_dictionary_index
+
+    with tempfile.TemporaryDirectory() as directory:
+        steno_dict_path = write_synthetic_dictionary(directory)
+        log_path = Path(directory, "log.json")
+        # the cache and the index are built up front, so that only loading them is measured.
+        load_reverse_dictionary(steno_dict_path, {word for words in learn_plover_lesson_words.values()
+                                                  for word in words})
+        open_dictionary_index(steno_dict_path).close()
+        retained, peak_rss_of = {}, {}
+        for mode in ("imports only", "full", "json.load", "streaming", "cached", "index"):
+            output = subprocess.run([sys.executable, "-c", _memory_probe, str(steno_dict_path), str(log_path), mode],
+                                    cwd=Path(__file__).parent, check=True, capture_output=True, text=True).stdout
+            current, peak, peak_rss, rss = (int(value) for value in output.split())
+            print(f"{mode:12} retained {current / 2**20:7.2f} MiB, peak {peak / 2**20:7.2f} MiB, "
+                  f"peak RSS {peak_rss / 2**20:7.2f} MiB, RSS {rss / 2**20:7.2f} MiB")
+            retained[mode], peak_rss_of[mode] = current, peak_rss
+    for mode in ("json.load", "streaming", "cached", "index"):
+        assert retained[mode] - retained["imports only"] < (retained["full"] - retained["imports only"]) / 4, \
+            f"{mode} retains more than a quarter of the memory of the full dictionary"
+    assert retained["index"] - retained["imports only"] < 2**20, "the mapped index retains more than 1 MiB"
+    for mode in ("streaming", "cached", "index"):
+        assert peak_rss_of[mode] <= peak_rss_of["json.load"], f"{mode} has a higher peak RSS than json.load"
+
+
+benchmarks = {
+    "startup": benchmark_startup,
+    "memory": benchmark_memory,
+    "record": benchmark_record,
+    "sqlite": benchmark_sqlite,
+    "parse": benchmark_parse,
+    "chords": benchmark_chords,
+    "log_formats": benchmark_log_formats,
+    "converter": benchmark_converter,
+    "sampling": benchmark_sampling,
+    "word_weights": benchmark_word_weights,
+    "difficulty_model": benchmark_difficulty_model,
+    "exercise_switch": benchmark_exercise_switch,
+    "typing_replay": benchmark_typing_replay,
+    "service": benchmark_service,
+    "analytics": benchmark_analytics,
+}
+
+
+def _measure(stage, setup=None, repeat=1):
+    """
+    Runs a stage of the benchmark suite, measuring its time and memory. Memory is measured in a separate run, as tracing
+    allocations slows down the stage considerably.
+
+    :param stage: function running the stage.
+    :param setup: function preparing a run of the stage, returning the arguments to call the stage with. Its time and
+    memory is not accounted for.
+    :param repeat: amount of runs to take the best time of.
+    :return: the time the stage took in seconds and the peak amount of memory it allocated in bytes.
+    """
+    def run():
+        arguments = setup() if setup is not None else ()
+        return _time(stage, *arguments)
+
+    seconds = min(run() for _ in range(repeat))
+    arguments = setup() if setup is not None else ()
+    tracemalloc.start()
+    try:
+        stage(*arguments)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return seconds, peak_bytes
+
+
+def run_suite(n_exercises=1000, n_entries=150000, n_converted_exercises=100000):
+    """
+    Runs the stages of the program that do not need a display on a synthetic Plover dictionary and a synthetic exercise
+    log, measuring the time and peak memory of every stage.
+
+    :param n_exercises: amount of exercises in the exercise log.
+    :param n_entries: amount of entries in the Plover dictionary.
+    :param n_converted_exercises: maximum amount of exercises to convert to and from JSON.
+    :return: a dictionary mapping the names of the stages to their time in seconds and peak memory in bytes.
+    """
+    import steno_keys
+    from exercise_generator import StenoExerciseGenerator
+    from exercise_history import JsonLinesExerciseLog
+    from exercise_log import ExerciseSettings
+    from steno_dictionary import cache_path_for, index_path_for
+    from word_statistics import WordStatistics, word_statistics_modes
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        steno_dict_path = write_synthetic_dictionary(directory, n_entries)
+        log_path = Path(directory, "log.json")
+        JsonLinesExerciseLog(log_path)._rewrite(JsonLinesExerciseLog(log_path)._to_json_line(exercise_result)
+                                                for exercise_result in iter_synthetic_exercise_history(n_exercises))
+
+        def remove_caches():
+            for path in (cache_path_for(steno_dict_path), WordStatistics.path_for(log_path)):
+                if path.exists():
+                    path.unlink()
+            return ()
+
+        results["generator_init_cold"] = _measure(lambda: StenoExerciseGenerator(steno_dict_path, log_path),
+                                                  remove_caches)
+        results["generator_init_warm"] = _measure(lambda: StenoExerciseGenerator(steno_dict_path, log_path),
+                                                  repeat=3)
+
+        exercise_generator = StenoExerciseGenerator(steno_dict_path, log_path)
+        exercise_settings = ExerciseSettings(20, list(learn_plover_lesson_words))
+        word_ids = list(range(len(exercise_generator.word_table)))
+
+        def compute_word_weights():
+            for mode in word_statistics_modes:
+                exercise_generator._compute_word_weights(exercise_settings._replace(word_statistics=mode), word_ids)
+        results["compute_word_weights"] = _measure(compute_word_weights, repeat=3)
+
+        def generate_exercises(exercise_generator=exercise_generator):
+            for _ in range(1000):
+                exercise_generator.generate_exercise(exercise_settings)
+        results["generate_exercise_x1000"] = _measure(generate_exercises, repeat=3)
+
+        # the user interface queries the dictionary through its memory-mapped index instead.
+        def remove_index():
+            for path in (index_path_for(steno_dict_path), WordStatistics.path_for(log_path)):
+                if path.exists():
+                    path.unlink()
+            return ()
+
+        results["generator_init_index_cold"] = _measure(
+            lambda: StenoExerciseGenerator(steno_dict_path, log_path, use_dictionary_index=True), remove_index)
+        results["generator_init_index_warm"] = _measure(
+            lambda: StenoExerciseGenerator(steno_dict_path, log_path, use_dictionary_index=True), repeat=3)
+        index_exercise_generator = StenoExerciseGenerator(steno_dict_path, log_path, use_dictionary_index=True)
+        results["generate_exercise_index_x1000"] = _measure(generate_exercises, lambda: (index_exercise_generator,),
+                                                            repeat=3)
+
+        with open(steno_dict_path) as f:
+            strokes = list(json.load(f))
+
+        def clear_parse_caches():
+            steno_keys.parse_chord.cache_clear()
+            steno_keys._parse_stroke.cache_clear()
+            return ()
+
+        def parse_strokes():
+            for stroke in strokes:
+                try:
+                    parse_stroke(stroke)
+                except ValueError:
+                    pass
+        results["parse_strokes"] = _measure(parse_strokes, clear_parse_caches)
+
+        exercise_history = list(exercise_generator.exercise_history[:n_converted_exercises])
+        json_converter = TupleToJsonObjectConverter()
+        json_object = json_converter.to_json_object(exercise_history, List[ExerciseResult])
+        results["converter_encode"] = _measure(json_converter.to_json_object, lambda: (exercise_history,
+                                                                                       List[ExerciseResult]))
+        results["converter_decode"] = _measure(json_converter.from_json_object, lambda: (json_object,
+                                                                                         List[ExerciseResult]))
+
+        new_exercises = generate_synthetic_exercise_history(200, seed=1)
+
+        def record_exercises(exercises):
+            for exercise_result in exercises:
+                exercise_generator.record_exercise_result(exercise_result)
+        results["record_exercise_x100"] = _measure(record_exercises, iter([(new_exercises[:100],),
+                                                                          (new_exercises[100:],)]).__next__)
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Prints the results of the benchmark suite next to a baseline, flagging stages that got slower or use more memory
+    than the tolerance allows.
+
+    :param results: the results of the benchmark suite, see run_suite.
+    :param baseline: earlier results of the benchmark suite to compare to, or None.
+    :param tolerance: factor by which a stage may be slower or use more memory than the baseline.
+    :return: whether no regressions were found.
+    """
+    no_regressions = True
+    for stage, (seconds, peak_bytes) in results.items():
+        line = f"{stage:30} {seconds * 1000:10.1f} ms {peak_bytes / 2**20:9.2f} MiB"
+        if baseline is not None and stage in baseline:
+            baseline_seconds, baseline_peak_bytes = baseline[stage]
+            time_ratio = seconds / baseline_seconds if baseline_seconds else 1.0
+            memory_ratio = peak_bytes / baseline_peak_bytes if baseline_peak_bytes else 1.0
+            line += f"   baseline x{time_ratio:5.2f} time, x{memory_ratio:5.2f} memory"
+            if time_ratio > tolerance or memory_ratio > tolerance:
+                line += "   REGRESSION"
+                no_regressions = False
+        print(line)
+    return no_regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run, out of: {', '.join(benchmarks)}")
+    parser.add_argument("--suite", action="store_true",
+                        help="run the benchmark suite measuring time and memory per stage, comparing it to a baseline")
+    parser.add_argument("--exercises", type=int, default=1000, help="amount of exercises in the log of the suite")
+    parser.add_argument("--entries", type=int, default=150000, help="amount of dictionary entries of the suite")
+    parser.add_argument("--baselines", type=Path, default=Path("output", "benchmark_baselines.json"),
+                        help="file that baselines of the suite are stored in")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results of the suite as baseline")
+    parser.add_argument("--tolerance", type=float, default=1.25,
+                        help="factor by which a stage may exceed its baseline before it counts as a regression")
+    arguments = parser.parse_args()
+
+    if arguments.suite:
+        try:
+            with open(arguments.baselines) as f:
+                baselines = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            baselines = {}
+        configuration = f"{arguments.exercises} exercises, {arguments.entries} entries"
+        print(f"== suite ({configuration}) ==")
+        suite_results = run_suite(arguments.exercises, arguments.entries)
+        passed = compare_to_baseline(suite_results, baselines.get(configuration), arguments.tolerance)
+        if arguments.save_baseline:
+            baselines[configuration] = suite_results
+            arguments.baselines.parent.mkdir(parents=True, exist_ok=True)
+            with open(arguments.baselines, "w") as f:
+                json.dump(baselines, f, indent=2)
+        sys.exit(0 if passed else 1)
+
+    for name in arguments.names:
+        if name not in benchmarks:
+            parser.error(f"unknown benchmark {name!r}")
+    skipped = []
+    for name in arguments.names or benchmarks:
+        print(f"== {name} ==")
+        if benchmarks[name]() is False:
+            skipped.append(name)
+    skipped_names = [name for name in skipped if name in arguments.names]
+    if skipped_names:
+        sys.exit(f"Benchmarks that need a display were skipped: {', '.join(skipped_names)}")
@@ -0,0 +1,127 @@
+from array import array
+from steno_keys import StenoKeys
+import math
+
+
+# a chord is split into the keys of the left and the right half of the keyboard, see KeyDifficultyModel.
+_n_keys = len(StenoKeys.__members__)
+_n_low_keys = _n_keys // 2
+_low_mask = (1 << _n_low_keys) - 1
+
+
+class KeyDifficultyModel:
+    """
+    Estimates the time it takes the user to type words from the keys of their chords, so that words that were never
+    typed (or only a few times) are weighed by how hard their keys are for the user rather than all alike.
+
+    Every chord a typed word consists of is accounted the mean typing time of the word divided by the amount of its
+    chords, and the difficulty of a key is the mean of the times accounted to the chords it occurs in. The
+    estimated time of a chord is the mean difficulty of its keys, and that of a word the sum over its chords. Keys that
+    were never typed get the mean time of all chords.
+
+    A chord is a 22-bit mask of keys, and the sum of the difficulties of its keys is a product of that binary feature
+    vector with the vector of key difficulties. Rather than computing the product key by key, the sums (and counts) of
+    the difficulties of every combination of keys of either half of the keyboard are tabulated whenever the model is
+    fitted, so that scoring a chord takes two lookups per table.
+    """
+    def __init__(self, word_chord_masks, prior_strength=1.0):
+        """
+        :param word_chord_masks: list of the chords of every word, indexed by word ID (see word_table.py), each as a
+        tuple of masks of keys (see Chord.mask). Words with an ID beyond the list, or with no chords, are not modeled.
+        :param prior_strength: amount of typing times the estimate of a word counts as when blending it with the
+        typing times of the word, see blend. Must be positive and finite.
+        """
+        if not 0 < prior_strength < math.inf:
+            raise ValueError(f"Prior strength must be positive and finite, got {prior_strength}")
+        self.word_chord_masks = word_chord_masks
+        self.prior_strength = prior_strength
+        # difficulty of every key, or None if the model has not been fitted to any typed words.
+        self.key_difficulties = None
+        self._low_sums = self._high_sums = self._low_counts = self._high_counts = None
+
+    def fit(self, word_ids, mean_typing_times):
+        """
+        Learns the difficulty of every key from the typing times of typed words.
+
+        :param word_ids: IDs of the typed words.
+        :param mean_typing_times: the mean typing times of the typed words, in the same order as their IDs.
+        """
+        key_sums = [0.0] * _n_keys
+        key_counts = [0] * _n_keys
+        chord_sum, chord_count = 0.0, 0
+        word_chord_masks, n_modeled_words = self.word_chord_masks, len(self.word_chord_masks)
+        for word_id, mean_typing_time in zip(word_ids, mean_typing_times):
+            chord_masks = word_chord_masks[word_id] if word_id < n_modeled_words else ()
+            if not chord_masks:
+                continue
+            chord_time = mean_typing_time / len(chord_masks)
+            for mask in chord_masks:
+                chord_sum += chord_time
+                chord_count += 1
+                while mask:
+                    lowest_bit = mask & -mask
+                    key = lowest_bit.bit_length() - 1
+                    key_sums[key] += chord_time
+                    key_counts[key] += 1
+                    mask ^= lowest_bit
+        if chord_count == 0:
+            self.key_difficulties = None
+            return
+        mean_chord_time = chord_sum / chord_count
+        self.key_difficulties = array("d", [key_sum / key_count if key_count else mean_chord_time
+                                            for key_sum, key_count in zip(key_sums, key_counts)])
+        self._low_sums, self._low_counts = self._tabulate(self.key_difficulties[:_n_low_keys])
+        self._high_sums, self._high_counts = self._tabulate(self.key_difficulties[_n_low_keys:])
+
+    @staticmethod
+    def _tabulate(difficulties):
+        """ Returns the sum of the difficulties and the amount of keys for every combination of the given keys, indexed
+        by the mask of the combination. Every table is built from the table of half the size. """
+        sums, counts = array("d", [0.0]), array("l", [0])
+        for difficulty in difficulties:
+            sums.extend(array("d", [key_sum + difficulty for key_sum in sums]))
+            counts.extend(array("l", [count + 1 for count in counts]))
+        return sums, counts
+
+    def score(self, word_ids, default_weight):
+        """
+        Estimates the time it takes to type words.
+
+        :param word_ids: IDs of the words.
+        :param default_weight: estimate for words that are not modeled, and for all words if the model has not been
+        fitted to any typed words.
+        :return: an array of the estimates, in the same order as the IDs.
+        """
+        if self.key_difficulties is None:
+            return array("d", [default_weight]) * len(word_ids)
+        low_sums, high_sums, low_counts, high_counts = self._low_sums, self._high_sums, self._low_counts, \
+            self._high_counts
+        word_chord_masks, n_modeled_words = self.word_chord_masks, len(self.word_chord_masks)
+        estimates = []
+        for word_id in word_ids:
+            estimate = 0.0
+            for mask in word_chord_masks[word_id] if word_id < n_modeled_words else ():
+                low, high = mask & _low_mask, mask >> _n_low_keys
+                estimate += (low_sums[low] + high_sums[high]) / (low_counts[low] + high_counts[high])
+            estimates.append(estimate or default_weight)
+        return array("d", estimates)
+
+    def blend(self, estimates, weights, counts, mean_weights=False):
+        """
+        Blends the estimates of the model with the weights of words from their typing times. A weight is the reciprocal
+        of the sum of the reciprocals of the typing times of a word, or their harmonic mean (see WordStatistics), to
+        which the estimate is added as prior_strength more typing times. Words that were never typed thus get a weight
+        following from the estimate alone, and the more often a word is typed, the less the estimate matters.
+
+        :param estimates: the estimates of the model (see score).
+        :param weights: the weights of the words from their typing times, which are ignored for words never typed.
+        :param counts: the amount of typing times behind the weight of every word.
+        :param mean_weights: whether the weights are harmonic means rather than reciprocals of sums.
+        :return: an array of the blended weights, in the same order.
+        """
+        prior_strength = self.prior_strength
+        if mean_weights:
+            return array("d", [(count + prior_strength) / (count / weight + prior_strength / estimate) if count
+                               else estimate for estimate, weight, count in zip(estimates, weights, counts)])
+        return array("d", [1 / (1 / weight + prior_strength / estimate) if count else estimate / prior_strength
+                           for estimate, weight, count in zip(estimates, weights, counts)])
@@ -1,13 +1,18 @@
 
 
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from random import Random
-from steno_keys import StenoKeys, Stroke, Chord
-from exercise_log import TupleToJsonObjectConverter, ExerciseResult
-from typing import List
+from steno_keys import Stroke
+from exercise_log import TupleToJsonObjectConverter
+from exercise_history import JsonLinesExerciseLog, SqliteExerciseLog
+from steno_dictionary import load_reverse_dictionary, open_dictionary_index
+from word_statistics import WordStatistics
+from word_table import WordTable
+from weighted_sampler import AliasSampler
+from difficulty_model import KeyDifficultyModel
 from pathlib import Path
-from learn_plover import learn_plover_lesson_words
-import json
+from learn_plover import learn_plover_lessons, learn_plover_lesson_words
+import time
 
 
 class StenoExerciseGenerator:
@@ -16,69 +21,214 @@ class StenoExerciseGenerator:
     also keeps a log of completed exercises in a file. """
     def __init__(self,
                  steno_dict_path,
-                 user_log_path):
+                 user_log_path,
+                 use_dictionary_cache=True,
+                 lessons=None,
+                 stream_dictionary=False,
+                 history_backend="json",
+                 compact_log=False,
+                 writer=None,
+                 read_only=False,
+                 seed=None,
+                 reverse_dict=None,
+                 use_dictionary_index=False,
+                 use_difficulty_model=True,
+                 statistics_save_interval=60.0,
+                 difficulty_model_refit_interval=10):
         """
         :param steno_dict_path: path to the Plover stenography dictionary (in JSON format).
         :param user_log_path: path to the user log, where results from previous exercise sessions are stored
         (will be created if it does not already exist).
+        :param use_dictionary_cache: whether to keep a compiled cache of the dictionary next to it, which makes later
+        startups considerably faster.
+        :param lessons: the "Learn Plover" lessons that exercises may be generated from, or None for all of them. Only
+        words of these lessons are kept in memory.
+        :param stream_dictionary: whether to parse the dictionary incrementally rather than loading it all at once,
+        which greatly reduces peak memory usage when the compiled cache needs to be (re)built.
+        :param history_backend: how the user log is stored, either "json" for a JSON Lines file that is kept in memory,
+        or "sqlite" for an SQLite database that is queried as needed. A JSON log is compressed if its name ends with
+        ".gz" or ".xz".
+        :param compact_log: whether to write strokes to a JSON log in their compact, written form.
+        :param writer: background writer (see background_writer.py) that writes to the JSON log and the statistics of
+        typing times are handed to, or None to write them right away. An SQLite log is always written right away.
+        :param read_only: whether to leave the user log and the statistics of typing times saved next to it untouched,
+        for generating exercises without recording any. The user log must then exist if it is an SQLite database.
+        :param seed: seed for choosing words, so that the same exercises are generated every time, or None for a random
+        seed.
+        :param reverse_dict: the reverse dictionary of the lesson words, as loaded by load_reverse_dictionary, to share
+        it among generators (it is never changed), or None to load it from the dictionary.
+        :param use_dictionary_index: whether to query the dictionary through a memory-mapped index kept next to it (see
+        steno_dictionary.DictionaryIndex) instead of loading the strokes of all lesson words into memory. The pages of
+        the index are shared by all processes using the same dictionary. The compiled cache is not used then.
+        :param use_difficulty_model: whether to weigh words that were typed rarely or never by how hard their keys are
+        for the user (see difficulty_model.py), rather than by a default weight.
+        :param statistics_save_interval: minimum time in seconds between saving the statistics of typing times as
+        exercises are recorded, as saving rewrites them in full. Statistics that were not saved yet are saved by close,
+        and are recomputed from the user log on the next startup if the program exits without calling it.
+        :param difficulty_model_refit_interval: amount of exercises to record before the difficulty model is fitted
+        anew to the typing times of all typed words, whose key difficulties hardly change with a single exercise.
         """
 
-        with open(steno_dict_path, "r") as f:
-            self.steno_dict = json.load(f)
+        # mapping of words in the "Learn Plover" lessons to the (parsed) strokes that can be used to type them.
+        self.indexed_lessons = frozenset(learn_plover_lesson_words if lessons is None else lessons)
+        lesson_words = {word for lesson in self.indexed_lessons for word in learn_plover_lesson_words[lesson]}
+        if reverse_dict is None and use_dictionary_index:
+            reverse_dict = open_dictionary_index(steno_dict_path, stream_dictionary)
+        elif reverse_dict is None:
+            reverse_dict = load_reverse_dictionary(steno_dict_path, lesson_words, use_dictionary_cache,
+                                                   stream_dictionary)
+        self.reverse_dict = reverse_dict
 
-        self.reverse_dict = defaultdict(list)
-        for chord, word in self.steno_dict.items():
-            if not any(letter in "012345789" for letter in chord):
-                self.reverse_dict[word].append(chord)
+        # every lesson word is assigned an ID, and lessons are kept as arrays of the IDs of their words, so that the
+        # statistics of the words in a lesson can be looked up by index.
+        self.word_table = WordTable()
+        self._lesson_word_ids = {lesson: self.word_table.intern_all(learn_plover_lesson_words[lesson])
+                                 for lesson in learn_plover_lessons if lesson in self.indexed_lessons}
+        # the model of the difficulty of words is only created when weights are first computed, so that looking up the
+        # strokes of all lesson words does not hold up startup.
+        self._use_difficulty_model = use_difficulty_model
+        self._difficulty_model = None
+        # the model is fitted for the statistics of typing times and the way of weighing words it was last fitted for,
+        # and refitted when either changes or enough exercises were recorded since. The estimates of the model for the
+        # words last weighed are kept along with the IDs of the words until it is refitted.
+        self.difficulty_model_refit_interval = difficulty_model_refit_interval
+        self._difficulty_model_key = None
+        self._n_exercises_since_fit = 0
+        self._difficulty_estimates = None
 
         self.user_log_path = Path(user_log_path)
-        self._json_converter = TupleToJsonObjectConverter()
+        self._json_converter = TupleToJsonObjectConverter(compact=compact_log)
+        if history_backend == "json":
+            self.exercise_history = JsonLinesExerciseLog(self.user_log_path, self._json_converter, writer, read_only)
+        elif history_backend == "sqlite":
+            self.exercise_history = SqliteExerciseLog(self.user_log_path, read_only)
+        else:
+            raise ValueError(f"Unknown history backend {history_backend!r}")
 
-        try:
-            with open(self.user_log_path, "r") as f:
-                self.exercise_history = self._json_converter.from_json_object(json.load(f), List[ExerciseResult])
-        except (json.JSONDecodeError, IOError):
-            self.exercise_history = []
+        # statistics of typing times are kept up to date as exercises are recorded, and are only recomputed from the
+        # history when they do not match it (e.g. if the program crashed between writing the log and the statistics).
+        self._writer = writer
+        self.read_only = read_only
+        self.statistics_save_interval = statistics_save_interval
+        self._last_statistics_save = time.monotonic()
+        self._unsaved_word_statistics = False
+        self._word_statistics_path = WordStatistics.path_for(self.user_log_path)
+        saved_word_statistics = WordStatistics.load(self._word_statistics_path, self.word_table)
+        if saved_word_statistics is not None and saved_word_statistics.matches_history(self.exercise_history):
+            self._word_statistics = saved_word_statistics
+        else:
+            self._word_statistics = WordStatistics.from_history(self.exercise_history, word_table=self.word_table)
+            self._save_word_statistics()
+
+        # the sampler of words is built for a selection of lessons and the word weights at a version of the statistics,
+        # which is bumped whenever the statistics change, and is reused for as long as neither changes.
+        self._statistics_version = 0
+        self._sampler_key = None
+        self._sampler = None
+        self._random = Random(seed)
 
     def clear_exercise_history(self):
         """ Clears the entire exercise history. """
         self.exercise_history.clear()
-        self._save_exercise_history()
-
-    def _save_exercise_history(self):
-        """ Internal method to save the exercise history to a file, invoked every time the history has changed. """
-        self.user_log_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(self.user_log_path, "w") as f:
-            json.dump(self._json_converter.to_json_object(self.exercise_history, List[ExerciseResult]), f)
+        self._word_statistics = WordStatistics(self._word_statistics.window, self._word_statistics.half_life,
+                                               word_table=self.word_table)
+        self._save_word_statistics()
+        self._statistics_version += 1
 
     def record_exercise_result(self, exercise_result):
         """
-        Records the given exercise result, saving it into the log of completed exercises.
+        Records the given exercise result, appending it to the log of completed exercises.
 
         :param exercise_result: the exercise result to record.
         """
         self.exercise_history.append(exercise_result)
-        self._save_exercise_history()
-
-    def _compute_word_weights(self):
-        """ Internal method used to compute a dictionary of (harmonic) mean typing time for words that have been typed
-        in previous exercises. Words that once were typed incorrectly are not accounted for, due to difficulties in
-        determining how long time it took to type it correctly. The mean typing time is then used to present words the
-        user has difficulty typing more frequently. """
-        typing_times_by_word = defaultdict(list)
-
-        # create a mapping of typing times by word
-        for historical_exercise in self.exercise_history:
-            for word in historical_exercise.words[1:]:
-                if word.is_typed_correctly:
-                    typing_times_by_word[word.stroke.written_word].append(word.typing_time)
-
-        # compute the weight of a word by the harmonic mean of its typing time. The harmonic mean has the property of
-        # aggravating the impact of small values and reducing the impact of larger values - so if the user generally
-        # types a word quickly, a single data point where the typing went slow wont have much of an impact.
-        weight_by_word = {word: 1/sum(1/typing_time for typing_time in typing_times)
-                          for word, typing_times in typing_times_by_word.items()}
-        return weight_by_word
+        self._word_statistics.add_exercise(exercise_result)
+        self._statistics_version += 1
+        self._n_exercises_since_fit += 1
+        # the statistics only need to be saved now and then, as they are recomputed from the log if they fall behind.
+        self._unsaved_word_statistics = True
+        if time.monotonic() - self._last_statistics_save >= self.statistics_save_interval:
+            self._save_word_statistics()
+
+    def close(self):
+        """ Saves the statistics of typing times if exercises were recorded since they were last saved. The generator
+        may still be used afterwards. """
+        if self._unsaved_word_statistics:
+            self._save_word_statistics()
+
+    def _save_word_statistics(self):
+        """ Internal method saving the statistics of typing times next to the user log, unless it is read-only. """
+        if not self.read_only:
+            self._word_statistics.save(self._word_statistics_path, self._writer)
+        self._last_statistics_save = time.monotonic()
+        self._unsaved_word_statistics = False
+
+    def _compute_word_weights(self, exercise_settings, word_ids):
+        """ Internal method used to compute the (harmonic) mean typing time of the given words, or a default weight for
+        words that have not been typed in previous exercises. Words that once were typed incorrectly are not accounted
+        for, due to difficulties in determining how long time it took to type it correctly. The mean typing time is
+        then used to present words the user has difficulty typing more frequently. Depending on the settings, the mean
+        is taken over all typing times, the most recent ones, or with older typing times having less influence. With
+        the difficulty model, the weight of words that were typed rarely or never is estimated from the difficulty of
+        their keys instead, which is learned from the mean typing times of all typed words every few exercises. """
+        default_weight = 0.5
+        self._update_word_statistics_settings(exercise_settings)
+        word_statistics = self._word_statistics
+        weights = word_statistics.weights(exercise_settings, word_ids, default_weight)
+        if not self._use_difficulty_model:
+            return weights
+        if self._difficulty_model is None:
+            # the model knows the chords of the words, in the way they are shown.
+            self._difficulty_model = KeyDifficultyModel(
+                [tuple(chord.mask for chord in self.reverse_dict[word][0] if chord.mask) if word in self.reverse_dict
+                 else () for word in self.word_table.words])
+        difficulty_model_key = (word_statistics, exercise_settings.word_statistics)
+        if difficulty_model_key != self._difficulty_model_key or \
+                self._n_exercises_since_fit >= self.difficulty_model_refit_interval:
+            modeled_word_ids = range(len(self._difficulty_model.word_chord_masks))
+            modeled_counts = word_statistics.typing_time_counts(exercise_settings, modeled_word_ids)
+            typed_word_ids = [word_id for word_id in modeled_word_ids if modeled_counts[word_id]]
+            # the model is fitted to mean typing times, which unlike weights do not depend on how often words were
+            # typed.
+            self._difficulty_model.fit(typed_word_ids,
+                                       word_statistics.mean_typing_times(exercise_settings, typed_word_ids))
+            self._difficulty_model_key = difficulty_model_key
+            self._n_exercises_since_fit = 0
+            self._difficulty_estimates = None
+        if self._difficulty_estimates is None or self._difficulty_estimates[0] != word_ids:
+            self._difficulty_estimates = list(word_ids), self._difficulty_model.score(word_ids, default_weight)
+        # decayed weights are harmonic means, the others reciprocals of sums of reciprocals (see WordStatistics).
+        return self._difficulty_model.blend(self._difficulty_estimates[1], weights,
+                                            word_statistics.typing_time_counts(exercise_settings, word_ids),
+                                            exercise_settings.word_statistics == "decay")
+
+    def _update_word_statistics_settings(self, exercise_settings):
+        """ Internal method recomputing the statistics of typing times if they are not kept with the window or half
+        life that the given settings ask for. """
+        if not self._word_statistics.matches_settings(exercise_settings):
+            # the window or half life has changed, which requires replaying the history once.
+            self._word_statistics = WordStatistics.from_history(self.exercise_history,
+                                                                exercise_settings.statistics_window,
+                                                                exercise_settings.statistics_half_life,
+                                                                self.word_table)
+            self._save_word_statistics()
+            self._statistics_version += 1
+
+    def _word_sampler(self, exercise_settings):
+        """ Internal method returning a sampler drawing the IDs of words from the enabled lessons, weighted by how slow
+        the user is at typing them. Words occurring in several lessons are only included once, so that they are not
+        drawn more often than other words. The sampler is only rebuilt when the enabled lessons, the way of weighing
+        words or the statistics have changed. """
+        self._update_word_statistics_settings(exercise_settings)
+        sampler_key = (tuple(exercise_settings.enabled_lessons), exercise_settings.word_statistics,
+                       self._statistics_version)
+        if sampler_key != self._sampler_key:
+            word_ids_to_include = list(dict.fromkeys(word_id for lesson in exercise_settings.enabled_lessons
+                                                     for word_id in self._lesson_word_ids[lesson]))
+            self._sampler = AliasSampler(word_ids_to_include,
+                                         self._compute_word_weights(exercise_settings, word_ids_to_include))
+            self._sampler_key = sampler_key
+        return self._sampler
 
     def generate_exercise(self, exercise_settings):
         """
@@ -90,38 +240,92 @@ class StenoExerciseGenerator:
         :return: a list of strokes.
         """
         exercise_length = exercise_settings.exercise_size
-        words_to_include = []
-        for lesson in exercise_settings.enabled_lessons:
-            words_to_include += learn_plover_lesson_words[lesson]
-
-        random = Random()
-        word_weights = self._compute_word_weights()
-        weights_of_words_to_include = [word_weights.get(word, 0.5) for word in words_to_include]
-        random_words = random.choices(words_to_include, weights_of_words_to_include, k=exercise_length)
-        # random_words = words_to_include  # just for testing chord parsing
-
-        def parse_chords(stroke):
-            """ Parses a stroke in the plover dictionary. A stroke consists of multiple chords separated by "/". Every
-            chord consists of a sequence of letters in "Steno Order" (look it up in the Learn Plover series),
-            optionally including a "-" to indicate separation between the left and right half of the stenography
-            keyboard. """
-            chords = []
-            for chord in stroke.split("/"):
-                min_order = -1
-                keys = set()
-                for letter in chord:
-                    if letter == "-":
-                        min_order = StenoKeys.STAR
-                    else:
-                        matching_key = None
-                        for key in StenoKeys.__members__.values():
-                            if key.letter == letter and key.order > min_order and \
-                                    (matching_key is None or matching_key.order > key.order):
-                                matching_key = key
-                        assert matching_key is not None, stroke
-                        min_order = matching_key.order
-                        keys.add(matching_key)
-                chords.append(Chord(keys))
-            return chords
-
-        return [Stroke(parse_chords(self.reverse_dict[word][0]), word) for word in random_words]
+        missing_lessons = set(exercise_settings.enabled_lessons) - self.indexed_lessons
+        if missing_lessons:
+            raise ValueError(f"Lessons not loaded by the exercise generator: {sorted(missing_lessons)}")
+        random_word_ids = self._word_sampler(exercise_settings).sample(self._random, exercise_length)
+
+        words = self.word_table.words
+        return [Stroke(self.reverse_dict[words[word_id]][0], words[word_id]) for word_id in random_word_ids]
+
+
+class BackgroundExerciseGenerator:
+    """ Runs an exercise generator on a worker thread, so that the thread showing exercises does not wait for them to
+    be generated or recorded. The next exercise is generated as soon as the current one is handed out, while the user
+    is typing, and is discarded if the settings change or the history is cleared in the meantime. Exercises are thus
+    generated before the result of the exercise preceding them has been recorded, so the weights of words lag behind by
+    one exercise. All calls to the wrapped generator are made on the same worker thread, in the order they were asked
+    for, so the generator itself needs no locking. """
+    def __init__(self, exercise_generator):
+        """
+        :param exercise_generator: the exercise generator to run on the worker thread. It must not be used directly
+        while it is in use by this class.
+        """
+        self.exercise_generator = exercise_generator
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="exercise-generator")
+        # the settings the next exercise is being generated with, and the future of that exercise.
+        self._next_exercise_settings = None
+        self._next_exercise = None
+        # the future of the last exercise result to be recorded, which is checked for errors later on.
+        self._last_recording = None
+
+    def _check_last_recording(self, wait=False):
+        """ Raises the error that occurred while recording the last exercise result, if any. """
+        if self._last_recording is not None and (wait or self._last_recording.done()):
+            last_recording, self._last_recording = self._last_recording, None
+            last_recording.result()
+
+    def _discard_next_exercise(self):
+        """ Discards the exercise that is being generated in advance, if any. """
+        if self._next_exercise is not None:
+            self._next_exercise.cancel()
+        self._next_exercise_settings = self._next_exercise = None
+
+    def generate_exercise(self, exercise_settings):
+        """
+        Returns a new exercise with the given settings, which is usually generated already, and starts generating the
+        next one with the same settings.
+
+        :param exercise_settings: settings for the exercise.
+        :return: a list of strokes.
+        """
+        self._check_last_recording()
+        if self._next_exercise_settings != exercise_settings:
+            self._discard_next_exercise()
+        next_exercise = self._next_exercise
+        if next_exercise is None:
+            next_exercise = self._executor.submit(self.exercise_generator.generate_exercise, exercise_settings)
+        # an error is raised here (and no next exercise is generated) if the exercise could not be generated, e.g.
+        # because the settings are invalid.
+        try:
+            exercise = next_exercise.result()
+        except BaseException:
+            self._discard_next_exercise()
+            raise
+        self._next_exercise_settings = exercise_settings
+        self._next_exercise = self._executor.submit(self.exercise_generator.generate_exercise, exercise_settings)
+        return exercise
+
+    def record_exercise_result(self, exercise_result):
+        """
+        Records the given exercise result on the worker thread. An error while recording it is raised by a later call.
+
+        :param exercise_result: the exercise result to record.
+        """
+        self._check_last_recording()
+        self._last_recording = self._executor.submit(self.exercise_generator.record_exercise_result, exercise_result)
+
+    def clear_exercise_history(self):
+        """ Clears the entire exercise history, discarding the exercise generated in advance from the old history. """
+        self._discard_next_exercise()
+        self._executor.submit(self.exercise_generator.clear_exercise_history).result()
+        self._last_recording = None
+
+    def shutdown(self):
+        """ Waits for pending exercise results to be recorded, closes the exercise generator and stops the worker
+        thread. """
+        self._discard_next_exercise()
+        closing = self._executor.submit(self.exercise_generator.close)
+        self._executor.shutdown(wait=True)
+        self._check_last_recording(wait=True)
+        closing.result()
@@ -0,0 +1,568 @@
+from exercise_log import TupleToJsonObjectConverter, ExerciseResult, ExerciseWordResult
+from steno_keys import Stroke, parse_stroke, format_stroke
+from collections.abc import Sequence
+from datetime import datetime
+from typing import List
+from pathlib import Path
+from itertools import chain, groupby, islice
+import argparse
+import gzip
+import io
+import json
+import lzma
+import os
+import re
+import sqlite3
+import zlib
+
+
+# matches the beginning of a log written by earlier versions, a list of exercises, which are themselves lists. Records
+# of a JSON Lines log begin with a timestamp instead.
+_list_log_pattern = re.compile(r"\s*\[\s*([\[\]]|$)")
+
+# functions opening compressed log files, by the suffix of their name.
+_compressed_openers = {".gz": gzip.open, ".xz": lzma.open}
+
+# amount of characters of records appended to a compressed log that are kept in its pending file (see
+# pending_log_path) before they are compressed into the log together.
+compression_batch_size = 1 << 20
+
+
+class _ConcatenatedFile(io.RawIOBase):
+    """ Binary file reading the contents of several files one after another. """
+    def __init__(self, files):
+        self._files = files
+        self._index = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._index < len(self._files):
+            n_read = self._files[self._index].readinto(buffer)
+            if n_read:
+                return n_read
+            self._index += 1
+        return 0
+
+    def close(self):
+        for file in self._files:
+            file.close()
+        super().close()
+
+
+def open_log_file(path, mode, include_pending=True):
+    """
+    Opens a JSON log file in text mode, transparently (de)compressing it when its name ends with ".gz" (gzip) or ".xz"
+    (lzma). Records appended to a compressed log are first kept uncompressed in a pending file, see pending_log_path.
+
+    :param path: path to the log file.
+    :param mode: mode to open the file in, for example "rt".
+    :param include_pending: whether reading a compressed log also reads the records in its pending file, which follow
+    the records in the log itself.
+    :return: the opened file.
+    """
+    path = Path(path)
+    if path.suffix not in _compressed_openers:
+        return open(path, mode, encoding="utf-8")
+    pending_path = pending_log_path(path)
+    if "r" not in mode or not include_pending or not pending_path.exists():
+        return _compressed_openers[path.suffix](path, mode, encoding="utf-8")
+    files = [_compressed_openers[path.suffix](path, "rb")] if path.exists() else []
+    files.append(open(pending_path, "rb"))
+    return io.TextIOWrapper(io.BufferedReader(_ConcatenatedFile(files)), encoding="utf-8")
+
+
+def is_compressed_log(path):
+    """
+    :param path: path to a JSON log file.
+    :return: whether the log file is compressed, see open_log_file.
+    """
+    return Path(path).suffix in _compressed_openers
+
+
+def pending_log_path(path):
+    """
+    Compressing every record appended to a compressed log on its own would add a compressed stream to the log for
+    every exercise, which compresses poorly. Appended records are therefore written uncompressed to a pending file next
+    to the log, and only compressed into the log once there are enough of them (see compression_batch_size).
+
+    :param path: path to a compressed JSON log file.
+    :return: path to the pending file of the log.
+    """
+    path = Path(path)
+    return path.with_name(path.name + ".pending")
+
+
+def is_list_log(first_line):
+    """
+    :param first_line: the first line of a JSON log file.
+    :return: whether the log is in the format of earlier versions, a single JSON list of all exercises, rather than in
+    the JSON Lines format.
+    """
+    return _list_log_pattern.match(first_line) is not None
+
+
+class JsonLinesExerciseLog(Sequence):
+    """
+    Log of completed exercises stored in a file with one JSON record per line (JSON Lines), each record being an
+    ExerciseResult as converted by TupleToJsonObjectConverter. Recording an exercise only appends a line to the file,
+    so the cost of recording does not grow with the size of the log. Logs written by earlier versions, a single JSON
+    list of all exercises, are migrated automatically when loaded. The log may be compressed, see open_log_file and
+    pending_log_path.
+
+    The exercises are also kept in memory, and the log can be used as a sequence of exercise results. Records are only
+    converted into exercise results when they are first accessed, so opening a large log is quick.
+    """
+    def __init__(self, path, json_converter=None, writer=None, read_only=False):
+        """
+        :param path: path to the log file (will be created if it does not already exist).
+        :param json_converter: converter used to convert exercise results to and from JSON. Its compact mode decides
+        how new records are written.
+        :param writer: background writer (see background_writer.py) that changes to the log file are handed to, or None
+        to write them right away.
+        :param read_only: whether to leave the log file untouched, in which case it is neither repaired nor migrated
+        when loaded, and exercises cannot be appended to it.
+        """
+        self.path = Path(path)
+        self._json_converter = json_converter or TupleToJsonObjectConverter()
+        self._writer = writer
+        self.read_only = read_only
+        # lines in the pending file of a compressed log, see pending_log_path.
+        self._pending_lines = []
+        # records of the log, either as read from JSON or, once accessed, converted to exercise results.
+        self._records = self._load_records()
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._records)))]
+        record = self._records[index]
+        if not isinstance(record, ExerciseResult):
+            record = self._records[index] = self._from_json_object(record)
+        return record
+
+    def __iter__(self):
+        for i in range(len(self._records)):
+            yield self[i]
+
+    def _load_records(self):
+        """
+        Reads all records in the log, migrating it from the list-shaped format of earlier versions if needed. A
+        record that was only partially written, for example due to a crash, is removed from the log.
+
+        :return: a list of the records in the log as read from JSON, in the order they were recorded.
+        """
+        lines, damaged = _read_lines(self.path)
+        if lines and is_list_log(lines[0]):
+            return self._migrate_list_log("".join(lines))
+
+        last_path = self.path
+        if is_compressed_log(self.path):
+            pending_path = pending_log_path(self.path)
+            self._pending_lines, _ = _read_lines(pending_path)
+            if self._pending_lines and self._pending_lines[0] in lines:
+                # the pending records were compressed into the log, but the log was closed before the pending file
+                # was emptied. The records are only kept once.
+                compressed_lines = set(lines)
+                self._pending_lines = [line for line in self._pending_lines if line not in compressed_lines]
+                if not self.read_only:
+                    self._replace_file(pending_path, "".join(self._pending_lines))
+            if self._pending_lines:
+                last_path = pending_path
+            if lines and not lines[-1].endswith("\n"):
+                damaged = True  # the log is only ever appended to in whole lines
+
+        records = []
+        for line in chain(lines, self._pending_lines):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # blank or corrupt records are skipped, so a single bad record does not lose the history
+            if is_exercise_record(record):
+                records.append(record)
+
+        last_lines = self._pending_lines or lines
+        if damaged and not self.read_only:
+            # a compressed stream was cut off, for example due to a crash while compressing records into the log.
+            self._rewrite(json.dumps(record) + "\n" for record in records)
+        elif last_lines and not last_lines[-1].endswith("\n") and not self.read_only:
+            # the last record was not completely written, for example due to a crash during an append. The record is
+            # removed (or completed, if only the line break is missing) so that the next record starts on a new line.
+            try:
+                json.loads(last_lines[-1])
+                self._append_raw("\n")
+            except json.JSONDecodeError:
+                with open(last_path, "r+b") as f:
+                    f.truncate(os.path.getsize(last_path) - len(last_lines.pop().encode("utf-8")))
+        return records
+
+    def append(self, exercise_result):
+        """
+        Appends an exercise to the log.
+
+        :param exercise_result: the exercise result to record.
+        """
+        self._check_writable()
+        self._records.append(exercise_result)
+        self._append_raw(self._to_json_line(exercise_result))
+
+    def clear(self):
+        """ Removes all exercises from the log. """
+        self._check_writable()
+        self._records.clear()
+        self._rewrite([])
+
+    def typing_time_statistics(self):
+        """
+        Computes statistics of the time it took to type words, for words that were typed correctly. The first word of
+        an exercise is not accounted for, as there is no telling when the user began typing it.
+
+        :return: a dictionary mapping words to the amount of times they were typed and the sum of the reciprocals of
+        their typing times.
+        """
+        statistics = {}
+        for historical_exercise in self:
+            for word in historical_exercise.words[1:]:
+                if word.is_typed_correctly:
+                    count, reciprocal_sum = statistics.get(word.stroke.written_word, (0, 0.0))
+                    statistics[word.stroke.written_word] = count + 1, reciprocal_sum + 1 / word.typing_time
+        return statistics
+
+    def iter_typing_times(self):
+        """
+        :return: an iterator over (timestamp, word, typing time) for the words that were typed correctly (excluding the
+        first word of every exercise), in the order they were recorded.
+        """
+        for historical_exercise in self:
+            for word in historical_exercise.words[1:]:
+                if word.is_typed_correctly:
+                    yield historical_exercise.timestamp, word.stroke.written_word, word.typing_time
+
+    def typing_times(self, word):
+        """
+        :param word: the word to look up.
+        :return: the times it took to type the given word, in the order they were recorded, for the occurrences where
+        it was typed correctly (excluding the first word of every exercise).
+        """
+        return [word_result.typing_time
+                for historical_exercise in self
+                for word_result in historical_exercise.words[1:]
+                if word_result.is_typed_correctly and word_result.stroke.written_word == word]
+
+    def _check_writable(self):
+        """ Raises an error if the log is read-only. """
+        if self.read_only:
+            raise RuntimeError(f"Cannot change the read-only exercise log {self.path}")
+
+    def _append_raw(self, text):
+        """ Appends the given text to the end of the log. Text appended to a compressed log is written to its pending
+        file, and compressed into the log once the pending file holds enough of it (see pending_log_path). """
+        if not is_compressed_log(self.path):
+            self._append_to_file(self.path, text)
+            return
+        self._pending_lines.append(text)
+        if sum(map(len, self._pending_lines)) < compression_batch_size:
+            self._append_to_file(pending_log_path(self.path), text)
+            return
+        # the records are compressed into the log before the pending file is emptied, so that a crash in between keeps
+        # them in both files rather than in neither (see _load_records).
+        self._append_to_file(self.path, "".join(self._pending_lines))
+        self._pending_lines.clear()
+        self._replace_file(pending_log_path(self.path), "")
+
+    def _rewrite(self, lines):
+        """ Replaces the contents of the log with the given lines, compressing all of them if the log is compressed. """
+        self._replace_file(self.path, "".join(lines))
+        pending_path = pending_log_path(self.path)
+        if self._pending_lines or pending_path.exists():
+            self._pending_lines.clear()
+            self._replace_file(pending_path, "")
+
+    def _append_to_file(self, path, text):
+        """ Appends the given text to the end of a file of the log. """
+        if self._writer is not None:
+            self._writer.append(path, text, open_log_file)
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open_log_file(path, "at") as f:
+            f.write(text)
+
+    def _replace_file(self, path, contents):
+        """ Replaces the contents of a file of the log. The file is replaced atomically, so that it is never left
+        partially written. """
+        if self._writer is not None:
+            self._writer.replace(path, contents, open_log_file)
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(path.name + ".tmp" + path.suffix)
+        with open_log_file(temp_path, "wt") as f:
+            f.write(contents)
+        os.replace(temp_path, path)
+
+    def _from_json_object(self, record):
+        """ Converts a record of the log into an exercise result. """
+        return self._json_converter.from_json_object(record, ExerciseResult)
+
+    def _to_json_line(self, exercise_result):
+        """ Converts an exercise result into a line of the log. """
+        return json.dumps(self._json_converter.to_json_object(exercise_result, ExerciseResult)) + "\n"
+
+    def _migrate_list_log(self, contents):
+        """ Converts a log written by earlier versions, containing a single list of exercises, into a log with one
+        exercise per line. A corrupt log is treated as empty, as earlier versions did, but is kept next to the new log
+        rather than overwritten. A read-only log is only converted in memory. """
+        try:
+            exercise_history = self._json_converter.from_json_object(json.loads(contents), List[ExerciseResult])
+        except (json.JSONDecodeError, TypeError, ValueError, RuntimeError):
+            exercise_history = []
+            if not self.read_only:
+                os.replace(self.path, self.path.with_name(self.path.name + ".corrupt"))
+        if not self.read_only:
+            self._rewrite(self._to_json_line(exercise_result) for exercise_result in exercise_history)
+        return exercise_history
+
+
+def _read_lines(path):
+    """
+    Reads the lines of a log file, which may be compressed (not including its pending file).
+
+    :param path: path to the file.
+    :return: the lines of the file (none if it does not exist), and whether a compressed stream in it was cut off, in
+    which case the lines before the cut are returned.
+    """
+    lines = []
+    try:
+        with open_log_file(path, "rt", include_pending=False) as f:
+            for line in f:
+                lines.append(line)
+    except (EOFError, gzip.BadGzipFile, zlib.error, lzma.LZMAError):
+        return lines, True
+    except IOError:
+        return [], False
+    return lines, False
+
+
+def is_exercise_record(record):
+    """
+    Checks that a record read from a JSON Lines log has the shape of an exercise result, so that records with a
+    different shape can be skipped without converting every record when the log is loaded.
+
+    :param record: the record, as parsed from JSON.
+    :return: whether the record has the shape of an exercise result.
+    """
+    return isinstance(record, list) and len(record) == 2 and isinstance(record[0], str) and isinstance(record[1], list)
+
+
+class SqliteExerciseLog(Sequence):
+    """
+    Log of completed exercises stored in an SQLite database, meant for users with a long history of exercises. Only
+    the exercises that are asked for are read from the database, and statistics of typing times are computed by the
+    database, using indexes on words and timestamps. The log can be used as a sequence of exercise results.
+    """
+    _schema = """
+        CREATE TABLE IF NOT EXISTS exercises (
+            id INTEGER PRIMARY KEY,
+            timestamp TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS word_results (
+            exercise_id INTEGER NOT NULL REFERENCES exercises(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            word TEXT NOT NULL,
+            stroke TEXT NOT NULL,
+            is_typed_correctly INTEGER NOT NULL,
+            typing_time REAL NOT NULL,
+            PRIMARY KEY (exercise_id, position)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS exercises_by_timestamp ON exercises(timestamp);
+        CREATE INDEX IF NOT EXISTS word_results_by_word ON word_results(word, is_typed_correctly, typing_time);
+    """
+
+    def __init__(self, path, read_only=False):
+        """
+        :param path: path to the database (will be created if it does not already exist, unless read-only).
+        :param read_only: whether to open the database read-only, in which case it must exist and exercises cannot be
+        appended to it.
+        """
+        self.path = Path(path)
+        # the log may be handed over to a worker thread (see BackgroundExerciseGenerator), so the connection is not
+        # tied to the thread that opened it. It must still not be used by several threads at once.
+        if read_only:
+            self._connection = sqlite3.connect(self.path.resolve().as_uri() + "?mode=ro", uri=True,
+                                               check_same_thread=False)
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        self._connection.executescript(self._schema)
+
+    def close(self):
+        """ Closes the database. """
+        self._connection.close()
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM exercises").fetchone()[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        row = self._connection.execute("SELECT id FROM exercises ORDER BY id LIMIT 1 OFFSET ?",
+                                       (index,)).fetchone() if index >= 0 else None
+        if row is None:
+            raise IndexError("exercise index out of range")
+        return next(self._read_exercises("WHERE exercises.id = ?", (row[0],)))
+
+    def __iter__(self):
+        return self._read_exercises("", ())
+
+    def id_range(self):
+        """
+        :return: the lowest and highest ID of the exercises in the log, or None if it is empty. Exercises are numbered
+        in the order they were recorded, though there may be gaps if the log was cleared.
+        """
+        first_id, last_id = self._connection.execute("SELECT MIN(id), MAX(id) FROM exercises").fetchone()
+        return None if first_id is None else (first_id, last_id)
+
+    def read_exercises(self, first_id, last_id):
+        """
+        Reads the exercises with an ID in the given range (see id_range), so that a log can be read in chunks.
+
+        :param first_id: the lowest ID of the exercises to read.
+        :param last_id: the highest ID of the exercises to read.
+        :return: an iterator over the exercise results, in the order they were recorded.
+        """
+        return self._read_exercises("WHERE exercises.id BETWEEN ? AND ?", (first_id, last_id))
+
+    def _read_exercises(self, condition, parameters):
+        """ Reads the exercises matching the given condition, in the order they were recorded. """
+        rows = self._connection.execute(
+            "SELECT exercises.id, timestamp, stroke, word, is_typed_correctly, typing_time "
+            "FROM exercises LEFT JOIN word_results ON exercises.id = exercise_id "
+            f"{condition} ORDER BY exercises.id, position", parameters)
+        for _, exercise_rows in groupby(rows, key=lambda row: row[0]):
+            exercise_rows = list(exercise_rows)
+            yield ExerciseResult(datetime.fromisoformat(exercise_rows[0][1]),
+                                 [ExerciseWordResult(Stroke(parse_stroke(stroke), word), bool(is_typed_correctly),
+                                                     typing_time)
+                                  for _, _, stroke, word, is_typed_correctly, typing_time in exercise_rows
+                                  if word is not None])
+
+    def append(self, exercise_result):
+        """
+        Appends an exercise to the log.
+
+        :param exercise_result: the exercise result to record.
+        """
+        self.extend([exercise_result])
+
+    def extend(self, exercise_results, batch_size=1000):
+        """
+        Appends a number of exercises to the log, committing them in batches.
+
+        :param exercise_results: the exercise results to record, in any iterable.
+        :param batch_size: amount of exercises to write in a single transaction.
+        """
+        exercise_results = iter(exercise_results)
+        while True:
+            batch = list(islice(exercise_results, batch_size))
+            if not batch:
+                return
+            with self._connection:
+                for exercise_result in batch:
+                    exercise_id = self._connection.execute("INSERT INTO exercises (timestamp) VALUES (?)",
+                                                           (str(exercise_result.timestamp),)).lastrowid
+                    self._connection.executemany(
+                        "INSERT INTO word_results VALUES (?, ?, ?, ?, ?, ?)",
+                        [(exercise_id, position, word.stroke.written_word, format_stroke(word.stroke.chord_sequence),
+                          word.is_typed_correctly, word.typing_time)
+                         for position, word in enumerate(exercise_result.words)])
+
+    def clear(self):
+        """ Removes all exercises from the log. """
+        with self._connection:
+            self._connection.execute("DELETE FROM word_results")
+            self._connection.execute("DELETE FROM exercises")
+
+    def typing_time_statistics(self):
+        """
+        Computes statistics of the time it took to type words, for words that were typed correctly. The first word of
+        an exercise is not accounted for, as there is no telling when the user began typing it.
+
+        :return: a dictionary mapping words to the amount of times they were typed and the sum of the reciprocals of
+        their typing times.
+        """
+        rows = self._connection.execute(
+            "SELECT word, COUNT(*), SUM(1.0 / typing_time) FROM word_results "
+            "WHERE is_typed_correctly AND position > 0 GROUP BY word")
+        return {word: (count, reciprocal_sum) for word, count, reciprocal_sum in rows}
+
+    def iter_typing_times(self):
+        """
+        :return: an iterator over (timestamp, word, typing time) for the words that were typed correctly (excluding the
+        first word of every exercise), in the order they were recorded.
+        """
+        rows = self._connection.execute(
+            "SELECT timestamp, word, typing_time FROM word_results JOIN exercises ON exercises.id = exercise_id "
+            "WHERE is_typed_correctly AND position > 0 ORDER BY exercise_id, position")
+        for timestamp, word, typing_time in rows:
+            yield datetime.fromisoformat(timestamp), word, typing_time
+
+    def typing_times(self, word):
+        """
+        :param word: the word to look up.
+        :return: the times it took to type the given word, in the order they were recorded, for the occurrences where
+        it was typed correctly (excluding the first word of every exercise).
+        """
+        rows = self._connection.execute(
+            "SELECT typing_time FROM word_results "
+            "WHERE word = ? AND is_typed_correctly AND position > 0 ORDER BY exercise_id", (word,))
+        return [typing_time for typing_time, in rows]
+
+
+def read_exercise_log(path, json_converter=None):
+    """
+    Reads an exercise log without modifying it, in either the JSON Lines format or the list-shaped format of earlier
+    versions, and compressed or not. Meant for tools that analyze the log.
+
+    :param path: path to the log file.
+    :param json_converter: converter used to convert exercise results from JSON.
+    :return: an iterator over the exercise results in the log.
+    """
+    json_converter = json_converter or TupleToJsonObjectConverter()
+    with open_log_file(Path(path), "rt") as f:
+        first_line = f.readline()
+        if is_list_log(first_line):
+            yield from json_converter.from_json_object(json.loads(first_line + f.read()), List[ExerciseResult])
+            return
+        for line in chain([first_line], f):
+            if line.strip():
+                yield json_converter.from_json_object(json.loads(line), ExerciseResult)
+
+
+def import_exercise_log(log_path, database_path):
+    """
+    Imports the exercises of a JSON exercise log (in either format) into an SQLite exercise log.
+
+    :param log_path: path to the JSON exercise log.
+    :param database_path: path to the database to import the exercises into.
+    :return: the amount of imported exercises.
+    """
+    database = SqliteExerciseLog(database_path)
+    try:
+        n_exercises = len(database)
+        database.extend(read_exercise_log(log_path))
+        return len(database) - n_exercises
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Imports a JSON exercise log into an SQLite exercise log.")
+    parser.add_argument("log_path", help="path to the JSON exercise log, for example output/log.json")
+    parser.add_argument("database_path", help="path to the database, for example output/log.sqlite")
+    arguments = parser.parse_args()
+    print(f"Imported {import_exercise_log(arguments.log_path, arguments.database_path)} exercises.")
@@ -28,36 +28,59 @@ Exercise settings.
 
 :param exercise_size: amount of words to include in an exercise.
 :param enabled_lessons: lessons of the "Learn Plover" series that are included in an exercise.
+:param word_statistics: how typing times are weighed when choosing words, either "all" for the harmonic mean of all
+typing times, "window" for only the most recent typing times of every word, or "decay" for a harmonic mean where the
+influence of typing times decays exponentially with their age.
+:param statistics_window: amount of recent typing times of every word to account for in the "window" mode.
+:param statistics_half_life: time in days until the influence of a typing time is halved in the "decay" mode.
 """
-ExerciseSettings = namedtuple("ExerciseSettings", "exercise_size enabled_lessons")
+ExerciseSettings = namedtuple("ExerciseSettings",
+                              "exercise_size enabled_lessons word_statistics statistics_window statistics_half_life",
+                              defaults=("all", 20, 30.0))
 
 """
 Application settings, both settings for exercises and general settings.
 
 :param exercise_settings: settings for exercises.
 :param show_welcome_dialog: whether to show a welcome dialog.
+:param write_durability: how writes to the exercise log and settings are made durable, either "batched" to write them
+together at short intervals or "fsync" to flush every write to disk right away (see background_writer.py).
 """
-ApplicationSettings = namedtuple("ApplicationSettings", "exercise_settings show_welcome_dialog")
+ApplicationSettings = namedtuple("ApplicationSettings", "exercise_settings show_welcome_dialog write_durability",
+                                 defaults=("batched",))
 
 
 class TupleToJsonObjectConverter:
     """
     Converts registered namedtuples to and from lists that can be serialized to JSON. Used for converting
     ExerciseResult and ExerciseSettings to a serializable form.
+
+    In compact mode, strokes are written as their written form in the plover dictionary (e.g. "TKPWRAOEUPBD") and
+    chords as masks of keys, instead of nested lists of keys. Both forms are always understood when converting from
+    JSON, so logs written in either mode (or a mix of them) can be read.
     """
-    def __init__(self):
+    def __init__(self, compact=False):
         """ Initializes the converter with a default tuple field type mapping. (That is, a mapping between the type of
-        a namedtuple and the types of its elements.) """
+        a namedtuple and the types of its elements.)
+
+        :param compact: whether to write strokes and chords in compact form.
+        """
+        self.compact = compact
+
         # mapping of tuple types to the type of their fields.
         self.tuple_field_types = {
             Stroke: [List[Chord], str],
             Chord: [List[StenoKeys]],
             ExerciseResult: [datetime, List[ExerciseWordResult]],
             ExerciseWordResult: [Stroke, bool, float],
-            ExerciseSettings: [int, List[str]],
-            ApplicationSettings: [ExerciseSettings, bool]
+            ExerciseSettings: [int, List[str], str, int, float],
+            ApplicationSettings: [ExerciseSettings, bool, str]
         }
 
+        # conversion functions compiled for every type that has been converted, see _compile_decoder/_compile_encoder.
+        self._decoders = {}
+        self._encoders = {}
+
     def from_json_object(self, object, object_type):
         """
         Converts a JSON-representable list into a registered tuple or list of tuples.
@@ -66,18 +89,10 @@ class TupleToJsonObjectConverter:
         :param object_type: the type of the object to convert.
         :return: the converted object.
         """
-        if hasattr(object_type, "_name") and object_type._name == "List":
-            return [self.from_json_object(elem, object_type.__dict__["__args__"][0]) for elem in object]
-        elif object_type in [str, int, StenoKeys, bool, float]:
-            return object_type(object)
-        elif object_type is datetime:
-            return datetime.fromisoformat(object)
-        elif object_type in self.tuple_field_types:
-            res = [self.from_json_object(elem, elem_type)
-                   for elem, elem_type in zip(object, self.tuple_field_types[object_type])]
-            return object_type(*res)
-        else:
+        decoder = self._decoders.get(object_type) or self._compile_decoder(object_type)
+        if decoder is None:
             raise RuntimeError(repr(object), repr(object_type))
+        return decoder(object)
 
     def to_json_object(self, object, object_type):
         """
@@ -87,15 +102,150 @@ class TupleToJsonObjectConverter:
         :param object_type: the type of the object to convert
         :return: the object in JSON-representable form.
         """
+        encoder = self._encoders.get(object_type) or self._compile_encoder(object_type)
+        if encoder is None:
+            raise RuntimeError(repr(object), repr(object_type))
+        return encoder(object)
+
+    # Conversion functions are compiled once per type, the first time the type is converted, so that the type does not
+    # need to be inspected again for every converted value. Changes to tuple_field_types after a type has been
+    # converted do not affect that type.
+
+    @staticmethod
+    def _list_element_type(object_type):
+        """ Returns the element type of a List[...] type, or None if the type is not a List[...] type. """
         if hasattr(object_type, "_name") and object_type._name == "List":
-            return [self.to_json_object(elem, object_type.__dict__["__args__"][0]) for elem in object]
+            return object_type.__dict__["__args__"][0]
+        return None
+
+    def _compile_decoder(self, object_type):
+        """ Compiles a function converting JSON-representable objects of the given type, or returns None if the type
+        is not supported. """
+        element_type = self._list_element_type(object_type)
+        if element_type is not None:
+            decode_element = self._decoders.get(element_type) or self._compile_decoder(element_type)
+            if decode_element is None:
+                return None
+            self._decoders[object_type] = lambda object: [decode_element(elem) for elem in object]
         elif object_type in [str, int, StenoKeys, bool, float]:
-            return object
+            self._decoders[object_type] = object_type
         elif object_type is datetime:
-            return str(object)
+            self._decoders[object_type] = datetime.fromisoformat
+        elif object_type is Chord:
+            key_masks = {key.value: key.mask for key in StenoKeys.__members__.values()}
+
+            def decode_chord(object):
+                if isinstance(object, int):
+                    return Chord.from_mask(object)
+                mask = 0
+                for key in object[0]:
+                    if key not in key_masks:
+                        raise ValueError(f"{key!r} is not a valid StenoKeys")
+                    mask |= key_masks[key]
+                return Chord.from_mask(mask)
+            self._decoders[object_type] = decode_chord
         elif object_type in self.tuple_field_types:
-            res = [self.to_json_object(elem, elem_type)
-                   for elem, elem_type in zip(object, self.tuple_field_types[object_type])]
-            return res
+            field_decoders = [self._decoders.get(field_type) or self._compile_decoder(field_type)
+                              for field_type in self.tuple_field_types[object_type]]
+            if None in field_decoders:
+                return None
+            if object_type is Stroke:
+                decode_chords, decode_word = field_decoders
+
+                def decode_stroke(object):
+                    chord_sequence, written_word = object
+                    if isinstance(chord_sequence, str):
+                        return Stroke(parse_stroke(chord_sequence), str(written_word))
+                    return Stroke(decode_chords(chord_sequence), decode_word(written_word))
+                self._decoders[object_type] = decode_stroke
+            else:
+                self._decoders[object_type] = _compile_tuple_decoder(object_type, field_decoders)
         else:
-            raise RuntimeError(repr(object), repr(object_type))
+            return None
+        return self._decoders[object_type]
+
+    def _compile_encoder(self, object_type):
+        """ Compiles a function converting objects of the given type into JSON-representable form, or returns None if
+        the type is not supported. """
+        element_type = self._list_element_type(object_type)
+        if element_type is not None:
+            encode_element = self._encoders.get(element_type) or self._compile_encoder(element_type)
+            if encode_element is None:
+                return None
+            if encode_element is _identity:
+                self._encoders[object_type] = list
+            else:
+                self._encoders[object_type] = lambda object: [encode_element(elem) for elem in object]
+        elif object_type in [str, int, StenoKeys, bool, float]:
+            self._encoders[object_type] = _identity
+        elif object_type is datetime:
+            self._encoders[object_type] = str
+        elif object_type is Chord:
+            if self.compact:
+                self._encoders[object_type] = lambda object: Chord(object.keys).mask
+            else:
+                keys_by_mask = {}
+
+                def encode_chord(object):
+                    mask = int(object.keys)
+                    if mask not in keys_by_mask:
+                        keys_by_mask[mask] = list(StenoKeySet(mask))
+                    return [keys_by_mask[mask][:]]
+                self._encoders[object_type] = encode_chord
+        elif object_type is Stroke and self.compact:
+            self._encoders[object_type] = lambda object: [format_stroke(object.chord_sequence), object.written_word]
+        elif object_type in self.tuple_field_types:
+            field_encoders = [self._encoders.get(field_type) or self._compile_encoder(field_type)
+                              for field_type in self.tuple_field_types[object_type]]
+            if None in field_encoders:
+                return None
+            self._encoders[object_type] = _compile_tuple_encoder(field_encoders)
+        else:
+            return None
+        return self._encoders[object_type]
+
+
+def _identity(object):
+    """ Conversion function for values that are the same in JSON-representable form. """
+    return object
+
+
+def _compile_tuple_decoder(object_type, field_decoders):
+    """ Returns a function converting a list of JSON-representable fields into a tuple of the given type. The fields of
+    tuples with two or three fields, the ones converted most often, are converted without a loop over the fields.
+    Lists with fewer fields than the tuple (e.g. written by an earlier version, before a field with a default value was
+    added) are converted field by field. """
+    def decode_fields(object):
+        return object_type(*[decode_field(elem) for decode_field, elem in zip(field_decoders, object)])
+
+    if len(field_decoders) == 2:
+        decode_0, decode_1 = field_decoders
+
+        def decode_pair(object):
+            if len(object) != 2:
+                return decode_fields(object)
+            return object_type(decode_0(object[0]), decode_1(object[1]))
+        return decode_pair
+    if len(field_decoders) == 3:
+        decode_0, decode_1, decode_2 = field_decoders
+
+        def decode_triple(object):
+            if len(object) != 3:
+                return decode_fields(object)
+            return object_type(decode_0(object[0]), decode_1(object[1]), decode_2(object[2]))
+        return decode_triple
+    return decode_fields
+
+
+def _compile_tuple_encoder(field_encoders):
+    """ Returns a function converting a tuple into a list of JSON-representable fields. Only the fields that need to be
+    converted are, the others are copied into the list as they are. """
+    converted_fields = [(i, encode_field) for i, encode_field in enumerate(field_encoders)
+                        if encode_field is not _identity]
+
+    def encode_tuple(object):
+        fields = list(object)
+        for i, encode_field in converted_fields:
+            fields[i] = encode_field(fields[i])
+        return fields
+    return encode_tuple
@@ -0,0 +1,292 @@
+"""
+Serves exercises to several users over HTTP, so that the Plover dictionary is loaded and indexed once rather than by
+every instance of the application. Every user has their own exercise log and statistics of typing times, kept in a
+directory of their own. Run as "python exercise_service.py data/main.json output/users" to start the service, and
+start the application with "python gui.py --service http://localhost:8421 --user NAME" to use it.
+
+The service understands the following requests, with exercise settings and results converted to JSON by
+TupleToJsonObjectConverter:
+
+- POST /users/NAME/exercise, with exercise settings as body, returns a new exercise as a list of strokes.
+- POST /users/NAME/results, with an exercise result as body, records the result.
+- DELETE /users/NAME/results clears the exercise history.
+
+Errors are returned as {"error": message}, with status 400 if the request was invalid.
+"""
+from background_writer import BackgroundWriter
+from exercise_generator import StenoExerciseGenerator
+from exercise_log import ExerciseResult, ExerciseSettings, TupleToJsonObjectConverter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from learn_plover import learn_plover_lesson_words
+from pathlib import Path
+from steno_dictionary import load_reverse_dictionary
+from steno_keys import Stroke
+from typing import List
+from urllib.error import HTTPError
+from urllib.parse import quote, unquote
+import argparse
+import json
+import re
+import threading
+import urllib.request
+
+
+# user names are used as directory names, so they are restricted to characters that are safe in paths.
+_user_name_pattern = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]{0,63}")
+
+_user_path_pattern = re.compile(r"/users/([^/]+)/(exercise|results)")
+
+
+class _UserSession:
+    """ The exercise generator of a user, created when the user first makes a request, and the lock serializing the
+    requests of the user. """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.exercise_generator = None
+
+
+class ExerciseService:
+    """
+    Generates and records exercises for any amount of users, sharing a single reverse dictionary between them. Requests
+    of different users are handled concurrently, while requests of the same user are handled one at a time, as the
+    exercise generator of a user is not thread-safe. Logs and statistics of all users are written by a single
+    background writer (see background_writer.py).
+    """
+    def __init__(self, steno_dict_path, users_path, lessons=None, history_backend="json", compact_log=False,
+                 durability="batched"):
+        """
+        :param steno_dict_path: path to the Plover stenography dictionary (in JSON format).
+        :param users_path: path to the directory holding a directory with the exercise log of every user.
+        :param lessons: the "Learn Plover" lessons that exercises may be generated from, or None for all of them.
+        :param history_backend: how exercise logs are stored, see StenoExerciseGenerator.
+        :param compact_log: whether to write strokes to JSON logs in their compact, written form.
+        :param durability: how writes to the exercise logs are made durable, see background_writer.py.
+        """
+        self.steno_dict_path = Path(steno_dict_path)
+        self.users_path = Path(users_path)
+        self.lessons = list(learn_plover_lesson_words if lessons is None else lessons)
+        self.history_backend = history_backend
+        self.compact_log = compact_log
+        self.reverse_dict = load_reverse_dictionary(
+            self.steno_dict_path, {word for lesson in self.lessons for word in learn_plover_lesson_words[lesson]})
+        self._writer = BackgroundWriter(durability)
+        # mapping of user names to their session, guarded by the lock.
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+
+    def log_path_for(self, user):
+        """
+        :param user: name of a user.
+        :return: path to the exercise log of the user.
+        """
+        return self.users_path / user / ("log.sqlite" if self.history_backend == "sqlite" else "log.json")
+
+    def _call(self, user, method_name, *args):
+        """ Calls a method of the exercise generator of a user, holding the lock of the user. The exercise generator
+        is created (loading the history of the user) by the first call. """
+        if not _user_name_pattern.fullmatch(user):
+            raise ValueError(f"Invalid user name {user!r}")
+        with self._sessions_lock:
+            session = self._sessions.setdefault(user, _UserSession())
+        with session.lock:
+            if session.exercise_generator is None:
+                session.exercise_generator = StenoExerciseGenerator(
+                    self.steno_dict_path, self.log_path_for(user), lessons=self.lessons,
+                    history_backend=self.history_backend, compact_log=self.compact_log, writer=self._writer,
+                    reverse_dict=self.reverse_dict)
+            return getattr(session.exercise_generator, method_name)(*args)
+
+    def generate_exercise(self, user, exercise_settings):
+        """
+        Generates a new exercise for a user, see StenoExerciseGenerator.generate_exercise.
+
+        :param user: name of the user.
+        :param exercise_settings: settings for the exercise.
+        :return: a list of strokes.
+        """
+        return self._call(user, "generate_exercise", exercise_settings)
+
+    def record_exercise_result(self, user, exercise_result):
+        """
+        Records an exercise result of a user, see StenoExerciseGenerator.record_exercise_result.
+
+        :param user: name of the user.
+        :param exercise_result: the exercise result to record.
+        """
+        self._call(user, "record_exercise_result", exercise_result)
+
+    def clear_exercise_history(self, user):
+        """
+        Clears the entire exercise history of a user.
+
+        :param user: name of the user.
+        """
+        self._call(user, "clear_exercise_history")
+
+    def close(self):
+        """ Closes the exercise generators of all users and waits for all writes to their exercise logs and statistics
+        to be carried out. The service must not be used afterwards. """
+        with self._sessions_lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            with session.lock:
+                if session.exercise_generator is not None:
+                    session.exercise_generator.close()
+        self._writer.close()
+
+
+class _ExerciseRequestHandler(BaseHTTPRequestHandler):
+    """ Handles a request to an exercise server, see the description of the requests at the top of this module. """
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def _handle(self, method):
+        """ Handles a request, responding with the result or the error that occurred. """
+        match = _user_path_pattern.fullmatch(self.path)
+        if match is None:
+            self._respond(404, {"error": f"Unknown path {self.path}"})
+            return
+        user, resource = unquote(match.group(1)), match.group(2)
+        service, json_converter = self.server.service, self.server.json_converter
+        try:
+            if method == "POST":
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if (method, resource) == ("POST", "exercise"):
+                exercise = service.generate_exercise(user, json_converter.from_json_object(body, ExerciseSettings))
+                self._respond(200, json_converter.to_json_object(exercise, List[Stroke]))
+            elif (method, resource) == ("POST", "results"):
+                service.record_exercise_result(user, json_converter.from_json_object(body, ExerciseResult))
+                self._respond(204)
+            elif (method, resource) == ("DELETE", "results"):
+                service.clear_exercise_history(user)
+                self._respond(204)
+            else:
+                self._respond(405, {"error": f"{method} is not supported for {self.path}"})
+        except (ValueError, TypeError, KeyError, IndexError) as error:
+            # invalid settings, results or user names, including malformed JSON.
+            self._respond(400, {"error": f"{type(error).__name__}: {error}"})
+        except Exception as error:
+            self._respond(500, {"error": f"{type(error).__name__}: {error}"})
+
+    def _respond(self, status, json_object=None):
+        """ Sends a response with the given status and, unless None, JSON body. """
+        body = b"" if json_object is None else json.dumps(json_object).encode("utf-8")
+        self.send_response(status)
+        if json_object is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ExerciseServer(ThreadingHTTPServer):
+    """ HTTP server of an exercise service, handling every request on a thread of its own. """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, service, verbose=False):
+        """
+        :param address: host and port to listen at, where port 0 picks a free port.
+        :param service: the exercise service.
+        :param verbose: whether to log every request to standard error.
+        """
+        super().__init__(address, _ExerciseRequestHandler)
+        self.service = service
+        self.verbose = verbose
+        self.json_converter = TupleToJsonObjectConverter(compact=True)
+
+    @property
+    def url(self):
+        """ The URL of the server. """
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class ExerciseServiceClient:
+    """ Generates and records the exercises of a user through an exercise server. Has the same methods as
+    StenoExerciseGenerator that the application uses, so it can take the place of a local generator. """
+    def __init__(self, url, user, timeout=30.0):
+        """
+        :param url: the URL of the server, for example http://localhost:8421.
+        :param user: name of the user.
+        :param timeout: time in seconds to wait for a response.
+        """
+        self.url = url.rstrip("/")
+        self.user = user
+        self.timeout = timeout
+        self._json_converter = TupleToJsonObjectConverter(compact=True)
+
+    def _request(self, method, resource, json_object=None):
+        """ Makes a request for a resource of the user, returning the JSON body of the response or None if there is
+        none. A ValueError is raised if the server rejected the request as invalid, and a RuntimeError for any other
+        error reported by the server. """
+        request = urllib.request.Request(f"{self.url}/users/{quote(self.user, safe='')}/{resource}", method=method,
+                                         data=None if json_object is None else json.dumps(json_object).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = response.read()
+        except HTTPError as error:
+            try:
+                message = json.loads(error.read())["error"]
+            except (ValueError, KeyError, TypeError):
+                message = str(error)
+            raise (ValueError if error.code == 400 else RuntimeError)(message) from None
+        return json.loads(body) if body else None
+
+    def generate_exercise(self, exercise_settings):
+        """
+        Generates a new exercise, see StenoExerciseGenerator.generate_exercise.
+
+        :param exercise_settings: settings for the exercise.
+        :return: a list of strokes.
+        """
+        exercise = self._request("POST", "exercise",
+                                 self._json_converter.to_json_object(exercise_settings, ExerciseSettings))
+        return self._json_converter.from_json_object(exercise, List[Stroke])
+
+    def record_exercise_result(self, exercise_result):
+        """
+        Records an exercise result, see StenoExerciseGenerator.record_exercise_result.
+
+        :param exercise_result: the exercise result to record.
+        """
+        self._request("POST", "results", self._json_converter.to_json_object(exercise_result, ExerciseResult))
+
+    def clear_exercise_history(self):
+        """ Clears the entire exercise history. """
+        self._request("DELETE", "results")
+
+    def close(self):
+        """ Does nothing, as the statistics of typing times are saved by the service. """
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dictionary_path", help="path to the Plover dictionary, for example data/main.json")
+    parser.add_argument("users_path", help="directory holding the exercise logs of the users, for example output/users")
+    parser.add_argument("--host", default="localhost", help="host to listen at")
+    parser.add_argument("--port", type=int, default=8421, help="port to listen at")
+    parser.add_argument("--history-backend", choices=["json", "sqlite"], default="json",
+                        help="how the exercise logs are stored")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    arguments = parser.parse_args()
+
+    exercise_service = ExerciseService(arguments.dictionary_path, arguments.users_path,
+                                       history_backend=arguments.history_backend)
+    server = ExerciseServer((arguments.host, arguments.port), exercise_service, arguments.verbose)
+    print(f"Serving exercises at {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        exercise_service.close()
@@ -0,0 +1,61 @@
+"""
+Generates exercises without the user interface, for example to hand out in a classroom. The dictionary is loaded once,
+after which any amount of exercises is generated from the history of a user log and written as JSON Lines, one
+exercise per line as a list of strokes in compact form, e.g. [["KAT", "cat"], ["TKOG", "dog"]]. Exercises are not
+recorded in the log, so generating them never writes to it.
+"""
+from exercise_generator import StenoExerciseGenerator
+from exercise_log import ExerciseSettings, TupleToJsonObjectConverter
+from learn_plover import learn_plover_lessons
+from steno_keys import Stroke
+from typing import List
+from word_statistics import word_statistics_modes
+import argparse
+import json
+import sys
+
+
+def write_exercises(exercise_generator, exercise_settings, count, output):
+    """
+    Generates exercises and writes them as JSON Lines, each exercise as soon as it is generated.
+
+    :param exercise_generator: the exercise generator.
+    :param exercise_settings: settings for the exercises.
+    :param count: amount of exercises to generate.
+    :param output: text file to write the exercises to.
+    """
+    json_converter = TupleToJsonObjectConverter(compact=True)
+    for _ in range(count):
+        exercise = exercise_generator.generate_exercise(exercise_settings)
+        output.write(json.dumps(json_converter.to_json_object(exercise, List[Stroke])) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("dictionary_path", help="path to the Plover dictionary, for example data/main.json")
+    parser.add_argument("log_path", help="path to the user log whose history words are chosen by, for example "
+                                         "output/log.json (an empty history is used if it does not exist)")
+    parser.add_argument("count", type=int, help="amount of exercises to generate")
+    parser.add_argument("--lessons", nargs="+", choices=learn_plover_lessons, default=learn_plover_lessons,
+                        metavar="LESSON", help="lessons to choose words from (default: all)")
+    parser.add_argument("--size", type=int, default=20, help="amount of words in an exercise")
+    parser.add_argument("--word-statistics", choices=word_statistics_modes, default="all",
+                        help="how typing times are weighed when choosing words")
+    parser.add_argument("--history-backend", choices=["json", "sqlite"], default="json",
+                        help="how the user log is stored")
+    parser.add_argument("--seed", type=int, help="seed for choosing words, to generate the same exercises every time")
+    parser.add_argument("--output", default="-", help="file to write the exercises to (default: standard output)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="leave the user log untouched, not even repairing it or updating the statistics of "
+                             "typing times saved next to it")
+    arguments = parser.parse_args()
+
+    generator = StenoExerciseGenerator(arguments.dictionary_path, arguments.log_path, lessons=arguments.lessons,
+                                       history_backend=arguments.history_backend, read_only=arguments.dry_run,
+                                       seed=arguments.seed)
+    settings = ExerciseSettings(arguments.size, arguments.lessons, arguments.word_statistics)
+    if arguments.output == "-":
+        write_exercises(generator, settings, arguments.count, sys.stdout)
+    else:
+        with open(arguments.output, "w", encoding="utf-8") as output_file:
+            write_exercises(generator, settings, arguments.count, output_file)
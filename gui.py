@@ -1,12 +1,23 @@
 import tkinter as tk
 
 from learn_plover import *
+import argparse
+import getpass
 import json
 from pathlib import Path
 
-from ui_elements import StenoMachinePreview, StenoExerciseFrame, StenoExerciseSettingsDialog, WelcomeDialog
+from ui_elements import StenoMachinePreview, StenoExerciseFrame, StenoTextExerciseFrame, StenoExerciseSettingsDialog, \
+    WelcomeDialog, instrument_latencies
+from latency import LatencyRecorder
 from exercise_log import TupleToJsonObjectConverter, ExerciseSettings, ApplicationSettings
-from exercise_generator import StenoExerciseGenerator
+from exercise_generator import StenoExerciseGenerator, BackgroundExerciseGenerator
+from exercise_service import ExerciseServiceClient
+from background_writer import BackgroundWriter, durability_modes
+
+
+# exercises of at least this many words are drawn as text rather than with widgets for every word, which would take long
+# to show.
+TEXT_RENDERING_MIN_WORDS = 200
 
 
 class StenoApplication(tk.Tk):
@@ -17,13 +28,22 @@ class StenoApplication(tk.Tk):
     components of the application, generating a new exercise when the previous is finished or settings have changed,
     as well as allowing for configuration changes via a menu accessible via a button.
     """
-    def __init__(self):
+    def __init__(self, service_url=None, user=None):
         """ Constructs the main application frame, reading user settings, exercise history and the stenography
-        dictionary. Will also generate an initial exercise and show the welcome dialog if applicable. """
+        dictionary. Will also generate an initial exercise and show the welcome dialog if applicable.
+
+        :param service_url: URL of an exercise service (see exercise_service.py) to generate and record exercises
+        with, instead of loading the dictionary and exercise history locally, or None to do so locally.
+        :param user: name of the user at the exercise service.
+        """
         super(StenoApplication, self).__init__()
 
         self.configure(background="white")
 
+        # latencies of the user interface are only measured when enabled in the settings dialog.
+        self.latency_recorder = LatencyRecorder()
+        instrument_latencies(self.latency_recorder)
+
         self._json_converter = TupleToJsonObjectConverter()
 
         self._settings_path = Path("output", "config.json")
@@ -34,20 +54,31 @@ class StenoApplication(tk.Tk):
                 self.current_settings = self._json_converter.from_json_object(json.load(f), ApplicationSettings)
         except BaseException:
             self.current_settings = ApplicationSettings(ExerciseSettings(20, learn_plover_lessons), True)
+        if self.current_settings.write_durability not in durability_modes:
+            self.current_settings = self.current_settings._replace(write_durability="batched")
+
+        # the exercise log and settings are written on a background thread, so that a slow disk does not hold up typing.
+        self._writer = BackgroundWriter(self.current_settings.write_durability)
 
-        self.exercise_generator = StenoExerciseGenerator(Path("data", "main.json"), Path("output", "log.json"))
+        # exercises are generated and recorded on a worker thread, so that the next exercise is ready to be shown as
+        # soon as the current one is finished.
+        if service_url is not None:
+            exercise_generator = ExerciseServiceClient(service_url, user)
+        else:
+            exercise_generator = StenoExerciseGenerator(Path("data", "main.json"), Path("output", "log.json"),
+                                                        writer=self._writer, use_dictionary_index=True)
+        self.exercise_generator = BackgroundExerciseGenerator(exercise_generator)
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
 
         self.exercise_settings_button = tk.Button(self,
                                                   text="Exercise Settings...",
                                                   command=self._open_settings_dialog)
         self.exercise_settings_button.pack()
 
-        self.exercise_frame = StenoExerciseFrame(self, self)
-        self.exercise_frame.pack(expand=True, fill=tk.BOTH)
+        self.exercise_frame = None
 
         self.machine_preview = StenoMachinePreview(self)
         self.machine_preview.pack(expand=True, fill=tk.BOTH)
-        self.set_chord_preview = self.machine_preview.set_chord
 
         self._generate_exercise()
 
@@ -56,18 +87,25 @@ class StenoApplication(tk.Tk):
 
     def _save_application_settings(self):
         """ Saves the current application settings to the file system. """
-        self._settings_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(self._settings_path, "w") as f:
-            json.dump(self._json_converter.to_json_object(self.current_settings, ApplicationSettings), f)
+        settings = self._json_converter.to_json_object(self.current_settings, ApplicationSettings)
+        self._writer.replace(self._settings_path, json.dumps(settings))
 
     def on_welcome_dialog_close(self, show_welcome_dialog_setting):
         """
         Called by the welcome dialog when it is closed.
         :param show_welcome_dialog_setting: whether to show the welcome dialog on next startup.
         """
-        self.current_settings = ApplicationSettings(self.current_settings.exercise_settings, show_welcome_dialog_setting)
+        self.current_settings = self.current_settings._replace(show_welcome_dialog=show_welcome_dialog_setting)
         self._save_application_settings()
 
+    def set_chord_preview(self, chord):
+        """
+        Called by the exercise frame to show the chord to type next in the keyboard preview.
+
+        :param chord: the chord, or None to show no chord.
+        """
+        self.machine_preview.set_chord(chord)
+
     def on_settings_dialog_close(self,
                                  regenerate_exercise,
                                  settings_changed,
@@ -81,7 +119,7 @@ class StenoApplication(tk.Tk):
         :param new_settings: the new settings, or None if not changed.
         """
         if settings_changed:
-            self.current_settings = ApplicationSettings(new_settings, self.current_settings.show_welcome_dialog)
+            self.current_settings = self.current_settings._replace(exercise_settings=new_settings)
             self._save_application_settings()
         if regenerate_exercise:
             self._generate_exercise()
@@ -103,15 +141,36 @@ class StenoApplication(tk.Tk):
         self.exercise_generator.record_exercise_result(exercise_result)
         self._generate_exercise()
 
+    def _on_close(self):
+        """ Called when the main window is closed. Waits for the last exercise result to be recorded and written. """
+        self.exercise_generator.shutdown()
+        self._writer.close()
+        self.destroy()
+
     def _open_settings_dialog(self):
         """ Called when the button to open the settings dialog is pressed. """
         self.exercise_frame.pause_exercise()
-        StenoExerciseSettingsDialog(self, self, self.current_settings.exercise_settings)
+        StenoExerciseSettingsDialog(self, self, self.current_settings.exercise_settings, self.latency_recorder)
 
     def _generate_exercise(self):
-        """ Generates a new exercise and shows it in the exercise frame. """
-        self.exercise_frame.set_exercise(self.exercise_generator.generate_exercise(self.current_settings.exercise_settings))
+        """ Generates a new exercise and shows it in the exercise frame, replacing the exercise frame if the length of
+        exercises calls for another way of drawing them. """
+        exercise_settings = self.current_settings.exercise_settings
+        exercise_frame_type = StenoTextExerciseFrame if exercise_settings.exercise_size >= TEXT_RENDERING_MIN_WORDS \
+            else StenoExerciseFrame
+        if type(self.exercise_frame) is not exercise_frame_type:
+            if self.exercise_frame is not None:
+                self.exercise_frame.destroy()
+            self.exercise_frame = exercise_frame_type(self, self)
+            self.exercise_frame.pack(expand=True, fill=tk.BOTH, before=self.machine_preview)
+        self.exercise_frame.set_exercise(self.exercise_generator.generate_exercise(exercise_settings))
 
 
 if __name__ == "__main__":
-    StenoApplication().mainloop()
+    parser = argparse.ArgumentParser(description="Stenography typing practice.")
+    parser.add_argument("--service", metavar="URL",
+                        help="URL of an exercise service to use instead of the local dictionary and exercise log, for "
+                             "example http://localhost:8421 (see exercise_service.py)")
+    parser.add_argument("--user", default=getpass.getuser(), help="name of the user at the exercise service")
+    arguments = parser.parse_args()
+    StenoApplication(arguments.service, arguments.user).mainloop()
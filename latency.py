@@ -0,0 +1,157 @@
+from array import array
+from pathlib import Path
+import functools
+import json
+import time
+
+
+class LatencyHistogram:
+    """
+    Histogram of latencies in a fixed amount of memory. Latencies are counted in buckets that double in width: bucket 0
+    counts latencies below a microsecond, and bucket i counts latencies of 2^(i-1) up to 2^i microseconds. The last
+    bucket also counts all longer latencies.
+    """
+    n_buckets = 32
+
+    def __init__(self):
+        self.counts = array("q", bytes(8 * self.n_buckets))
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, seconds):
+        """
+        Counts a latency.
+
+        :param seconds: the latency in seconds.
+        """
+        self.counts[min(int(seconds * 1e6).bit_length(), self.n_buckets - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    @classmethod
+    def bucket_upper_bound(cls, bucket):
+        """
+        :param bucket: index of a bucket.
+        :return: the latency in seconds up to which the bucket counts latencies.
+        """
+        return (1 << bucket) / 1e6
+
+    def percentile(self, fraction):
+        """
+        :param fraction: the fraction of latencies, between 0 and 1.
+        :return: an upper bound of the latency in seconds that the given fraction of latencies does not exceed, or 0 if
+        no latencies were counted. The bound is exact up to the width of a bucket.
+        """
+        if self.count == 0:
+            return 0.0
+        threshold = fraction * self.count
+        cumulative_count = 0
+        for bucket, count in enumerate(self.counts):
+            cumulative_count += count
+            if cumulative_count >= threshold and count:
+                return min(self.bucket_upper_bound(bucket), self.maximum)
+        return self.maximum
+
+
+class LatencyRecorder:
+    """
+    Measures how long functions take, counting the durations of their calls in a histogram per function. Functions are
+    registered with instrument, and are only replaced by measuring wrappers while the recorder is enabled, so that
+    there is no cost at all while it is disabled.
+    """
+    def __init__(self):
+        # mapping of names of measured functions to the histogram of their latencies.
+        self.histograms = {}
+        # registered functions, as (object the function is an attribute of, name of the attribute, name to record the
+        # latencies under).
+        self._targets = []
+        self._originals = None
+
+    @property
+    def enabled(self):
+        """ Whether latencies are being recorded. """
+        return self._originals is not None
+
+    def instrument(self, owner, attribute, name=None):
+        """
+        Registers a function to measure while the recorder is enabled.
+
+        :param owner: the class (or other object) the function is an attribute of.
+        :param attribute: name of the attribute holding the function.
+        :param name: name to record the latencies under, or None for the qualified name of the function.
+        """
+        function = getattr(owner, attribute)
+        self._targets.append((owner, attribute, name or function.__qualname__))
+        if self.enabled:
+            self._originals.append((owner, attribute, function))
+            setattr(owner, attribute, self._wrap(function, name or function.__qualname__))
+
+    def enable(self):
+        """ Starts recording latencies of the registered functions. """
+        if self.enabled:
+            return
+        self._originals = []
+        for owner, attribute, name in self._targets:
+            function = getattr(owner, attribute)
+            self._originals.append((owner, attribute, function))
+            setattr(owner, attribute, self._wrap(function, name))
+
+    def disable(self):
+        """ Stops recording latencies, restoring the registered functions. Recorded latencies are kept. """
+        if not self.enabled:
+            return
+        for owner, attribute, function in reversed(self._originals):
+            setattr(owner, attribute, function)
+        self._originals = None
+
+    def _wrap(self, function, name):
+        """ Returns a wrapper of the given function counting the duration of every call in its histogram. """
+        histogram = self.histograms.setdefault(name, LatencyHistogram())
+        perf_counter = time.perf_counter
+
+        @functools.wraps(function)
+        def measured_function(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.add(perf_counter() - start)
+        return measured_function
+
+    def reset(self):
+        """ Discards all recorded latencies. """
+        for histogram in self.histograms.values():
+            histogram.__init__()
+
+    def summary(self):
+        """
+        :return: a table summarizing the recorded latencies of every function, as text.
+        """
+        lines = [f"{'function':54} {'calls':>8} {'mean':>10} {'p50':>10} {'p95':>10} {'p99':>10} {'max':>10}"]
+        for name, histogram in sorted(self.histograms.items()):
+            mean = histogram.total / histogram.count if histogram.count else 0.0
+            latencies = (mean, histogram.percentile(0.5), histogram.percentile(0.95), histogram.percentile(0.99),
+                         histogram.maximum)
+            lines.append(f"{name:54} {histogram.count:8} " +
+                         " ".join(f"{latency * 1000:8.3f}ms" for latency in latencies))
+        return "\n".join(lines)
+
+    def export(self, path):
+        """
+        Writes the recorded latencies to a file in JSON format, with the counts of every bucket of every histogram.
+
+        :param path: path to the file.
+        """
+        with open(Path(path), "w", encoding="utf-8") as f:
+            json.dump({
+                "bucket_upper_bounds": [LatencyHistogram.bucket_upper_bound(bucket)
+                                        for bucket in range(LatencyHistogram.n_buckets)],
+                "histograms": {name: {"count": histogram.count,
+                                      "total": histogram.total,
+                                      "maximum": histogram.maximum,
+                                      "counts": list(histogram.counts)}
+                               for name, histogram in self.histograms.items()}
+            }, f, indent=2)
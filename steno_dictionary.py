@@ -0,0 +1,456 @@
+from steno_keys import Chord, parse_chord
+from array import array
+from collections.abc import Mapping
+from pathlib import Path
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+
+# bumped whenever the layout of the compiled dictionary cache changes, so that stale caches are rebuilt. The cache has
+# the layout of a dictionary index (see DictionaryIndex), so reading it never executes code.
+CACHE_FORMAT_VERSION = 3
+
+# bumped whenever the layout of the dictionary index changes, so that stale indexes are rebuilt.
+INDEX_FORMAT_VERSION = 1
+
+# marks the beginning of a dictionary index, see DictionaryIndex.
+_INDEX_MAGIC = b"STENOIDX"
+
+
+def _is_usable_stroke(stroke):
+    """ Determines whether a stroke in the plover dictionary can be shown to the user. Strokes using the number bar
+    are excluded, as the keyboard preview has no number keys. """
+    return not any(letter in "012345789" for letter in stroke)
+
+
+def _file_digest(path):
+    """ Computes the SHA-256 digest of the contents of the given file. """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _words_digest(words):
+    """ Computes a digest of a set of words, used to detect that the words to index have changed. """
+    return hashlib.sha256("\n".join(sorted(words)).encode("utf-8")).hexdigest()
+
+
+def cache_path_for(steno_dict_path):
+    """
+    :param steno_dict_path: path to the Plover stenography dictionary.
+    :return: path of the compiled cache that belongs to the given dictionary, stored next to it.
+    """
+    steno_dict_path = Path(steno_dict_path)
+    return steno_dict_path.with_name(steno_dict_path.name + ".cache")
+
+
+def iter_json_object_items(f, chunk_size=1 << 16):
+    """
+    Parses a JSON object from a file incrementally, yielding its items one at a time. Only a small window of the file
+    is kept in memory, so large dictionaries can be indexed without holding all of their entries at once.
+
+    :param f: the file to read from, opened in text mode.
+    :param chunk_size: amount of characters to read from the file at a time.
+    :return: an iterator over (key, value) pairs of the object, in the order they occur in the file.
+    :raises json.JSONDecodeError: if the file does not contain a JSON object.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    at_end_of_file = False
+
+    def read_more():
+        """ Reads the next chunk of the file into the buffer, discarding the part that has been parsed. """
+        nonlocal buffer, position, at_end_of_file
+        chunk = f.read(chunk_size)
+        at_end_of_file = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+        return not at_end_of_file
+
+    def next_token():
+        """ Skips whitespace, returning the next character without consuming it (or "" at the end of the file). """
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\n\r":
+                position += 1
+            if position < len(buffer) or not read_more():
+                return buffer[position:position + 1]
+
+    def expect(characters):
+        """ Consumes the next character, which must be one of the given characters. """
+        nonlocal position
+        token = next_token()
+        if token == "" or token not in characters:
+            raise json.JSONDecodeError(f"Expecting one of {characters!r}", buffer, position)
+        position += 1
+        return token
+
+    def next_value():
+        """ Decodes the next JSON value, reading more of the file for as long as the value may be incomplete. """
+        nonlocal position
+        next_token()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                # a number may continue in the part of the file that is not yet read, so a value is only complete
+                # once it is followed by a separator.
+                if end < len(buffer) and buffer[end] in " \t\n\r:,}" or at_end_of_file:
+                    position = end
+                    return value
+            except json.JSONDecodeError:
+                if at_end_of_file:
+                    raise
+            read_more()
+
+    expect("{")
+    if next_token() == "}":
+        return
+    while True:
+        key = next_value()
+        if not isinstance(key, str):
+            raise json.JSONDecodeError("Expecting property name", buffer, position)
+        expect(":")
+        yield key, next_value()
+        if expect(",}") == "}":
+            return
+
+
+def build_reverse_index(steno_dict_items, words):
+    """
+    Builds a mapping from written words to the strokes that can be used to type them, with the strokes already parsed
+    into chords. Chords are stored as masks (see Chord.mask), which is cheap to serialize.
+
+    :param steno_dict_items: the entries of the Plover stenography dictionary, as (stroke, word) pairs.
+    :param words: the words to index, or None to index all words. Words not in this collection are left out of the
+    index.
+    :return: a dictionary mapping words to a list of strokes, each being a tuple of chords.
+    """
+    reverse_index = {}
+    for stroke, word in steno_dict_items:
+        if words is not None and word not in words or not _is_usable_stroke(stroke):
+            continue
+        try:
+            # every entry is parsed once, so its chords are parsed without memoizing the whole stroke.
+            chord_masks = tuple(parse_chord(chord).mask for chord in stroke.split("/"))
+        except ValueError:
+            continue
+        reverse_index.setdefault(word, []).append(chord_masks)
+    return reverse_index
+
+
+def _read_cache(cache_path, words_digest):
+    """ Reads a compiled dictionary cache, returning its header and reverse index or None when the cache is missing,
+    corrupt or was compiled for a different set of words. """
+    try:
+        with open(cache_path, "rb") as f:
+            index = DictionaryIndex(f.read())
+    except (OSError, ValueError, TypeError, KeyError):
+        return None
+    header = index.header
+    if header.get("cache_version") != CACHE_FORMAT_VERSION or header.get("words_digest") != words_digest:
+        return None
+    # the whole index is decoded, so its arrays are converted into lists in one go rather than element by element.
+    word_offsets, stroke_offsets, chord_offsets, chord_masks = (view.tolist() for view in (
+        index._word_offsets, index._stroke_offsets, index._chord_offsets, index._chord_masks))
+    string_table = bytes(index._view[index._words_start:index._words_start + word_offsets[-1]])
+    reverse_index = {}
+    for i in range(len(index)):
+        reverse_index[string_table[word_offsets[i]:word_offsets[i + 1]].decode("utf-8")] = [
+            tuple(chord_masks[chord_offsets[stroke]:chord_offsets[stroke + 1]])
+            for stroke in range(stroke_offsets[i], stroke_offsets[i + 1])]
+    index.close()
+    return header, reverse_index
+
+
+def _write_cache(cache_path, header, reverse_index):
+    """ Writes a compiled dictionary cache. The cache is written to a temporary file that is then renamed, so that a
+    concurrently starting program never observes a partially written cache. Failing to write the cache is not fatal,
+    it only means that the next startup is slow as well. """
+    temp_path = cache_path.with_name(cache_path.name + f".{os.getpid()}.tmp")
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(_encode_dictionary_index(header, reverse_index))
+        os.replace(temp_path, cache_path)
+    except OSError:
+        try:
+            temp_path.unlink()
+        except OSError:
+            pass
+
+
+def load_reverse_dictionary(steno_dict_path, words, use_cache=True, streaming=False):
+    """
+    Loads the reverse index of a Plover stenography dictionary for the given words. The index is compiled into a cache
+    next to the dictionary, keyed on the size, modification time and contents of the dictionary, so that later startups
+    do not need to parse the full dictionary. The cache is rebuilt automatically when the dictionary changes.
+
+    :param steno_dict_path: path to the Plover stenography dictionary (in JSON format).
+    :param words: the words to index.
+    :param use_cache: whether to read and write the compiled cache.
+    :param streaming: whether to parse the dictionary incrementally when the cache needs to be (re)built. This is
+    slower, but never holds the complete dictionary in memory.
+    :return: a dictionary mapping each word to a list of strokes, each being a list of chords.
+    """
+    steno_dict_path = Path(steno_dict_path)
+    words = frozenset(words)
+    words_digest = _words_digest(words)
+    cache_path = cache_path_for(steno_dict_path)
+    source_stat = os.stat(steno_dict_path)
+
+    reverse_index = None
+    if use_cache:
+        cached = _read_cache(cache_path, words_digest)
+        if cached is not None:
+            header, cached_index = cached
+            if header["size"] == source_stat.st_size and header["mtime_ns"] == source_stat.st_mtime_ns:
+                reverse_index = cached_index
+            elif header["size"] == source_stat.st_size and header["sha256"] == _file_digest(steno_dict_path):
+                # the dictionary was touched but not changed, so only the modification time needs to be refreshed.
+                reverse_index = cached_index
+                _write_cache(cache_path, dict(header, mtime_ns=source_stat.st_mtime_ns), reverse_index)
+
+    if reverse_index is None:
+        with open(steno_dict_path, "r") as f:
+            if streaming:
+                reverse_index = build_reverse_index(iter_json_object_items(f), words)
+            else:
+                # the full dictionary is only referenced during indexing and is released as soon as it is done.
+                reverse_index = build_reverse_index(json.load(f).items(), words)
+        if use_cache:
+            header = {
+                "cache_version": CACHE_FORMAT_VERSION,
+                "size": source_stat.st_size,
+                "mtime_ns": source_stat.st_mtime_ns,
+                "sha256": _file_digest(steno_dict_path),
+                "words_digest": words_digest
+            }
+            _write_cache(cache_path, header, reverse_index)
+
+    return {word: [[Chord.from_mask(mask) for mask in stroke] for stroke in strokes]
+            for word, strokes in reverse_index.items()}
+
+
+def index_path_for(steno_dict_path):
+    """
+    :param steno_dict_path: path to the Plover stenography dictionary.
+    :return: path of the dictionary index that belongs to the given dictionary, stored next to it.
+    """
+    steno_dict_path = Path(steno_dict_path)
+    return steno_dict_path.with_name(steno_dict_path.name + ".index")
+
+
+class DictionaryIndex(Mapping):
+    """
+    Read-only mapping from written words to the strokes that can be used to type them, like the dictionary returned by
+    load_reverse_dictionary, stored in a compact binary format that is queried in place. Opened from a file with
+    open_dictionary_index, the index is memory-mapped, so that all processes using the same dictionary share its pages
+    and only the strokes of words that are looked up are ever converted into Python objects.
+
+    The index begins with a magic number, the length of a JSON header and the header itself, which describes the
+    dictionary the index was built from and the sizes of the following arrays of 32-bit unsigned integers (in the byte
+    order of the machine that built it):
+
+    - word offsets: for every word and one past the last, the offset of the word in the string table.
+    - stroke offsets: for every word and one past the last, the index of its first stroke.
+    - chord offsets: for every stroke and one past the last, the index of its first chord.
+    - chord masks: every chord, as a mask of keys (see Chord.mask).
+
+    These are followed by the string table, holding all words encoded in UTF-8 and sorted, so that a word is found by
+    binary search.
+    """
+    def __init__(self, buffer):
+        """
+        :param buffer: the contents of an index, as bytes or a memory map.
+        :raises ValueError: if the buffer does not contain a valid index.
+        """
+        self.header, data_start = _read_index_header(buffer)
+        n_words, n_strokes, n_chords = self.header["n_words"], self.header["n_strokes"], self.header["n_chords"]
+        self._buffer = buffer
+        self._view = memoryview(buffer)
+        self._data_start = position = data_start
+        sections = []
+        for length in (n_words + 1, n_words + 1, n_strokes + 1, n_chords):
+            sections.append(self._view[position:position + 4 * length].cast("I"))
+            position += 4 * length
+        self._word_offsets, self._stroke_offsets, self._chord_offsets, self._chord_masks = sections
+        self._words_start = position
+        if len(buffer) < self._words_start + self._word_offsets[n_words]:
+            raise ValueError("Truncated dictionary index")
+        self._n_words = n_words
+        # strokes of the words that were looked up, converted into chords.
+        self._strokes = {}
+
+    def __len__(self):
+        return self._n_words
+
+    def __iter__(self):
+        for i in range(self._n_words):
+            yield self._word_at(i).decode("utf-8")
+
+    def __contains__(self, word):
+        return self._find(word) >= 0
+
+    def __getitem__(self, word):
+        strokes = self._strokes.get(word)
+        if strokes is None:
+            i = self._find(word)
+            if i < 0:
+                raise KeyError(word)
+            chord_offsets, chord_masks = self._chord_offsets, self._chord_masks
+            strokes = self._strokes[word] = [
+                [Chord.from_mask(mask) for mask in chord_masks[chord_offsets[stroke]:chord_offsets[stroke + 1]]]
+                for stroke in range(self._stroke_offsets[i], self._stroke_offsets[i + 1])]
+        return strokes
+
+    def _word_at(self, i):
+        """ Returns the i-th word of the string table, encoded in UTF-8. """
+        words_start, word_offsets = self._words_start, self._word_offsets
+        return bytes(self._view[words_start + word_offsets[i]:words_start + word_offsets[i + 1]])
+
+    def _find(self, word):
+        """ Returns the position of a word in the string table, or -1 if it is not in the index. """
+        if not isinstance(word, str):
+            return -1
+        encoded_word = word.encode("utf-8")
+        low, high = 0, self._n_words
+        while low < high:
+            middle = (low + high) // 2
+            if self._word_at(middle) < encoded_word:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < self._n_words and self._word_at(low) == encoded_word else -1
+
+    def close(self):
+        """ Releases the index, unmapping its file. The index must not be used afterwards. """
+        for view in (self._word_offsets, self._stroke_offsets, self._chord_offsets, self._chord_masks, self._view):
+            view.release()
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+
+def _read_index_header(buffer):
+    """ Reads the header of a dictionary index, returning it and the position the arrays of the index begin at. """
+    magic_length = len(_INDEX_MAGIC)
+    if bytes(buffer[:magic_length]) != _INDEX_MAGIC or len(buffer) < magic_length + 4:
+        raise ValueError("Not a dictionary index")
+    header_length, = struct.unpack_from("<I", buffer, magic_length)
+    data_start = magic_length + 4 + header_length
+    try:
+        header = json.loads(bytes(buffer[magic_length + 4:data_start]))
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise ValueError("Corrupt dictionary index header") from None
+    if not isinstance(header, dict) or header.get("version") != INDEX_FORMAT_VERSION or \
+            header.get("byteorder") != sys.byteorder:
+        raise ValueError("Dictionary index of a different version or byte order")
+    return header, data_start
+
+
+def _encode_dictionary_index(header, reverse_index):
+    """ Encodes a reverse index, as built by build_reverse_index, into the contents of a dictionary index with the given
+    header (to which the sizes of the arrays are added). """
+    word_offsets, stroke_offsets, chord_offsets, chord_masks = array("I", [0]), array("I", [0]), array("I", [0]), \
+        array("I")
+    encoded_words = []
+    for encoded_word, strokes in sorted((word.encode("utf-8"), strokes) for word, strokes in reverse_index.items()):
+        encoded_words.append(encoded_word)
+        word_offsets.append(word_offsets[-1] + len(encoded_word))
+        for stroke in strokes:
+            chord_masks.extend(stroke)
+            chord_offsets.append(len(chord_masks))
+        stroke_offsets.append(len(chord_offsets) - 1)
+    header = dict(header, version=INDEX_FORMAT_VERSION, byteorder=sys.byteorder, n_words=len(encoded_words),
+                  n_strokes=len(chord_offsets) - 1, n_chords=len(chord_masks))
+    return _join_index(header, [word_offsets.tobytes(), stroke_offsets.tobytes(), chord_offsets.tobytes(),
+                                chord_masks.tobytes()] + encoded_words)
+
+
+def _join_index(header, parts):
+    """ Joins the header of a dictionary index and the encoded arrays and string table following it. """
+    encoded_header = json.dumps(header).encode("utf-8")
+    # the header is padded so that the arrays are aligned.
+    encoded_header += b" " * (-(len(_INDEX_MAGIC) + 4 + len(encoded_header)) % 4)
+    return b"".join([_INDEX_MAGIC, struct.pack("<I", len(encoded_header)), encoded_header] + parts)
+
+
+def _map_index(index_path):
+    """ Memory-maps a dictionary index, returning None if it is missing or invalid. """
+    try:
+        with open(index_path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        return DictionaryIndex(mapped)
+    except (ValueError, TypeError, KeyError):
+        mapped.close()
+        return None
+
+
+def _write_index(index_path, contents):
+    """ Writes a dictionary index, replacing the file so that processes that have mapped the old index keep using it
+    undisturbed. Returns whether the index could be written. """
+    temp_path = index_path.with_name(index_path.name + f".{os.getpid()}.tmp")
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(contents)
+        os.replace(temp_path, index_path)
+        return True
+    except OSError:
+        try:
+            temp_path.unlink()
+        except OSError:
+            pass
+        return False
+
+
+def open_dictionary_index(steno_dict_path, streaming=False):
+    """
+    Opens the index of all words of a Plover stenography dictionary (see DictionaryIndex), kept next to the dictionary.
+    The index is keyed on the size, modification time and contents of the dictionary like the compiled cache of
+    load_reverse_dictionary, and is rebuilt automatically when the dictionary changes. As the index holds every word,
+    it is shared by all processes regardless of which lessons they use. If the index cannot be written (for example on
+    Windows while another process has it mapped), it is kept in memory instead.
+
+    :param steno_dict_path: path to the Plover stenography dictionary (in JSON format).
+    :param streaming: whether to parse the dictionary incrementally when the index needs to be (re)built.
+    :return: the index.
+    """
+    steno_dict_path = Path(steno_dict_path)
+    index_path = index_path_for(steno_dict_path)
+    source_stat = os.stat(steno_dict_path)
+
+    index = _map_index(index_path)
+    contents = None
+    if index is not None:
+        header = index.header
+        if header.get("size") == source_stat.st_size and header.get("mtime_ns") == source_stat.st_mtime_ns:
+            return index
+        if header.get("size") == source_stat.st_size and header.get("sha256") == _file_digest(steno_dict_path):
+            # the dictionary was touched but not changed, so only the modification time needs to be refreshed.
+            contents = _join_index(dict(header, mtime_ns=source_stat.st_mtime_ns),
+                                   [bytes(index._view[index._data_start:])])
+        index.close()
+
+    if contents is None:
+        with open(steno_dict_path, "r") as f:
+            if streaming:
+                reverse_index = build_reverse_index(iter_json_object_items(f), None)
+            else:
+                # the full dictionary is only referenced during indexing and is released as soon as it is done.
+                reverse_index = build_reverse_index(json.load(f).items(), None)
+        contents = _encode_dictionary_index({"size": source_stat.st_size, "mtime_ns": source_stat.st_mtime_ns,
+                                             "sha256": _file_digest(steno_dict_path)}, reverse_index)
+        del reverse_index
+    if _write_index(index_path, contents):
+        index = _map_index(index_path)
+        if index is not None:
+            return index
+    return DictionaryIndex(contents)
@@ -1,6 +1,7 @@
 
 from enum import IntEnum, unique
 from collections import namedtuple
+from functools import lru_cache
 
 
 @unique
@@ -39,25 +40,47 @@ class StenoKeys(IntEnum):
         :return: a number that may be used to determine the location of this key in steno order. For a definition of
         steno order, look it up in the "Learn Plover" series.
         """
-        left_half_order = "STKPWHRAO*"
-        right_half_order = "EUFRPBLGTSDZ"
-        if self.value <= self.STAR:
-            return left_half_order.index(self.letter)
-        else:
-            return len(left_half_order) + right_half_order.index(self.letter)
+        return StenoKeys._orders[self]
 
     @property
     def letter(self):
         """
         :return: the letter printed on this key.
         """
-        return "STPHKWRAO*EUFPLTDRBGSZ"[self.value]
+        return StenoKeys._letters[self]
 
     @property
     def column(self):
         """
         :return: the column this key is present in on the keyboard. The center vowels have separate columns.
         """
+        return StenoKeys._columns[self]
+
+    @property
+    def row(self):
+        """
+        :return: the row this key is present in on the keyboard.
+        """
+        return StenoKeys._rows[self]
+
+    @property
+    def mask(self):
+        """
+        :return: the bit representing this key in a StenoKeySet.
+        """
+        return 1 << self
+
+    def _compute_order(self):
+        """ Computes the order of this key, see order. """
+        left_half_order = "STKPWHRAO*"
+        right_half_order = "EUFRPBLGTSDZ"
+        if self.value <= self.STAR:
+            return left_half_order.index(self.letter)
+        else:
+            return len(left_half_order) + right_half_order.index(self.letter)
+
+    def _compute_column(self):
+        """ Computes the column of this key, see column. """
         if StenoKeys.S_L <= self.value <= StenoKeys.H_L:
             return self.value
         elif StenoKeys.K_L <= self.value <= StenoKeys.R_L:
@@ -71,11 +94,8 @@ class StenoKeys(IntEnum):
         else:
             raise AssertionError("I am an unknown key.")
 
-    @property
-    def row(self):
-        """
-        :return: the row this key is present in on the keyboard.
-        """
+    def _compute_row(self):
+        """ Computes the row of this key, see row. """
         rows = [
             [range(StenoKeys.S_L, StenoKeys.H_L + 1), range(StenoKeys.F_R, StenoKeys.D_R + 1), [StenoKeys.STAR]],
             [range(StenoKeys.K_L, StenoKeys.R_L + 1), range(StenoKeys.R_R, StenoKeys.Z_R + 1)],
@@ -87,12 +107,165 @@ class StenoKeys(IntEnum):
         raise AssertionError("I am an unknown key.")
 
 
-"""
-A set of steno keys that are pressed simultaneously to form a word or part of a word.
+# the geometry of every key is computed once and stored in tuples indexed by key, as it is looked up very frequently.
+StenoKeys._letters = tuple("STPHKWRAO*EUFPLTDRBGSZ")
+StenoKeys._orders = tuple(key._compute_order() for key in StenoKeys.__members__.values())
+StenoKeys._columns = tuple(key._compute_column() for key in StenoKeys.__members__.values())
+StenoKeys._rows = tuple(key._compute_row() for key in StenoKeys.__members__.values())
 
-:param keys: the keys in the chord
-"""
-Chord = namedtuple('Chord', 'keys')
+
+def _mask_of(keys):
+    """ Converts keys, given in any iterable or as a mask, into a mask (a plain integer). """
+    if isinstance(keys, int):
+        return int(keys)
+    mask = 0
+    for key in keys:
+        mask |= 1 << key
+    return mask
+
+
+class StenoKeySet(int):
+    """
+    An immutable set of steno keys, represented as a 22-bit integer with one bit per key (see StenoKeys.mask). Behaves
+    like a set of StenoKeys for membership tests, iteration (in the order of the keys), set algebra and comparisons,
+    while every operation is a single integer operation and the set takes no more memory than an integer. Use int() or
+    Chord.mask to get at the integer itself.
+    """
+    __slots__ = ()
+
+    # all keys, indexed by the bit positions of a mask.
+    _keys = tuple(StenoKeys.__members__.values())
+
+    @classmethod
+    def of(cls, keys):
+        """
+        :param keys: the keys to include in the set, in any iterable (or as a mask).
+        :return: a set of the given keys.
+        """
+        return cls(_mask_of(keys))
+
+    def __contains__(self, key):
+        return self >> key & 1 == 1
+
+    def __iter__(self):
+        mask = int(self)
+        while mask:
+            lowest_bit = mask & -mask
+            yield StenoKeySet._keys[lowest_bit.bit_length() - 1]
+            mask ^= lowest_bit
+
+    def __len__(self):
+        return bin(self).count("1")
+
+    def __or__(self, other):
+        return StenoKeySet(int(self) | _mask_of(other))
+
+    def __and__(self, other):
+        return StenoKeySet(int(self) & _mask_of(other))
+
+    def __sub__(self, other):
+        return StenoKeySet(int(self) & ~_mask_of(other))
+
+    def __xor__(self, other):
+        return StenoKeySet(int(self) ^ _mask_of(other))
+
+    __ror__ = __or__
+    __rand__ = __and__
+    __rxor__ = __xor__
+
+    def __rsub__(self, other):
+        return StenoKeySet(_mask_of(other) & ~int(self))
+
+    def issubset(self, other):
+        """ :return: whether every key in this set is also in the other set. """
+        return int(self) & ~_mask_of(other) == 0
+
+    def issuperset(self, other):
+        """ :return: whether every key in the other set is also in this set. """
+        return _mask_of(other) & ~int(self) == 0
+
+    # comparisons are those of sets rather than of integers: equality with key sets, sets and frozensets of keys, and
+    # subset and superset relations. Comparisons with plain integers are not supported, like those of sets.
+    def __eq__(self, other):
+        other_mask = _set_mask_of(other)
+        if other_mask is None:
+            return False if isinstance(other, int) else NotImplemented
+        return int(self) == other_mask
+
+    def __ne__(self, other):
+        is_equal = self.__eq__(other)
+        return is_equal if is_equal is NotImplemented else not is_equal
+
+    def __hash__(self):
+        # equal to the hash of a frozenset of the same keys, as the two compare equal.
+        return hash(frozenset(self))
+
+    def __le__(self, other):
+        other_mask = other if type(other) is StenoKeySet else _comparable_mask_of(self, other, "<=")
+        return int(self) & ~int(other_mask) == 0
+
+    def __lt__(self, other):
+        other_mask = other if type(other) is StenoKeySet else _comparable_mask_of(self, other, "<")
+        return int(self) & ~int(other_mask) == 0 and int(self) != int(other_mask)
+
+    def __ge__(self, other):
+        other_mask = other if type(other) is StenoKeySet else _comparable_mask_of(self, other, ">=")
+        return int(other_mask) & ~int(self) == 0
+
+    def __gt__(self, other):
+        other_mask = other if type(other) is StenoKeySet else _comparable_mask_of(self, other, ">")
+        return int(other_mask) & ~int(self) == 0 and int(self) != int(other_mask)
+
+    def __repr__(self):
+        return f"StenoKeySet({{{', '.join(key.name for key in self)}}})"
+
+
+def _set_mask_of(keys):
+    """ Returns the mask of a key set, or of a set or frozenset of keys, or None for anything else, including plain
+    integers and sets holding anything but keys. """
+    if isinstance(keys, StenoKeySet):
+        return int(keys)
+    if isinstance(keys, (set, frozenset)) and all(isinstance(key, StenoKeys) for key in keys):
+        return _mask_of(keys)
+    return None
+
+
+def _comparable_mask_of(key_set, other, operator):
+    """ Returns the mask of a key set, set or frozenset of keys to compare a key set to, raising a TypeError like sets
+    do for anything else. """
+    other_mask = _set_mask_of(other)
+    if other_mask is None:
+        raise TypeError(f"'{operator}' not supported between instances of '{type(key_set).__name__}' and "
+                        f"'{type(other).__name__}'")
+    return other_mask
+
+
+class Chord(namedtuple('Chord', 'keys')):
+    """
+    A set of steno keys that are pressed simultaneously to form a word or part of a word. The keys are stored as a
+    StenoKeySet, so a chord is little more than an integer.
+
+    :param keys: the keys in the chord, in any iterable (or as a mask).
+    """
+    __slots__ = ()
+
+    def __new__(cls, keys=()):
+        return super().__new__(cls, keys if type(keys) is StenoKeySet else StenoKeySet(_mask_of(keys)))
+
+    @classmethod
+    def from_mask(cls, mask):
+        """
+        :param mask: the keys of the chord, as a mask of StenoKeys.mask bits.
+        :return: the chord.
+        """
+        return super().__new__(cls, StenoKeySet(mask))
+
+    @property
+    def mask(self):
+        """
+        :return: the keys of the chord, as a mask of StenoKeys.mask bits.
+        """
+        return int(self.keys)
 
 
 """
@@ -102,3 +275,104 @@ A sequence of chords that together form a written word.
 :param written_word: the word that is written.
 """
 Stroke = namedtuple('Stroke', 'chord_sequence written_word')
+
+
+# all keys, in steno order.
+_keys_in_steno_order = tuple(sorted(StenoKeys.__members__.values(), key=lambda key: key.order))
+
+# _key_at_or_after[position][letter] is the mask of the first key in steno order, at or after the given position in
+# steno order, that has the given letter printed on it, together with the position following that key. Used for
+# parsing chords with one table lookup per letter.
+_key_at_or_after = [{}]
+for _key in reversed(_keys_in_steno_order):
+    _key_at_or_after.insert(0, dict(_key_at_or_after[0], **{_key.letter: (_key.mask, _key.order + 1)}))
+del _key
+
+# mask of the vowel keys and "*", which separate the left and right half of the keyboard in a written chord.
+_center_keys_mask = _mask_of([StenoKeys.A, StenoKeys.O, StenoKeys.STAR, StenoKeys.E, StenoKeys.U])
+# mask of the keys on the right half of the keyboard.
+_right_half_keys_mask = _mask_of(key for key in StenoKeys.__members__.values() if key >= StenoKeys.F_R)
+
+# position in steno order to continue parsing from after a "-", which separates the left and right half of the
+# keyboard.
+_right_half_position = StenoKeys.STAR.order + 1
+
+
+@lru_cache(maxsize=1 << 12)
+def parse_chord(chord):
+    """
+    Parses a single chord as written in the plover dictionary, that is a sequence of letters in "Steno Order" (look it
+    up in the Learn Plover series), optionally including a "-" to indicate separation between the left and right half
+    of the stenography keyboard. Every letter is matched to the first key with that letter in steno order after the
+    previous letter. The most recently parsed chords are memoized, as the same chords occur over and over again.
+
+    :param chord: the chord as written in the plover dictionary, for example "TKPWRAOEUPBD".
+    :return: the parsed chord.
+    :raises ValueError: if the chord is not written in steno order.
+    """
+    position = 0
+    mask = 0
+    try:
+        for letter in chord:
+            if letter == "-":
+                position = max(position, _right_half_position)
+            else:
+                key_mask, position = _key_at_or_after[position][letter]
+                mask |= key_mask
+    except (KeyError, IndexError):
+        raise ValueError(f"Cannot parse chord {chord!r}") from None
+    return Chord.from_mask(mask)
+
+
+def parse_stroke(stroke):
+    """
+    Parses a stroke in the plover dictionary. A stroke consists of multiple chords separated by "/", see parse_chord.
+    The most recently parsed strokes are memoized, so parsing strokes that recur (as in exercise logs) is mostly a
+    single lookup, while parsing a whole dictionary once does not keep all of its strokes in memory.
+
+    :param stroke: the stroke as written in the plover dictionary, for example "TKPWRAOEUPBD".
+    :return: a list of chords.
+    :raises ValueError: if the stroke is not written in steno order.
+    """
+    return list(_parse_stroke(stroke))
+
+
+@lru_cache(maxsize=1 << 12)
+def _parse_stroke(stroke):
+    """ Memoized implementation of parse_stroke, returning an immutable tuple of chords. """
+    return tuple(parse_chord(chord) for chord in stroke.split("/"))
+
+
+def format_chord(chord):
+    """
+    Writes a chord the way it is written in the plover dictionary, that is its letters in steno order. A "-" separates
+    the left and right half of the keyboard when there are no vowels or "*" in the chord to do so.
+
+    :param chord: the chord to write.
+    :return: the chord in written form, for example "TKPWRAOEUPBD".
+    """
+    return _format_mask(int(chord.keys))
+
+
+@lru_cache(maxsize=1 << 16)
+def _format_mask(mask):
+    """ Memoized implementation of format_chord, for a chord given as a mask. """
+    written_chord = ""
+    needs_separator = mask & _right_half_keys_mask and not mask & _center_keys_mask
+    for key in _keys_in_steno_order:
+        if mask >> key & 1:
+            if needs_separator and key >= StenoKeys.F_R:
+                written_chord += "-"
+                needs_separator = False
+            written_chord += key.letter
+    return written_chord
+
+
+def format_stroke(chords):
+    """
+    Writes a sequence of chords the way it is written in the plover dictionary, the inverse of parse_stroke.
+
+    :param chords: the chords to write.
+    :return: the stroke in written form, with chords separated by "/".
+    """
+    return "/".join(format_chord(chord) for chord in chords)
@@ -0,0 +1,169 @@
+"""
+Replays simulated typing into an exercise frame, as a repeatable test of the user interface when typing. A simulated
+typist types the words of an exercise the way Plover does, emitting a burst of characters for every stroke, and
+occasionally mistypes a word, erases it with backspaces and types it again. The keystrokes are fed into the entries of
+the exercise frame with the timing of the simulated typist, and the result of the exercise is checked against the
+timing of the typist. Run as "python typing_replay.py" to replay a synthetic exercise; this needs a display, which can
+be a virtual one, as in "xvfb-run -a python typing_replay.py". The exit status is 1 if any word does not match the
+typist and 2 if there is no display, so that the replay can serve as a test.
+"""
+from collections import namedtuple
+from random import Random
+import argparse
+import sys
+import time
+import tkinter as tk
+
+"""
+A burst of keystrokes, as emitted by Plover for a stroke.
+
+:param time: time of the burst in seconds, counted from the beginning of the exercise.
+:param backspaces: amount of characters erased before typing the text.
+:param text: the text typed.
+"""
+Keystroke = namedtuple("Keystroke", "time backspaces text")
+
+
+def simulate_typist(strokes, seed=0, typo_rate=0.05, min_interval=0.2, max_interval=1.0):
+    """
+    Simulates a typist typing the words of an exercise.
+
+    :param strokes: strokes of the words of the exercise.
+    :param seed: seed for the random generator, so that the same keystrokes are generated every time.
+    :param typo_rate: probability of a word being mistyped before it is typed correctly.
+    :param min_interval: minimum time in seconds between bursts of keystrokes.
+    :param max_interval: maximum time in seconds between bursts of keystrokes.
+    :return: the bursts of keystrokes in the order they are typed, and for every word whether it is expected to count
+    as typed correctly and its expected typing time.
+    """
+    random = Random(seed)
+    keystrokes = []
+    expected_word_results = []
+    current_time = 0.0
+    last_finish_time = 0.0
+    for stroke in strokes:
+        text_to_type = " " + stroke.written_word
+        mistyped = random.random() < typo_rate
+        if mistyped:
+            # a single letter of the word is replaced by another one, after which the word is erased.
+            position = random.randrange(1, len(text_to_type))
+            wrong_letter = random.choice([letter for letter in "abcdefghijklmnopqrstuvwxyz"
+                                          if letter != text_to_type[position]])
+            current_time += random.uniform(min_interval, max_interval)
+            keystrokes.append(Keystroke(current_time, 0,
+                                        text_to_type[:position] + wrong_letter + text_to_type[position + 1:]))
+            current_time += random.uniform(min_interval, max_interval)
+            keystrokes.append(Keystroke(current_time, len(text_to_type), ""))
+        current_time += random.uniform(min_interval, max_interval)
+        keystrokes.append(Keystroke(current_time, 0, text_to_type))
+        expected_word_results.append((not mistyped, current_time - last_finish_time))
+        last_finish_time = current_time
+    return keystrokes, expected_word_results
+
+
+class _ReplayListener:
+    """ Listener of an exercise frame that keeps the result of the exercise and ignores all other events. """
+    def __init__(self):
+        self.exercise_result = None
+
+    def set_chord_preview(self, chord):
+        pass
+
+    def finish_exercise(self, exercise_result):
+        self.exercise_result = exercise_result
+
+
+def replay(root, exercise_frame, keystrokes):
+    """
+    Feeds bursts of keystrokes into an exercise frame, one character at a time, with the clock of the exercise frame
+    set to the time of every burst. The user interface is updated after every burst.
+
+    :param root: the main window.
+    :param exercise_frame: the exercise frame, with the exercise already set.
+    :param keystrokes: the bursts of keystrokes, see simulate_typist.
+    :return: the amount of characters fed.
+    """
+    n_characters = 0
+    for keystroke in keystrokes:
+        exercise_frame.clock = lambda: keystroke.time
+        for _ in range(keystroke.backspaces):
+            entry = exercise_frame.active_entry
+            entry.delete(len(entry.get()) - 1)
+        for character in keystroke.text:
+            exercise_frame.active_entry.insert(tk.END, character)
+        n_characters += keystroke.backspaces + len(keystroke.text)
+        root.update_idletasks()
+    return n_characters
+
+
+def run_replay(root, exercise_frame_type, strokes, seed=0, typo_rate=0.05):
+    """
+    Replays a simulated typist typing an exercise in a new exercise frame, checking the result of the exercise.
+
+    :param root: the main window.
+    :param exercise_frame_type: the class of the exercise frame, StenoExerciseFrame or StenoTextExerciseFrame.
+    :param strokes: strokes of the words of the exercise.
+    :param seed: seed for the random generator of the simulated typist.
+    :param typo_rate: probability of a word being mistyped before it is typed correctly.
+    :return: the amount of keystrokes per second that were handled, and a list of descriptions of the words whose
+    result does not match the simulated typing (which is empty if all do).
+    """
+    keystrokes, expected_word_results = simulate_typist(strokes, seed, typo_rate)
+    listener = _ReplayListener()
+    exercise_frame = exercise_frame_type(root, listener)
+    exercise_frame.pack()
+    try:
+        exercise_frame.clock = lambda: 0.0
+        exercise_frame.set_exercise(strokes)
+        root.update()
+        start = time.perf_counter()
+        n_characters = replay(root, exercise_frame, keystrokes)
+        keystrokes_per_second = n_characters / (time.perf_counter() - start)
+    finally:
+        exercise_frame.destroy()
+
+    if listener.exercise_result is None:
+        return keystrokes_per_second, ["the exercise was not finished"]
+    mismatches = []
+    for i, (word_result, (expected_correct, expected_typing_time)) in enumerate(zip(listener.exercise_result.words,
+                                                                                    expected_word_results)):
+        if word_result.stroke != strokes[i] or word_result.is_typed_correctly != expected_correct or \
+                abs(word_result.typing_time - expected_typing_time) > 1e-9:
+            mismatches.append(f"word {i} ({strokes[i].written_word!r}): got {word_result.is_typed_correctly}, "
+                              f"{word_result.typing_time:.6f} s, expected {expected_correct}, "
+                              f"{expected_typing_time:.6f} s")
+    if len(listener.exercise_result.words) != len(strokes):
+        mismatches.append(f"got {len(listener.exercise_result.words)} words, expected {len(strokes)}")
+    return keystrokes_per_second, mismatches
+
+
+if __name__ == "__main__":
+    from benchmark import generate_synthetic_exercise_history
+    from ui_elements import StenoExerciseFrame, StenoTextExerciseFrame
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--words", type=int, nargs="+", default=[20, 200], help="amounts of words in the exercise")
+    parser.add_argument("--typo-rate", type=float, default=0.05, help="probability of mistyping a word")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the exercise and the simulated typist")
+    arguments = parser.parse_args()
+
+    try:
+        main_window = tk.Tk()
+    except tk.TclError as error:
+        print(f"No display available ({error})", file=sys.stderr)
+        raise SystemExit(2)
+    main_window.withdraw()
+    failed = False
+    for n_words in arguments.words:
+        exercise_strokes = [word.stroke for word in
+                            generate_synthetic_exercise_history(1, n_words, arguments.seed)[0].words]
+        for name, frame_type in (("widgets", StenoExerciseFrame), ("text", StenoTextExerciseFrame)):
+            rate, word_mismatches = run_replay(main_window, frame_type, exercise_strokes, arguments.seed,
+                                               arguments.typo_rate)
+            print(f"{n_words:5} words, {name:7}: {rate:9.0f} keystrokes/s, "
+                  f"{'timings match' if not word_mismatches else f'{len(word_mismatches)} mismatches'}")
+            for mismatch in word_mismatches:
+                print(f"    {mismatch}")
+            failed = failed or bool(word_mismatches)
+    main_window.destroy()
+    raise SystemExit(1 if failed else 0)
@@ -1,17 +1,21 @@
 import tkinter as tk
+import tkinter.filedialog as filedialog
 import tkinter.ttk as ttk
 from datetime import datetime
+import math
 import time
 import webbrowser
 
-from steno_keys import StenoKeys, Chord
+from steno_keys import StenoKeys, Chord, format_stroke
 from exercise_log import ExerciseResult, ExerciseWordResult, ExerciseSettings
 from learn_plover import learn_plover_lessons
+from word_statistics import word_statistics_modes
 
 
 class StenoMachinePreview(ttk.Frame):
     """
-    Shows a steno machine view, highlighting the keys that should be pressed to complete the current word.
+    Shows a steno machine view, highlighting the keys that should be pressed to complete the current word. The keys
+    that are highlighted are tracked as masks (see Chord.mask), so that only keys that change are redrawn.
     """
     def __init__(self,
                  parent,
@@ -27,7 +31,11 @@ class StenoMachinePreview(ttk.Frame):
         self.canvas = tk.Canvas(self, width=800, height=200)
         self.canvas.pack()
 
+        # keys and their squares on the canvas, in order of their value.
         self.keys = []
+        # masks of the keys highlighted as part of the chord to press now, and as part of later chords.
+        self._current_mask = 0
+        self._upcoming_mask = 0
 
         column_offsets = [0, 1, 2, 3,  # S TPH/KWR
                           2.5, 3.5,  # AO
@@ -44,12 +52,49 @@ class StenoMachinePreview(ttk.Frame):
             self.canvas.create_text(x + w * 0.5, y + h * 0.5, text=key.letter)
             self.keys.append((key, key_square))
 
+        # the chords of a sequence of several chords are spelled out next to the keyboard.
+        self._caption = self.canvas.create_text((max(column_offsets) + 1.5) * (key_size + key_spacing), key_size * 0.5,
+                                                text="", anchor="w", font=('Monospace', 12))
+        self._caption_text = ""
+
     def set_chord(self, chord: Chord):
         """
         Updates the preview to highlight the keys in the given chord.
         """
-        for key, key_square in self.keys:
-            self.canvas.itemconfigure(key_square, fill='yellow' if chord is not None and key in chord.keys else 'gray')
+        self.set_chord_sequence([] if chord is None else [chord])
+
+    def set_chord_sequence(self, chords, current=0):
+        """
+        Updates the preview to show a sequence of chords, highlighting the keys of the chord to press now and, in
+        another color, the keys only pressed in the other chords of the sequence. The sequence is spelled out next to
+        the keyboard if it consists of more than one chord.
+
+        :param chords: the chords to show, which may be empty to show no chord.
+        :param current: index of the chord to press now.
+        """
+        current_mask = chords[current].mask if current < len(chords) else 0
+        upcoming_mask = 0
+        for chord in chords:
+            upcoming_mask |= chord.mask
+        upcoming_mask &= ~current_mask
+        self._highlight(current_mask, upcoming_mask)
+
+        caption_text = format_stroke(chords) if len(chords) > 1 else ""
+        if caption_text != self._caption_text:
+            self.canvas.itemconfigure(self._caption, text=caption_text)
+            self._caption_text = caption_text
+
+    def _highlight(self, current_mask, upcoming_mask):
+        """ Highlights the keys in the given masks, only redrawing the keys that were highlighted differently. """
+        changed_mask = (current_mask ^ self._current_mask) | (upcoming_mask ^ self._upcoming_mask)
+        while changed_mask:
+            key_mask = changed_mask & -changed_mask
+            key, key_square = self.keys[key_mask.bit_length() - 1]
+            fill = 'yellow' if current_mask & key_mask else 'light goldenrod' if upcoming_mask & key_mask else 'gray'
+            self.canvas.itemconfigure(key_square, fill=fill)
+            changed_mask ^= key_mask
+        self._current_mask = current_mask
+        self._upcoming_mask = upcoming_mask
 
 
 class StenoExerciseFrame(ttk.Frame):
@@ -64,6 +109,13 @@ class StenoExerciseFrame(ttk.Frame):
         super().__init__(parent)
 
         self.words = []
+        # clock that typing is timed with, which may be replaced to replay typing with given timing.
+        self.clock = time.monotonic
+        # time at which the user last changed the text typed, see WordInExercise._on_change.
+        self.input_time = 0
+        # widgets of words created so far, which are reused for later exercises. The first of them are the words of the
+        # current exercise, the rest are hidden.
+        self._word_pool = []
         self.word_i = 0
         self.exercise_begin_time = 0
         self.exercise_begin_date = None
@@ -71,6 +123,7 @@ class StenoExerciseFrame(ttk.Frame):
         # the tk.Text widget can host any widgets in a flow layout, which we exploit here
         self.words_flow_container = tk.Text(self)
         self.words_flow_container.configure(borderwidth=0, highlightthickness=0)
+        self.words_flow_container.tag_configure("unused", elide=True)
         self.words_flow_container.pack(expand=True, fill=tk.BOTH)
 
         style = ttk.Style(self)
@@ -86,7 +139,8 @@ class StenoExerciseFrame(ttk.Frame):
 
     class WordInExercise(ttk.Frame):
         """ Handles a single word in the exercise. Has a label showing the word to type and an entry underneath that
-        text is entered into. The active entry/word is automatically changed when the previous word is finished. """
+        text is entered into. The active entry/word is automatically changed when the previous word is finished. The
+        widget can be reused for a word of a later exercise, see rebind. """
         def __init__(self,
                      exercise_frame,
                      index,
@@ -100,26 +154,46 @@ class StenoExerciseFrame(ttk.Frame):
 
             self.exercise_frame = exercise_frame
 
-            self.index = index
-            self.stroke = stroke
-
-            self._label = ttk.Label(self, text=" " + stroke.written_word, style="Exercise.TLabel")
+            self._label = ttk.Label(self, style="Exercise.TLabel")
             self._label.pack(anchor="w")
             self._text_entry_var = tk.StringVar(self, "")
             self._text_entry = ttk.Entry(self,
                                          textvariable=self._text_entry_var,
                                          style="Exercise.TEntry",
                                          state=tk.DISABLED,
-                                         width=len(self.text_to_type),  # assign width based on label width
                                          font=('Monospace', 16))
             self._text_entry.pack(anchor="w")
+            self._rebinding = False
             self._text_entry_var.trace_add("write", self._on_change)
 
+            self.rebind(index, stroke)
+
+        def rebind(self, index, stroke):
+            """
+            Resets the word to be typed anew, possibly showing another stroke. Used to reuse the widget for a word in a
+            later exercise rather than creating a new one.
+
+            :param index: index of the word in the exercise
+            :param stroke: stroke for the word, that is the chords to type it as well as the actual written word
+            """
+            self.index = index
+            self.stroke = stroke
+
             self.incorrectly_typed = False
             self.finished = False
             self.is_first_word = False
             self.finish_time = 0
 
+            self._label.configure(text=" " + stroke.written_word)
+            # assign width based on label width
+            self._text_entry.configure(state=tk.DISABLED, width=len(self.text_to_type))
+            # clearing the entry is not a change made by the user, so it is not handled as one.
+            self._rebinding = True
+            try:
+                self._text_entry_var.set("")
+            finally:
+                self._rebinding = False
+
         @property
         def text_to_type(self):
             """Text that is emitted by a keyboard when the word is typed correctly. This is the text in the dictionary
@@ -150,9 +224,12 @@ class StenoExerciseFrame(ttk.Frame):
 
         def _on_change(self, *_):
             """
-            Called by tkinter when the contents of the text entry is updated.
+            Called by tkinter when the contents of the text entry is updated. The time of the change is taken right
+            away, so that time spent updating the user interface is not counted as time spent typing.
             """
-            self.on_contents_update()
+            if not self._rebinding:
+                self.exercise_frame.input_time = self.exercise_frame.clock()
+                self.on_contents_update()
 
         def _show_chord_preview(self):
             """ Shows the chord to use to type this word in the preview. """
@@ -161,7 +238,7 @@ class StenoExerciseFrame(ttk.Frame):
         def _on_completely_typed(self):
             """ Called when this word is completely typed, will set the finish time accordingly and show the preview
             of the next word. """
-            self.finish_time = time.monotonic()
+            self.finish_time = self.exercise_frame.input_time
             self.finished = True
             if self._has_next_word:
                 self._next_word._show_chord_preview()
@@ -244,6 +321,11 @@ class StenoExerciseFrame(ttk.Frame):
         exercise_result = ExerciseResult(self.exercise_begin_date, word_results)
         self.listener.finish_exercise(exercise_result)
 
+    @property
+    def active_entry(self):
+        """ The entry that text typed by the user currently goes into. """
+        return self.words[self.word_i]._text_entry
+
     def pause_exercise(self):
         """ Called to pause the exercise when the settings menu is opened. """
         self.words[self.word_i].pause()
@@ -254,35 +336,264 @@ class StenoExerciseFrame(ttk.Frame):
 
     def set_exercise(self, strokes):
         """
-        Sets a new exercise consisting of the given strokes.
+        Sets a new exercise consisting of the given strokes. The widgets of earlier exercises are reused for its words,
+        and new widgets are only created when the exercise is longer than any exercise before.
         """
-        for word in self.words:
-            word.destroy()
         self.words.clear()
 
-        self.exercise_begin_time = time.monotonic()
+        self.exercise_begin_time = self.clock()
         self.exercise_begin_date = datetime.now()
 
+        self.words_flow_container.configure(state=tk.NORMAL)
         for i, stroke in enumerate(strokes):
-            word = self.WordInExercise(self, i, stroke)
-            self.words_flow_container.window_create(tk.INSERT, window=word)
+            if i < len(self._word_pool):
+                word = self._word_pool[i]
+                word.rebind(i, stroke)
+            else:
+                word = self.WordInExercise(self, i, stroke)
+                self.words_flow_container.window_create(tk.END, window=word)
+                self._word_pool.append(word)
             self.words.append(word)
+        # every word takes up a single position on the first line of the text, so the words beyond the exercise are
+        # hidden by eliding the positions after it.
+        self.words_flow_container.tag_remove("unused", "1.0", tk.END)
+        self.words_flow_container.tag_add("unused", f"1.{len(self.words)}", tk.END)
         self.words_flow_container.configure(state=tk.DISABLED)
         self.words[0].begin()
 
 
+class StenoTextExerciseFrame(ttk.Frame):
+    """
+    Presents an exercise to the user and records the progress made, like StenoExerciseFrame, but draws the whole
+    exercise as text in a single text widget rather than creating widgets for every word, so that very long exercises
+    stay quick to show. Words are typed into a single entry underneath the text, which holds the text typed for the
+    current word, and the state of every word (current, typed correctly or typed incorrectly) is shown by tagging it in
+    the text. Words are finished and timed exactly like in StenoExerciseFrame.
+    """
+    def __init__(self, parent, listener):
+        """
+        :param parent: the parent widget
+        :param listener: object that will receive callbacks for exercise events.
+        """
+        super().__init__(parent)
+
+        self.strokes = []
+        self.word_i = 0
+        # clock that typing is timed with, which may be replaced to replay typing with given timing.
+        self.clock = time.monotonic
+        # time at which the user last changed the text typed, see _on_change.
+        self.input_time = 0
+        self.exercise_begin_time = 0
+        self.exercise_begin_date = None
+        # state of every word in the exercise, by index.
+        self._incorrectly_typed = []
+        self._finished = []
+        self._finish_times = []
+        # position of every word in the text, and of the end of the text.
+        self._word_offsets = []
+
+        style = ttk.Style(self)
+        style.configure("Exercise.TEntry", foreground="black", background="white",
+                        fieldbackground="white", borderwidth=0)
+        style.configure("Exercise.TFrame", foreground="white", background="white", borderwidth=0)
+        self.configure(borderwidth=0, style="Exercise.TFrame")
+
+        self.words_text = tk.Text(self, wrap=tk.WORD, font=('Monospace', 16), borderwidth=0, highlightthickness=0,
+                                  state=tk.DISABLED)
+        self.words_text.tag_configure("current", background="light yellow", underline=True)
+        self.words_text.tag_configure("correct", foreground="dark green")
+        self.words_text.tag_configure("incorrect", foreground="red")
+        self.words_text.pack(expand=True, fill=tk.BOTH)
+
+        self._text_entry_var = tk.StringVar(self, "")
+        self._text_entry = ttk.Entry(self, textvariable=self._text_entry_var, style="Exercise.TEntry",
+                                     font=('Monospace', 16))
+        self._text_entry.pack(anchor="w")
+        self._setting_contents = False
+        self._text_entry_var.trace_add("write", self._on_change)
+
+        self.listener = listener
+
+    def _text_to_type(self, index):
+        """ Text that is emitted by a keyboard when the word at the given index is typed correctly, see
+        StenoExerciseFrame.WordInExercise.text_to_type. """
+        return f" {self.strokes[index].written_word}"
+
+    def _word_range(self, index):
+        """ Returns the indices in the text of the beginning and end of the word at the given index. """
+        return f"1.{self._word_offsets[index]}", f"1.{self._word_offsets[index + 1]}"
+
+    def _set_contents(self, contents):
+        """ Sets the contents of the entry without handling it as a change made by the user. """
+        self._setting_contents = True
+        try:
+            self._text_entry_var.set(contents)
+        finally:
+            self._setting_contents = False
+
+    def _show_chord_preview(self, index):
+        """ Shows the chord to use to type the word at the given index in the preview. """
+        self.listener.set_chord_preview(self.strokes[index].chord_sequence[0])
+
+    def _begin_word(self, index, contents):
+        """ Makes the word at the given index the current word, with the given text already typed for it. """
+        self.word_i = index
+        word_range = self._word_range(index)
+        self.words_text.tag_add("current", *word_range)
+        self.words_text.see(word_range[1])
+        self._show_chord_preview(index)
+        self._set_contents(contents)
+        self._on_contents_update()
+
+    def _end_word(self, index):
+        """ Marks the word at the given index as typed, showing whether it was typed correctly. """
+        word_range = self._word_range(index)
+        self.words_text.tag_remove("current", *word_range)
+        self.words_text.tag_add("incorrect" if self._incorrectly_typed[index] else "correct", *word_range)
+
+    def _on_change(self, *_):
+        """
+        Called by tkinter when the contents of the text entry is updated. The time of the change is taken right away,
+        so that time spent updating the user interface is not counted as time spent typing.
+        """
+        if not self._setting_contents:
+            self.input_time = self.clock()
+            self._on_contents_update()
+
+    def _on_contents_update(self):
+        """
+        Called when the contents of the entry is changed, either because of direct text entry, or because of excess
+        text entered for the previous word in the exercise. Follows
+        StenoExerciseFrame.WordInExercise.on_contents_update.
+        """
+        index = self.word_i
+        text_to_type = self._text_to_type(index)
+        new_contents = self._text_entry_var.get()
+        has_next_word = index + 1 < len(self.strokes)
+
+        n_typed_chars = len(new_contents)
+        # correctly_typed reflects whether the contents so far is typed correctly,
+        # so it only compares the contents to the beginning of the text to type.
+        correctly_typed = new_contents == f"{text_to_type} "[:len(new_contents)]
+        # chars to be typed before we can conclude the current word is typed correctly.
+        # this is both the text to type in this word, as well as a whitespace that follows.
+        remaining_chars_to_type = len(text_to_type) + 1 - n_typed_chars
+        # we take time to the point where the complete word is typed. we cannot know that it is correctly typed
+        # before we receive a whitespace beginning the next word.
+        completely_typed = correctly_typed and remaining_chars_to_type <= 1
+        # we advance to the next word once the first whitespace after this word is received, or if this is the last
+        # word.
+        advance_to_next_word = completely_typed and remaining_chars_to_type <= 0 or not has_next_word
+
+        if not correctly_typed:  # mark the word as incorrectly typed when it is
+            self._incorrectly_typed[index] = True
+            self._finished[index] = False
+            self.words_text.tag_add("incorrect", *self._word_range(index))
+            self._show_chord_preview(index)
+        elif completely_typed:
+            if not self._finished[index]:
+                self._finish_times[index] = self.input_time
+                self._finished[index] = True
+                if has_next_word:
+                    self._show_chord_preview(index + 1)
+                else:
+                    self.listener.set_chord_preview(None)
+            if advance_to_next_word:
+                overflown_content = new_contents[len(text_to_type):]
+                if len(overflown_content) > 0 and not has_next_word:
+                    self._incorrectly_typed[index] = True
+                else:
+                    self._end_word(index)
+                    if not has_next_word:
+                        self._set_contents(text_to_type)
+                        self._on_finish_exercise()
+                    else:
+                        self._begin_word(index + 1, overflown_content)
+                    return
+
+        # update the width of the entry to reflect the width of the entered text.
+        self._text_entry.configure(width=max(len(text_to_type), len(new_contents)))
+
+    def _on_finish_exercise(self):
+        """ Called when the final word in the exercise is finished. Calculates the typing time for each word and
+        reports to the main application class that the exercise is finished. """
+        word_results = []
+        last_time = self.exercise_begin_time
+        for stroke, incorrectly_typed, finish_time in zip(self.strokes, self._incorrectly_typed, self._finish_times):
+            word_results.append(ExerciseWordResult(stroke, not incorrectly_typed, finish_time - last_time))
+            last_time = finish_time
+        exercise_result = ExerciseResult(self.exercise_begin_date, word_results)
+        self.listener.finish_exercise(exercise_result)
+
+    @property
+    def active_entry(self):
+        """ The entry that text typed by the user currently goes into. """
+        return self._text_entry
+
+    def pause_exercise(self):
+        """ Called to pause the exercise when the settings menu is opened. """
+        pass
+
+    def resume_exercise(self):
+        """ Called to resume the exercise when the settings menu is closed. """
+        self._text_entry.focus()
+        self._text_entry.icursor(len(self._text_entry_var.get()))
+
+    def set_exercise(self, strokes):
+        """
+        Sets a new exercise consisting of the given strokes.
+        """
+        self.strokes = list(strokes)
+        self._incorrectly_typed = [False] * len(self.strokes)
+        self._finished = [False] * len(self.strokes)
+        self._finish_times = [0] * len(self.strokes)
+
+        self.exercise_begin_time = self.clock()
+        self.exercise_begin_date = datetime.now()
+
+        # all words are on the first line of the text, so they can be addressed by their offset on that line.
+        self._word_offsets = [0]
+        for i in range(len(self.strokes)):
+            self._word_offsets.append(self._word_offsets[-1] + len(self._text_to_type(i)))
+        self.words_text.configure(state=tk.NORMAL)
+        self.words_text.delete("1.0", tk.END)
+        self.words_text.insert("1.0", "".join(map(self._text_to_type, range(len(self.strokes)))))
+        self.words_text.configure(state=tk.DISABLED)
+
+        self._begin_word(0, "")
+        self.resume_exercise()
+
+
+def instrument_latencies(latency_recorder):
+    """
+    Registers the parts of the user interface that respond to typing with a latency recorder (see latency.py): handling
+    a change of the text typed, updating the keyboard preview and showing a new exercise.
+
+    :param latency_recorder: the latency recorder.
+    """
+    latency_recorder.instrument(StenoExerciseFrame.WordInExercise, "on_contents_update")
+    latency_recorder.instrument(StenoTextExerciseFrame, "_on_contents_update")
+    latency_recorder.instrument(StenoMachinePreview, "set_chord")
+    latency_recorder.instrument(StenoMachinePreview, "set_chord_sequence")
+    latency_recorder.instrument(StenoExerciseFrame, "set_exercise")
+    latency_recorder.instrument(StenoTextExerciseFrame, "set_exercise")
+
+
 class StenoExerciseSettingsDialog(tk.Toplevel):
     """
     Settings dialog that allows changing the length of exercises, the lessons that appear in an exercise,
-    and clearing the history of past exercises.
+    and clearing the history of past exercises. Recording latencies of the user interface can also be toggled, and
+    the recorded latencies shown or exported.
     """
-    def __init__(self, parent, listener, initial_settings):
+    def __init__(self, parent, listener, initial_settings, latency_recorder=None):
         """
         Opens the dialog.
 
         :param parent: the parent window.
         :param listener: listener that will be notified when the dialog is closed.
         :param initial_settings: the current exercise settings.
+        :param latency_recorder: the latency recorder of the user interface (see latency.py), or None to leave out the
+        controls for recording latencies.
         """
         super(StenoExerciseSettingsDialog, self).__init__(parent)
 
@@ -319,6 +630,33 @@ class StenoExerciseSettingsDialog(tk.Toplevel):
             self.lesson_checkboxes.append((plover_lesson, var))
         checkboxes_wrapping_frame.pack(padx=12, pady=12)
 
+        word_statistics_frame = ttk.Frame(self)
+        ttk.Label(word_statistics_frame, text="Weigh typing times by").grid(column=0, row=0, sticky="W", padx=2)
+        self.word_statistics_var = tk.StringVar(self, value=initial_settings.word_statistics)
+        ttk.Combobox(word_statistics_frame, textvariable=self.word_statistics_var, values=word_statistics_modes,
+                     state="readonly", width=7).grid(column=1, row=0, sticky="E")
+        ttk.Label(word_statistics_frame, text="Recent typing times per word (window)").grid(column=0, row=1,
+                                                                                         sticky="W", padx=2)
+        self.statistics_window_var = tk.StringVar(self, value=str(initial_settings.statistics_window))
+        ttk.Entry(word_statistics_frame, textvariable=self.statistics_window_var, width=7).grid(column=1, row=1,
+                                                                                             sticky="E")
+        ttk.Label(word_statistics_frame, text="Half life of typing times in days (decay)").grid(column=0, row=2,
+                                                                                             sticky="W", padx=2)
+        self.statistics_half_life_var = tk.StringVar(self, value=str(initial_settings.statistics_half_life))
+        ttk.Entry(word_statistics_frame, textvariable=self.statistics_half_life_var, width=7).grid(column=1, row=2,
+                                                                                                sticky="E")
+        word_statistics_frame.pack(padx=12, pady=(0, 12))
+
+        self.latency_recorder = latency_recorder
+        if latency_recorder is not None:
+            latency_frame = ttk.Frame(self)
+            self.record_latencies_var = tk.IntVar(self, 1 if latency_recorder.enabled else 0)
+            ttk.Checkbutton(latency_frame, text="Record input latencies", variable=self.record_latencies_var,
+                            command=self._on_toggle_latencies).pack(side="left")
+            tk.Button(latency_frame, text="Show...", command=self._on_show_latencies).pack(side="left")
+            tk.Button(latency_frame, text="Export...", command=self._on_export_latencies).pack(side="left")
+            latency_frame.pack(padx=12, pady=(0, 12))
+
         self.history_cleared = False
 
         tk.Button(self, text="Clear exercise history", command=self._on_clear_history).pack()
@@ -331,6 +669,37 @@ class StenoExerciseSettingsDialog(tk.Toplevel):
         self.listener.on_settings_dialog_clear_history()
         self.history_cleared = True
 
+    def _on_toggle_latencies(self):
+        """ Called when the checkbox to record latencies is toggled. """
+        if self.record_latencies_var.get():
+            self.latency_recorder.enable()
+        else:
+            self.latency_recorder.disable()
+
+    def _on_show_latencies(self):
+        """ Called when the button to show latencies is pressed, will show a summary of the recorded latencies. """
+        summary_dialog = tk.Toplevel(self)
+        summary_dialog.title("Input latencies")
+        summary_dialog.transient(self)
+        summary_text = tk.Text(summary_dialog, font=('Monospace', 10), wrap=tk.NONE, height=12, width=120)
+        summary_text.insert(tk.END, self.latency_recorder.summary())
+        summary_text.config(state=tk.DISABLED)
+        summary_text.pack(expand=True, fill=tk.BOTH)
+
+        def close():
+            summary_dialog.destroy()
+            self.grab_set()
+        tk.Button(summary_dialog, text="Close", command=close).pack()
+        summary_dialog.protocol("WM_DELETE_WINDOW", close)
+        summary_dialog.grab_set()
+
+    def _on_export_latencies(self):
+        """ Called when the button to export latencies is pressed, will write the recorded latencies to a file. """
+        path = filedialog.asksaveasfilename(parent=self, title="Export input latencies", defaultextension=".json",
+                                            filetypes=[("JSON", "*.json")])
+        if path:
+            self.latency_recorder.export(path)
+
     def _on_ok(self):
         """ Called when the "OK" button is pressed, will report the new settings to the application class. """
         try:
@@ -338,7 +707,18 @@ class StenoExerciseSettingsDialog(tk.Toplevel):
         except ValueError:
             exercise_size = self.initial_settings.exercise_size
         enabled_lessons = [lesson for lesson, var in self.lesson_checkboxes if var.get()] or ["One Syllable Words"]
-        new_settings = ExerciseSettings(exercise_size, enabled_lessons)
+        try:
+            statistics_window = max(1, int(self.statistics_window_var.get()))
+        except ValueError:
+            statistics_window = self.initial_settings.statistics_window
+        try:
+            statistics_half_life = float(self.statistics_half_life_var.get())
+            if not 0 < statistics_half_life < math.inf:
+                raise ValueError()
+        except ValueError:
+            statistics_half_life = self.initial_settings.statistics_half_life
+        new_settings = ExerciseSettings(exercise_size, enabled_lessons, self.word_statistics_var.get(),
+                                        statistics_window, statistics_half_life)
         settings_changed = new_settings != self.initial_settings
         self._close()
         self.listener.on_settings_dialog_close(settings_changed or self.history_cleared, settings_changed, new_settings)
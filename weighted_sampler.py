@@ -0,0 +1,80 @@
+class AliasSampler:
+    """
+    Draws items at random with given weights, in constant time per draw, using the alias method (Vose's variant).
+
+    The weights are split over a table with one slot per item, such that each slot holds the probability of keeping
+    its own item and an alias, i.e. another item to draw instead. A draw then takes a single random number: its integer
+    part selects the slot and its fractional part decides between the item and its alias. Building the table takes
+    linear time, so a sampler pays off when many draws are made with the same weights.
+    """
+    def __init__(self, items, weights):
+        """
+        :param items: the items to draw from. Items occurring more than once are only kept once, with the weight of
+        their first occurrence.
+        :param weights: the (non-negative) weight of every item, in the same order as the items.
+        :raises ValueError: if there are no items, if items and weights differ in length, or if the weights do not
+        add up to a positive number.
+        """
+        items = list(items)
+        weights = list(weights)
+        if len(items) != len(weights):
+            raise ValueError("The amount of weights does not match the amount of items")
+        unique_weights = {}
+        for item, weight in zip(items, weights):
+            unique_weights.setdefault(item, weight)
+        if not unique_weights:
+            raise ValueError("Cannot draw from an empty collection of items")
+        total_weight = sum(unique_weights.values())
+        if not total_weight > 0:
+            raise ValueError("The weights must add up to a positive number")
+
+        self.items = list(unique_weights)
+        n_items = len(self.items)
+        # the weights are scaled so that they average to 1, then slots with a weight below 1 are topped up by an alias
+        # with a weight above 1, until every slot adds up to exactly 1.
+        scaled_weights = [weight * n_items / total_weight for weight in unique_weights.values()]
+        self._probabilities = [1.0] * n_items
+        self._aliases = list(range(n_items))
+        small = [i for i, weight in enumerate(scaled_weights) if weight < 1.0]
+        large = [i for i, weight in enumerate(scaled_weights) if weight >= 1.0]
+        while small and large:
+            less, more = small.pop(), large[-1]
+            self._probabilities[less] = scaled_weights[less]
+            self._aliases[less] = more
+            scaled_weights[more] -= 1.0 - scaled_weights[less]
+            if scaled_weights[more] < 1.0:
+                small.append(large.pop())
+        # slots left over hold a weight of 1 up to rounding errors, and always keep their own item.
+
+    def __len__(self):
+        return len(self.items)
+
+    def draw(self, random):
+        """
+        Draws a single item.
+
+        :param random: the random number generator to use (see random.Random).
+        :return: the drawn item.
+        """
+        position = random.random() * len(self.items)
+        slot = int(position)
+        if position - slot < self._probabilities[slot]:
+            return self.items[slot]
+        return self.items[self._aliases[slot]]
+
+    def sample(self, random, k):
+        """
+        Draws k items, with replacement.
+
+        :param random: the random number generator to use (see random.Random).
+        :param k: the amount of items to draw.
+        :return: a list of the drawn items.
+        """
+        items, probabilities, aliases = self.items, self._probabilities, self._aliases
+        n_items = len(items)
+        sample = []
+        for _ in range(k):
+            position = random.random() * n_items
+            slot = int(position)
+            sample.append(items[slot] if position - slot < probabilities[slot] else items[aliases[slot]])
+        return sample
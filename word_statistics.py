@@ -0,0 +1,358 @@
+from array import array
+from pathlib import Path
+from word_table import WordTable
+import json
+import math
+import os
+
+
+# modes of weighing typing times when choosing words, see ExerciseSettings.word_statistics.
+word_statistics_modes = ["all", "window", "decay"]
+
+_seconds_per_day = 24 * 60 * 60
+
+
+class WordStatistics:
+    """
+    Running statistics of the time it takes the user to type words, kept up to date as exercises are recorded so that
+    the history of exercises does not need to be scanned to compute word weights. For every word, three kinds of
+    statistics are kept, all of constant size per word:
+
+    - the amount of times it was typed correctly and the sum of the reciprocals of its typing times, from which the
+      harmonic mean of all its typing times follows.
+    - a ring buffer of its most recent typing times, together with the sum of their reciprocals.
+    - the amount of its typing times and the sum of their reciprocals, both exponentially decayed with the age of the
+      typing times, together with the time they were last updated. Their quotient is a harmonic mean in which every
+      typing time counts less the older it is.
+
+    Words are identified by their ID in a word table (see word_table.py), and the statistics are kept in parallel arrays
+    indexed by that ID, so that the weights of a whole pool of words are computed in a single pass over the arrays.
+
+    The statistics are saved to a file next to the exercise log, together with the amount of exercises they account
+    for, so a mismatch with the log can be detected on startup.
+    """
+    def __init__(self, window=20, half_life=30.0, typing_time_statistics=None, recent_typing_times=None,
+                 decayed_statistics=None, exercise_count=0, last_timestamp=None, word_table=None):
+        """
+        :param window: amount of recent typing times to keep for every word.
+        :param half_life: time in days until the influence of a typing time on the decayed statistics is halved.
+        :param typing_time_statistics: mapping of words to the amount of times they were typed correctly and the sum
+        of the reciprocals of their typing times.
+        :param recent_typing_times: mapping of words to their most recent typing times, oldest first.
+        :param decayed_statistics: mapping of words to the decayed amount of their typing times, the decayed sum of
+        the reciprocals of their typing times and the time (as a POSIX timestamp) these were last updated.
+        :param exercise_count: amount of exercises accounted for in the statistics.
+        :param last_timestamp: timestamp of the last exercise accounted for in the statistics, as a string.
+        :param word_table: the table assigning IDs to words, which is extended with words that have no ID yet. A new
+        table is created if None.
+        :raises ValueError: if the window is not positive, or the half life is not positive and finite.
+        """
+        if window < 1:
+            raise ValueError(f"Statistics window must be positive, got {window}")
+        if not 0 < half_life < math.inf:
+            raise ValueError(f"Statistics half life must be positive and finite, got {half_life}")
+        self.window = window
+        self.half_life = half_life
+        self.exercise_count = exercise_count
+        self.last_timestamp = last_timestamp
+        self.word_table = WordTable() if word_table is None else word_table
+
+        # statistics of all typing times.
+        self.counts = array("q")
+        self.reciprocal_sums = array("d")
+        # ring buffers of recent typing times, with a slot for each of the last `window` typing times of every word. The
+        # amount of typing times ever added to the buffer of a word determines the slot to overwrite next.
+        self.recent_typing_times = array("d")
+        self.recent_counts = array("q")
+        self.recent_reciprocal_sums = array("d")
+        # decayed statistics.
+        self.decayed_counts = array("d")
+        self.decayed_reciprocal_sums = array("d")
+        self.last_updates = array("d")
+        self._grow()
+
+        for word, (count, reciprocal_sum) in (typing_time_statistics or {}).items():
+            word_id = self._word_id(word)
+            self.counts[word_id] = count
+            self.reciprocal_sums[word_id] = reciprocal_sum
+        for word, typing_times in (recent_typing_times or {}).items():
+            word_id = self._word_id(word)
+            for typing_time in list(typing_times)[-window:]:
+                self._add_to_ring_buffer(word_id, typing_time)
+        for word, (decayed_count, decayed_reciprocal_sum, last_update) in (decayed_statistics or {}).items():
+            word_id = self._word_id(word)
+            self.decayed_counts[word_id] = decayed_count
+            self.decayed_reciprocal_sums[word_id] = decayed_reciprocal_sum
+            self.last_updates[word_id] = last_update
+
+    def _grow(self):
+        """ Extends the arrays of statistics with empty statistics for words that were added to the word table. """
+        n_new_words = len(self.word_table) - len(self.counts)
+        if n_new_words > 0:
+            for statistics in (self.counts, self.recent_counts):
+                statistics.extend(array("q", bytes(8 * n_new_words)))
+            for statistics in (self.reciprocal_sums, self.recent_reciprocal_sums, self.decayed_counts,
+                               self.decayed_reciprocal_sums, self.last_updates):
+                statistics.extend(array("d", bytes(8 * n_new_words)))
+            self.recent_typing_times.extend(array("d", bytes(8 * n_new_words * self.window)))
+
+    def _word_id(self, word):
+        """ Returns the ID of a word, making room for its statistics if it has no ID yet. """
+        word_id = self.word_table.intern(word)
+        if word_id >= len(self.counts):
+            self._grow()
+        return word_id
+
+    @classmethod
+    def from_history(cls, exercise_history, window=20, half_life=30.0, word_table=None):
+        """
+        Computes statistics from scratch out of an exercise log.
+
+        :param exercise_history: the exercise log (see exercise_history.py).
+        :param window: amount of recent typing times to keep for every word.
+        :param half_life: time in days until the influence of a typing time on the decayed statistics is halved.
+        :param word_table: the table assigning IDs to words, or None to create a new one.
+        :return: the statistics.
+        """
+        n_exercises = len(exercise_history)
+        word_statistics = cls(window, half_life, exercise_history.typing_time_statistics(), exercise_count=n_exercises,
+                              last_timestamp=str(exercise_history[-1].timestamp) if n_exercises > 0 else None,
+                              word_table=word_table)
+        for timestamp, word, typing_time in exercise_history.iter_typing_times():
+            word_statistics._add_recent_typing_time(timestamp.timestamp(), word_statistics._word_id(word), typing_time)
+        return word_statistics
+
+    def matches_history(self, exercise_history):
+        """
+        :param exercise_history: the exercise log (see exercise_history.py).
+        :return: whether these statistics account for exactly the exercises in the given log.
+        """
+        n_exercises = len(exercise_history)
+        return n_exercises == self.exercise_count and \
+            (str(exercise_history[-1].timestamp) if n_exercises > 0 else None) == self.last_timestamp
+
+    def matches_settings(self, exercise_settings):
+        """
+        :param exercise_settings: settings for exercises.
+        :return: whether these statistics are kept with the window and half life that the given settings ask for.
+        """
+        if exercise_settings.word_statistics == "window":
+            return exercise_settings.statistics_window == self.window
+        elif exercise_settings.word_statistics == "decay":
+            return exercise_settings.statistics_half_life == self.half_life
+        return True
+
+    def add_exercise(self, exercise_result):
+        """
+        Updates the statistics with a completed exercise. The first word of an exercise is not accounted for, as there
+        is no telling when the user began typing it, and neither are words that were mistyped.
+
+        :param exercise_result: the exercise result to account for.
+        """
+        timestamp = exercise_result.timestamp.timestamp()
+        for word in exercise_result.words[1:]:
+            if word.is_typed_correctly:
+                word_id = self._word_id(word.stroke.written_word)
+                self.counts[word_id] += 1
+                self.reciprocal_sums[word_id] += 1 / word.typing_time
+                self._add_recent_typing_time(timestamp, word_id, word.typing_time)
+        self.exercise_count += 1
+        self.last_timestamp = str(exercise_result.timestamp)
+
+    def _add_recent_typing_time(self, timestamp, word_id, typing_time):
+        """ Updates the ring buffer and the decayed statistics of a word with a typing time. """
+        self._add_to_ring_buffer(word_id, typing_time)
+        if self.decayed_reciprocal_sums[word_id] == 0.0:
+            self.last_updates[word_id] = timestamp
+        last_update = self.last_updates[word_id]
+        self.decayed_counts[word_id] = self._decay(self.decayed_counts[word_id], timestamp - last_update) + 1
+        self.decayed_reciprocal_sums[word_id] = \
+            self._decay(self.decayed_reciprocal_sums[word_id], timestamp - last_update) + 1 / typing_time
+        self.last_updates[word_id] = max(timestamp, last_update)
+
+    def _add_to_ring_buffer(self, word_id, typing_time):
+        """ Adds a typing time to the ring buffer of a word, overwriting the oldest one once the buffer is full. """
+        start = word_id * self.window
+        self.recent_typing_times[start + self.recent_counts[word_id] % self.window] = typing_time
+        self.recent_counts[word_id] += 1
+        if self.recent_counts[word_id] > self.window:
+            # the sum is recomputed rather than updated by subtracting the overwritten typing time, so that rounding
+            # errors do not accumulate.
+            self.recent_reciprocal_sums[word_id] = \
+                sum(1 / typing_time for typing_time in self.recent_typing_times[start:start + self.window])
+        else:
+            self.recent_reciprocal_sums[word_id] += 1 / typing_time
+
+    def _recent_typing_times_of(self, word_id):
+        """ Returns the typing times in the ring buffer of a word, oldest first. """
+        start = word_id * self.window
+        recent_count = self.recent_counts[word_id]
+        if recent_count < self.window:
+            return list(self.recent_typing_times[start:start + recent_count])
+        oldest = start + recent_count % self.window
+        return list(self.recent_typing_times[oldest:start + self.window] + self.recent_typing_times[start:oldest])
+
+    def _decay(self, value, age):
+        """ Decays a value by the given age in seconds. """
+        return value * 0.5 ** (max(age, 0) / (self.half_life * _seconds_per_day))
+
+    def harmonic_mean_weights(self, word_ids, default_weight):
+        """
+        Computes the weight of every word by the harmonic mean of its typing time. The harmonic mean has the property
+        of aggravating the impact of small values and reducing the impact of larger values - so if the user generally
+        types a word quickly, a single data point where the typing went slow wont have much of an impact.
+
+        :param word_ids: IDs of the words to compute the weights of (see word_table).
+        :param default_weight: weight of words that have not been typed yet.
+        :return: an array of the weights of the words, in the same order as their IDs.
+        """
+        self._grow()
+        counts, reciprocal_sums = self.counts, self.reciprocal_sums
+        return array("d", [1/reciprocal_sums[word_id] if counts[word_id] else default_weight for word_id in word_ids])
+
+    def windowed_weights(self, word_ids, default_weight):
+        """
+        Computes the weight of every word like harmonic_mean_weights, but only accounting for its most recent typing
+        times.
+
+        :param word_ids: IDs of the words to compute the weights of (see word_table).
+        :param default_weight: weight of words that have not been typed yet.
+        :return: an array of the weights of the words, in the same order as their IDs.
+        """
+        self._grow()
+        recent_counts, recent_reciprocal_sums = self.recent_counts, self.recent_reciprocal_sums
+        return array("d", [1/recent_reciprocal_sums[word_id] if recent_counts[word_id] else default_weight
+                           for word_id in word_ids])
+
+    def decayed_weights(self, word_ids, default_weight):
+        """
+        Computes the weight of every word by the harmonic mean of its typing times, with the influence of every typing
+        time decaying with its age, so that the weight follows how fast the user types a word lately. As the amount of
+        typing times and the sum of their reciprocals decay alike, the weight does not change as time passes until the
+        word is typed again.
+
+        :param word_ids: IDs of the words to compute the weights of (see word_table).
+        :param default_weight: weight of words that have not been typed yet.
+        :return: an array of the weights of the words, in the same order as their IDs.
+        """
+        self._grow()
+        decayed_counts, decayed_reciprocal_sums = self.decayed_counts, self.decayed_reciprocal_sums
+        return array("d", [decayed_counts[word_id] / decayed_reciprocal_sums[word_id]
+                           if decayed_reciprocal_sums[word_id] else default_weight for word_id in word_ids])
+
+    def weights(self, exercise_settings, word_ids, default_weight=0.5):
+        """
+        Computes the weight of every word in the way the given settings ask for.
+
+        :param exercise_settings: settings for exercises.
+        :param word_ids: IDs of the words to compute the weights of (see word_table).
+        :param default_weight: weight of words that have not been typed yet.
+        :return: an array of the weights of the words, in the same order as their IDs.
+        """
+        if exercise_settings.word_statistics == "window":
+            return self.windowed_weights(word_ids, default_weight)
+        elif exercise_settings.word_statistics == "decay":
+            return self.decayed_weights(word_ids, default_weight)
+        return self.harmonic_mean_weights(word_ids, default_weight)
+
+    def typing_time_counts(self, exercise_settings, word_ids):
+        """
+        :param exercise_settings: settings for exercises.
+        :param word_ids: IDs of words (see word_table).
+        :return: an array of the amount of typing times that the weight of every word is computed from in the way the
+        given settings ask for (see weights), in the same order as their IDs. The amounts are decayed with the age of
+        the typing times if the settings ask for decay.
+        """
+        self._grow()
+        if exercise_settings.word_statistics == "window":
+            recent_counts, window = self.recent_counts, self.window
+            return array("q", [min(recent_counts[word_id], window) for word_id in word_ids])
+        elif exercise_settings.word_statistics == "decay":
+            decayed_counts = self.decayed_counts
+            return array("d", [decayed_counts[word_id] for word_id in word_ids])
+        counts = self.counts
+        return array("q", [counts[word_id] for word_id in word_ids])
+
+    def mean_typing_times(self, exercise_settings, word_ids):
+        """
+        Computes the harmonic mean of the typing times of every word, over the typing times the weight of the word is
+        computed from in the way the given settings ask for (see weights). Unlike weights, which are the reciprocal of
+        the sum of the reciprocals of the typing times unless decayed, the mean is on the same scale for every word
+        however often it was typed.
+
+        :param exercise_settings: settings for exercises.
+        :param word_ids: IDs of words (see word_table), all of which must have been typed.
+        :return: an array of the mean typing times of the words, in the same order as their IDs.
+        """
+        self._grow()
+        if exercise_settings.word_statistics == "window":
+            counts, reciprocal_sums, window = self.recent_counts, self.recent_reciprocal_sums, self.window
+            return array("d", [min(counts[word_id], window) / reciprocal_sums[word_id] for word_id in word_ids])
+        elif exercise_settings.word_statistics == "decay":
+            return self.decayed_weights(word_ids, 0.0)
+        counts, reciprocal_sums = self.counts, self.reciprocal_sums
+        return array("d", [counts[word_id] / reciprocal_sums[word_id] for word_id in word_ids])
+
+    @staticmethod
+    def path_for(user_log_path):
+        """
+        :param user_log_path: path to the exercise log.
+        :return: path of the file the statistics of the given log are saved to.
+        """
+        user_log_path = Path(user_log_path)
+        return user_log_path.with_name(user_log_path.name + ".stats")
+
+    @classmethod
+    def load(cls, path, word_table=None):
+        """
+        Loads statistics from a file.
+
+        :param path: path to the file.
+        :param word_table: the table assigning IDs to words, or None to create a new one.
+        :return: the statistics, or None if the file is missing or corrupt.
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                contents = json.load(f)
+            return cls(int(contents["window"]), float(contents["half_life"]),
+                       {word: (int(count), float(reciprocal_sum))
+                        for word, (count, reciprocal_sum) in contents["words"].items()},
+                       {word: [float(typing_time) for typing_time in typing_times]
+                        for word, typing_times in contents["recent_words"].items()},
+                       {word: (float(decayed_count), float(decayed_reciprocal_sum), float(last_update))
+                        for word, (decayed_count, decayed_reciprocal_sum, last_update)
+                        in contents["decayed_words"].items()},
+                       int(contents["exercise_count"]), contents["last_timestamp"], word_table)
+        except (IOError, json.JSONDecodeError, KeyError, TypeError, ValueError, AttributeError, ZeroDivisionError):
+            return None
+
+    def save(self, path, writer=None):
+        """
+        Saves the statistics to a file. The file is replaced atomically, so that it is never left partially written.
+
+        :param path: path to the file.
+        :param writer: background writer (see background_writer.py) to hand the file to, or None to write it right away.
+        """
+        words = self.word_table.words
+        contents = json.dumps({
+            "exercise_count": self.exercise_count,
+            "last_timestamp": self.last_timestamp,
+            "window": self.window,
+            "half_life": self.half_life,
+            "words": {words[word_id]: (count, self.reciprocal_sums[word_id])
+                      for word_id, count in enumerate(self.counts) if count},
+            "recent_words": {words[word_id]: self._recent_typing_times_of(word_id)
+                             for word_id, recent_count in enumerate(self.recent_counts) if recent_count},
+            "decayed_words": {words[word_id]: (self.decayed_counts[word_id], decayed_reciprocal_sum,
+                                               self.last_updates[word_id])
+                              for word_id, decayed_reciprocal_sum in enumerate(self.decayed_reciprocal_sums)
+                              if decayed_reciprocal_sum}})
+        if writer is not None:
+            writer.replace(path, contents)
+            return
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(path.name + ".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(contents)
+        os.replace(temp_path, path)
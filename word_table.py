@@ -0,0 +1,41 @@
+from array import array
+
+
+class WordTable:
+    """
+    Assigns dense integer IDs to words, in the order they are first seen, so that per-word data can be kept in arrays
+    indexed by ID rather than in dictionaries keyed by word. IDs are never reassigned, so the table only grows.
+    """
+    def __init__(self, words=()):
+        """
+        :param words: words to assign IDs to right away.
+        """
+        # list of words by ID, and mapping of words to their ID.
+        self.words = []
+        self.ids = {}
+        for word in words:
+            self.intern(word)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.ids
+
+    def intern(self, word):
+        """
+        :param word: a word.
+        :return: the ID of the word, which is assigned if the word has none yet.
+        """
+        word_id = self.ids.get(word)
+        if word_id is None:
+            word_id = self.ids[word] = len(self.words)
+            self.words.append(word)
+        return word_id
+
+    def intern_all(self, words):
+        """
+        :param words: a collection of words.
+        :return: an array of the IDs of the words, in the same order, assigning IDs to words that have none yet.
+        """
+        return array("l", map(self.intern, words))